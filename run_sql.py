@@ -1,42 +1,207 @@
-# src/sql/run_sql.py
-import os
+# run_sql.py
+import io
+import time
+import hashlib
+import argparse
 from pathlib import Path
-from dotenv import load_dotenv
-import psycopg2
+from src.utils.supa_client import get_conn
+from src.utils.server_kpis import refresh_kpi_views
 
-load_dotenv()
-DB_URL = os.getenv("SUPABASE_DB_URL")
-if not DB_URL:
-    raise SystemExit("Falta SUPABASE_DB_URL en .env")
-
-SQL_DIR = Path(__file__).resolve().parent  # src/sql
+SQL_DIR = Path(__file__).resolve().parent / "src" / "sql"
 FILES = [
     SQL_DIR / "00_schema.sql",
     SQL_DIR / "01_seed_core.sql",
     SQL_DIR / "02_seed_demo.sql",  # opcional, si existe
 ]
+COPY_BATCH_ROWS = 250_000
+
+
+def split_statements(sql: str):
+    """
+    Separa un script en sentencias por ';' respetando comillas simples, identificadores
+    entre comillas dobles, cuerpos $tag$...$tag$ y comentarios (-- y /* */).
+    """
+    statements, buf = [], []
+    has_code = False  # un tramo hecho solo de comentarios no es una sentencia
+    i, n = 0, len(sql)
+    while i < n:
+        c = sql[i]
+        if c == "-" and sql.startswith("--", i):
+            end = sql.find("\n", i)
+            end = n if end == -1 else end
+            buf.append(sql[i:end])
+            i = end
+        elif c == "/" and sql.startswith("/*", i):
+            end = sql.find("*/", i + 2)
+            end = n if end == -1 else end + 2
+            buf.append(sql[i:end])
+            i = end
+        elif c in ("'", '"'):
+            # '' / "" dentro del literal es una comilla escapada
+            j = i + 1
+            while j < n:
+                if sql[j] == c:
+                    if j + 1 < n and sql[j + 1] == c:
+                        j += 2
+                        continue
+                    break
+                j += 1
+            buf.append(sql[i:j + 1])
+            has_code = True
+            i = j + 1
+        elif c == "$":
+            end_tag = sql.find("$", i + 1)
+            tag = sql[i:end_tag + 1] if end_tag != -1 else ""
+            if tag and (tag == "$$" or tag[1:-1].replace("_", "a").isalnum()) \
+                    and not tag[1].isdigit():
+                end = sql.find(tag, end_tag + 1)
+                end = n if end == -1 else end + len(tag)
+                buf.append(sql[i:end])
+                i = end
+            else:
+                buf.append(c)
+                i += 1
+            has_code = True
+        elif c == ";":
+            if has_code:
+                statements.append("".join(buf).strip())
+            buf, has_code = [], False
+            i += 1
+        else:
+            buf.append(c)
+            has_code = has_code or not c.isspace()
+            i += 1
+    if has_code:
+        statements.append("".join(buf).strip())
+    return statements
+
+
+def ensure_migrations_table(cur):
+    cur.execute("""
+        create table if not exists public.schema_migrations (
+          filename    text primary key,
+          checksum    text not null,
+          applied_at  timestamptz not null default now(),
+          duration_ms integer
+        )
+    """)
 
 
-def run_sql_file(cur, path: Path):
+def applied_checksums(cur) -> dict:
+    cur.execute("select filename, checksum from public.schema_migrations")
+    return dict(cur.fetchall())
+
+
+def run_sql_file(conn, path: Path, applied: dict, force: bool = False) -> bool:
+    """
+    Aplica un archivo SQL completo en una única transacción y lo registra con su
+    checksum. Si ya se aplicó con el mismo checksum (y no hay --force) se omite.
+    """
     sql = path.read_text(encoding="utf-8")
-    # separa por ';' de forma simple (scripts nuestros)
-    statements = [s.strip() for s in sql.split(';') if s.strip()]
-    for stmt in statements:
-        cur.execute(stmt + ';')
+    checksum = hashlib.sha256(sql.encode("utf-8")).hexdigest()
+    if not force and applied.get(path.name) == checksum:
+        print(f"[SKIP] {path.name} (sin cambios)")
+        return False
+
+    print(f"[APPLY] {path.name}")
+    t0 = time.perf_counter()
+    try:
+        with conn.cursor() as cur:
+            for stmt in split_statements(sql):
+                cur.execute(stmt)
+            cur.execute("""
+                insert into public.schema_migrations (filename, checksum, applied_at, duration_ms)
+                values (%s, %s, now(), %s)
+                on conflict (filename) do update
+                  set checksum = excluded.checksum,
+                      applied_at = excluded.applied_at,
+                      duration_ms = excluded.duration_ms
+            """, (path.name, checksum, int((time.perf_counter() - t0) * 1000)))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return True
+
+
+def _copy_csv_stream(cur, table: str, columns, stream):
+    cur.copy_expert(
+        f"copy {table} ({', '.join(columns)}) from stdin with (format csv, header true)",
+        stream,
+    )
+
+
+def load_seed_file(conn, table: str, path: Path, batch_rows: int = COPY_BATCH_ROWS) -> int:
+    """
+    Carga un dataset (CSV o Parquet) en `table` con COPY FROM STDIN, todo en una
+    transacción. Los Parquet se envían por lotes de `batch_rows` filas.
+    """
+    rows = 0
+    try:
+        with conn.cursor() as cur:
+            if path.suffix.lower() == ".parquet":
+                import pyarrow.parquet as pq
+                import pyarrow.csv as pacsv
+                pf = pq.ParquetFile(path)
+                columns = pf.schema_arrow.names
+                for batch in pf.iter_batches(batch_size=batch_rows):
+                    buf = io.BytesIO()
+                    pacsv.write_csv(batch, buf)
+                    buf.seek(0)
+                    _copy_csv_stream(cur, table, columns, buf)
+                    rows += batch.num_rows
+            else:
+                with open(path, "r", encoding="utf-8") as f:
+                    columns = [c.strip().strip('"') for c in f.readline().split(",")]
+                    f.seek(0)
+                    _copy_csv_stream(cur, table, columns, f)
+                    rows = cur.rowcount
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return rows
 
 
 def main():
-    with psycopg2.connect(DB_URL) as conn:
-        conn.autocommit = True
+    parser = argparse.ArgumentParser(description="Aplica DDL/seeds y carga datasets masivos.")
+    parser.add_argument("--force", action="store_true",
+                        help="Reaplica los archivos aunque su checksum no haya cambiado.")
+    parser.add_argument("--load", action="append", default=[], metavar="TABLA=ARCHIVO",
+                        help="Carga un CSV/Parquet con COPY (p. ej. adset_simulation=out/sim.parquet).")
+    args = parser.parse_args()
+
+    # Conexión del pool compartido (SUPABASE_DB_URL en .env)
+    with get_conn() as conn:
         with conn.cursor() as cur:
-            for f in FILES:
-                if not f.exists():
-                    print(f"[WARN] No existe {f}, se omite.")
-                    continue
-                print(f"[APPLY] {f.name}")
-                run_sql_file(cur, f)
+            ensure_migrations_table(cur)
+            applied = applied_checksums(cur)
+        conn.commit()
+
+        changed = False
+        for f in FILES:
+            if not f.exists():
+                print(f"[WARN] No existe {f}, se omite.")
+                continue
+            changed |= run_sql_file(conn, f, applied, force=args.force)
         print("✅ SQL aplicado (DDL + seeds).")
 
+        for spec in args.load:
+            table, _, file_path = spec.partition("=")
+            path = Path(file_path)
+            t0 = time.perf_counter()
+            rows = load_seed_file(conn, f"public.{table}", path)
+            elapsed = time.perf_counter() - t0
+            print(f"[COPY] {path.name} -> public.{table}: {rows:,} filas en {elapsed:.2f}s")
+            changed = True
+
+        # Seeds y cargas cambian las tablas de origen de mv_kpi_*: se refrescan aquí
+        # para que 20_build_kpis --server-kpis no lea KPIs viejos
+        if changed:
+            t0 = time.perf_counter()
+            refresh_kpi_views(conn)
+            print(f"[REFRESH] mv_kpi_* en {time.perf_counter() - t0:.2f}s")
+
 
 if __name__ == "__main__":
     main()
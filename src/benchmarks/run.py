@@ -0,0 +1,297 @@
+# src/benchmarks/run.py
+# Suite de benchmarks del pipeline sobre datos sintéticos (10k / 1M / 10M filas).
+#
+# Etapas: extract (capa cruda por páginas, o COPY desde Postgres con --source postgres),
+# snapshots (apply_snapshot), build_marts (build_marts_from_snapshots), ads_plan
+# (KPIs por anuncio + top 5 + plan de presupuesto de step11) y exports (Parquet + CSV).
+#
+# Por etapa: throughput (filas/s sobre la mediana), latencias p50/p95 y pico de RSS.
+# Los resultados se comparan contra un baseline JSON y se marcan las regresiones.
+#
+# Uso:
+#   python -m src.benchmarks.run --scale 10k --scale 1m --save-baseline
+#   python -m src.benchmarks.run --scale 10k --fail-on-regression
+import os
+import gc
+import json
+import time
+import shutil
+import platform
+import argparse
+import importlib
+from datetime import datetime
+
+import duckdb
+import numpy as np
+import pyarrow.parquet as pq
+
+from .synthetic import generate, parse_scale
+from ..utils.perf import reset_peak_rss, peak_rss_mb
+from ..utils.incremental import apply_snapshot
+from ..utils.raw_store import RawStoreWriter, write_manifest, read_table, raw_path
+from ..utils.kpi_engine import ad_kpis, top_n
+from ..utils.budget_optimizer import build_budget_plan
+from ..utils.exports import export_all, export_specs
+from ..utils.schema_registry import to_pandas
+from ..utils.warehouse import connect_warehouse, versions_dir
+
+# El módulo del paso 30 empieza por un dígito: se importa por nombre
+build_marts_from_snapshots = importlib.import_module(
+    "src.pipeline.30_build_mart").build_marts_from_snapshots
+
+BENCH_DIR = os.path.join("out", "benchmarks")
+BASELINE_PATH = os.path.join(BENCH_DIR, "baseline.json")
+TABLES = ["campaigns", "products", "adset_simulation", "ad_simulation", "sales"]
+AD_COLUMNS = ["ad_id", "run_ts", "campaign_id", "adset_name", "budget", "cpc", "aov",
+              "clicks", "conversions", "category_id", "sku", "impresions"]
+# Por debajo de este ruido (segundos / MB) una diferencia no se considera regresión
+NOISE_FLOOR_S = 0.05
+NOISE_FLOOR_MB = 50
+
+
+def measure(fn, repeat: int) -> dict:
+    """Ejecuta fn() `repeat` veces; fn devuelve las filas procesadas."""
+    latencies, peaks, rows = [], [], 0
+    for _ in range(repeat):
+        gc.collect()
+        reset_peak_rss()
+        rss_before = peak_rss_mb()
+        t0 = time.perf_counter()
+        rows = fn()
+        latencies.append(time.perf_counter() - t0)
+        peaks.append(peak_rss_mb() - rss_before)
+    p50 = float(np.percentile(latencies, 50))
+    return {
+        "rows": int(rows),
+        "runs": repeat,
+        "p50_s": round(p50, 4),
+        "p95_s": round(float(np.percentile(latencies, 95)), 4),
+        "min_s": round(min(latencies), 4),
+        "rows_per_s": round(rows / p50, 1) if p50 > 0 else None,
+        "peak_rss_mb": round(max(peaks), 1),
+    }
+
+
+def extract_from_files(source_dir: str, raw_dir: str, page_size: int) -> int:
+    """
+    Sustituto local de la API: cada tabla se entrega en páginas de `page_size` filas
+    al mismo sumidero que usa el paso 10 (RawStoreWriter) y se compacta igual.
+    """
+    writer = RawStoreWriter(raw_dir)
+    for table in TABLES:
+        pf = pq.ParquetFile(os.path.join(source_dir, f"{table}.parquet"))
+        for page_no, batch in enumerate(pf.iter_batches(batch_size=page_size)):
+            writer(table, page_no, batch.to_pandas())
+    paths = writer.finalize(TABLES)
+    write_manifest({t: {"mode": "full", "rows": writer.rows.get(t, 0), "path": paths[t]}
+                    for t in TABLES}, raw_dir)
+    return sum(writer.rows.values())
+
+
+def load_postgres_source(source_dir: str, schema: str = "bench"):
+    """Carga los datos sintéticos en un esquema aparte de Postgres (sin tocar public)."""
+    from run_sql import load_seed_file
+    from ..utils.supa_client import get_conn
+    from pathlib import Path
+
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"drop schema if exists {schema} cascade")
+            cur.execute(f"create schema {schema}")
+            for table in TABLES:
+                # Sin FKs ni índices: se mide la extracción, no la carga
+                cur.execute(f"create table {schema}.{table} (like public.{table} including defaults)")
+        conn.commit()
+        for table in TABLES:
+            load_seed_file(conn, f"{schema}.{table}", Path(source_dir, f"{table}.parquet"))
+
+
+def drop_postgres_source(schema: str = "bench"):
+    from ..utils.supa_client import get_conn
+    with get_conn() as conn, conn.cursor() as cur:
+        cur.execute(f"drop schema if exists {schema} cascade")
+
+
+def extract_from_postgres(raw_dir: str, schema: str = "bench") -> int:
+    from ..utils.pg_transport import export_to_parquet
+    os.makedirs(raw_dir, exist_ok=True)
+    rows = {t: export_to_parquet(t, raw_path(t, raw_dir), schema=schema) for t in TABLES}
+    write_manifest({t: {"mode": "full", "rows": n, "path": raw_path(t, raw_dir)}
+                    for t, n in rows.items()}, raw_dir)
+    return sum(rows.values())
+
+
+def build_snapshots(raw_dir: str, warehouse_path: str) -> int:
+    con = connect_warehouse(warehouse_path)
+    rows = 0
+    for table in TABLES:
+        data = read_table(table, raw_dir=raw_dir)
+        apply_snapshot(con, table, data, mode="full")
+        rows += data.num_rows
+    con.close()
+    return rows
+
+
+def ads_plan(ads) -> int:
+    """Lo mismo que step11: KPIs por anuncio, top 5 y plan de presupuesto."""
+    kpis = ad_kpis(ads.copy())
+    top_n(kpis, 5, "margin")
+    build_budget_plan(kpis, float(kpis["budget"].sum()))
+    return len(kpis)
+
+
+def export_outputs(tables: dict, export_dir: str) -> int:
+    """Exports de step11: Parquet y CSV redondeado a 2 decimales (siempre se reescriben)."""
+    con = duckdb.connect()
+    export_all(con, [spec for name, df in tables.items()
+                     for spec in export_specs(df, os.path.join(export_dir, name), round_digits=2)],
+               force=True, manifest_path=os.path.join(export_dir, ".exports_manifest.json"))
+    con.close()
+    return sum(len(df) for df in tables.values())
+
+
+def run_scale(scale: str, repeat: int, source: str, page_size: int, seed: int) -> dict:
+    n_rows = parse_scale(scale)
+    work_dir = os.path.join(BENCH_DIR, scale)
+    source_dir = os.path.join(work_dir, "source")
+    raw_dir = os.path.join(work_dir, "raw")
+    warehouse_path = os.path.join(work_dir, "warehouse.duckdb")
+
+    print(f"\n--- Escala {scale} ({n_rows:,} filas por tabla de hechos) ---")
+    t0 = time.perf_counter()
+    sizes = generate(n_rows, source_dir, seed=seed)
+    print(f"✅ Datos sintéticos generados en {time.perf_counter() - t0:.1f}s: {sizes}")
+
+    stages = {}
+    if source == "postgres":
+        load_postgres_source(source_dir)
+        try:
+            stages["extract"] = measure(lambda: extract_from_postgres(raw_dir), repeat)
+        finally:
+            drop_postgres_source()
+    else:
+        stages["extract"] = measure(
+            lambda: extract_from_files(source_dir, raw_dir, page_size), repeat)
+    print(f"✅ extract: {stages['extract']}")
+
+    if os.path.exists(warehouse_path):
+        os.remove(warehouse_path)
+    shutil.rmtree(versions_dir(warehouse_path), ignore_errors=True)
+    stages["snapshots"] = measure(lambda: build_snapshots(raw_dir, warehouse_path), repeat)
+    print(f"✅ snapshots: {stages['snapshots']}")
+
+    def _marts():
+        build_marts_from_snapshots(warehouse_path)
+        return sizes["adset_simulation"]
+    stages["build_marts"] = measure(_marts, repeat)
+    print(f"✅ build_marts: {stages['build_marts']}")
+
+    ads = to_pandas("ad_simulation", duckdb.sql(
+        f"SELECT {', '.join(AD_COLUMNS)} FROM read_parquet('{raw_path('ad_simulation', raw_dir)}')"
+    ).fetch_arrow_table())
+    stages["ads_plan"] = measure(lambda: ads_plan(ads), repeat)
+    print(f"✅ ads_plan: {stages['ads_plan']}")
+    kpis = ad_kpis(ads.copy())
+    outputs = {"snap_ads_kpis": kpis,
+               "snap_budget_plan": build_budget_plan(kpis, float(kpis["budget"].sum()))}
+    stages["exports"] = measure(
+        lambda: export_outputs(outputs, os.path.join(work_dir, "exports")), repeat)
+    print(f"✅ exports: {stages['exports']}")
+    return {"rows": n_rows, "source": source, "stages": stages}
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Lista de (escala, etapa, métrica, actual, baseline) que empeoran más de `tolerance`."""
+    regressions = []
+    for scale, current in results["scales"].items():
+        base_scale = baseline.get("scales", {}).get(scale)
+        if not base_scale:
+            continue
+        for name, stats in current["stages"].items():
+            base = base_scale["stages"].get(name)
+            # La extracción solo es comparable con un baseline del mismo origen
+            if not base or (name == "extract" and base_scale.get("source") != current["source"]):
+                continue
+            if stats["p50_s"] > base["p50_s"] * (1 + tolerance) \
+                    and stats["p50_s"] - base["p50_s"] > NOISE_FLOOR_S:
+                regressions.append((scale, name, "p50_s", stats["p50_s"], base["p50_s"]))
+            if stats["peak_rss_mb"] > base["peak_rss_mb"] * (1 + tolerance) \
+                    and stats["peak_rss_mb"] - base["peak_rss_mb"] > NOISE_FLOOR_MB:
+                regressions.append((scale, name, "peak_rss_mb",
+                                    stats["peak_rss_mb"], base["peak_rss_mb"]))
+    return regressions
+
+
+def print_report(results: dict, baseline: dict):
+    print("\n--- 📊 Resultados ---")
+    header = f"{'escala':>6} {'etapa':<12} {'filas':>12} {'p50 s':>9} {'p95 s':>9} {'filas/s':>14} {'RSS MB':>8} {'vs base':>8}"
+    print(header)
+    for scale, current in results["scales"].items():
+        base_stages = baseline.get("scales", {}).get(scale, {}).get("stages", {})
+        for name, s in current["stages"].items():
+            base = base_stages.get(name)
+            ratio = f"{s['p50_s'] / base['p50_s']:.2f}x" if base and base["p50_s"] else "-"
+            print(f"{scale:>6} {name:<12} {s['rows']:>12,} {s['p50_s']:>9.3f} {s['p95_s']:>9.3f} "
+                  f"{s['rows_per_s'] or 0:>14,.0f} {s['peak_rss_mb']:>8.1f} {ratio:>8}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks del pipeline sobre datos sintéticos.")
+    parser.add_argument("--scale", action="append", default=[],
+                        help="10k, 1m, 10m o un número de filas (repetible). Por defecto 10k.")
+    parser.add_argument("--repeat", type=int, default=3, help="Repeticiones por etapa.")
+    parser.add_argument("--source", choices=["file", "postgres"], default="file",
+                        help="Origen de la extracción: páginas desde Parquet o COPY desde Postgres.")
+    parser.add_argument("--page-size", type=int, default=10_000,
+                        help="Filas por página en la extracción desde archivos.")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="Guarda estos resultados como nuevo baseline.")
+    parser.add_argument("--tolerance", type=float, default=0.20,
+                        help="Empeoramiento relativo tolerado antes de marcar regresión.")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    parser.add_argument("--keep-data", action="store_true",
+                        help="No borra los datos sintéticos al terminar.")
+    args = parser.parse_args()
+
+    results = {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "host": {"platform": platform.platform(), "python": platform.python_version(),
+                 "cpus": os.cpu_count(), "duckdb": duckdb.__version__},
+        "scales": {},
+    }
+    for scale in args.scale or ["10k"]:
+        results["scales"][scale] = run_scale(scale, args.repeat, args.source,
+                                             args.page_size, args.seed)
+        if not args.keep_data:
+            shutil.rmtree(os.path.join(BENCH_DIR, scale), ignore_errors=True)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_report(results, baseline)
+
+    os.makedirs(BENCH_DIR, exist_ok=True)
+    results_path = os.path.join(BENCH_DIR, f"results-{datetime.now():%Y%m%dT%H%M%S}.json")
+    with open(results_path, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\n💾 Resultados en {results_path}")
+
+    regressions = compare(results, baseline, args.tolerance)
+    for scale, name, metric, current, base in regressions:
+        print(f"⚠️ Regresión en {scale}/{name}: {metric} {current} vs baseline {base}")
+    if baseline and not regressions:
+        print("✅ Sin regresiones respecto al baseline.")
+
+    if args.save_baseline:
+        # Se fusiona con el baseline existente para no perder otras escalas
+        merged = {**baseline, **{k: v for k, v in results.items() if k != "scales"}}
+        merged["scales"] = {**baseline.get("scales", {}), **results["scales"]}
+        with open(args.baseline, "w") as f:
+            json.dump(merged, f, indent=2)
+        print(f"💾 Baseline actualizado: {args.baseline}")
+
+    if regressions and args.fail_on_regression:
+        exit(1)
@@ -0,0 +1,165 @@
+# src/benchmarks/synthetic.py
+# Generador de datos sintéticos con el esquema de 00_schema.sql (campaigns, products,
+# adset_simulation, ad_simulation, sales) a cualquier escala. Todo vectorizado con
+# NumPy y escrito a Parquet por bloques, así 10M de filas no necesitan 10M en memoria.
+import os
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+SCALES = {"10k": 10_000, "1m": 1_000_000, "10m": 10_000_000}
+CHUNK_ROWS = 1_000_000
+ADSETS_PER_CAMPAIGN = 5
+BASE_TS = datetime(2025, 1, 1, tzinfo=timezone.utc)
+BASE_NP = np.datetime64("2025-01-01T00:00:00", "us")
+
+
+def parse_scale(spec: str) -> int:
+    """'10k' / '1m' / '10m' o un número de filas."""
+    return SCALES.get(spec.lower()) or int(float(spec))
+
+
+def dimension_sizes(n_rows: int) -> dict:
+    """Cuántas campañas y productos corresponden a una escala (crecen sublinealmente)."""
+    return {
+        "campaigns": max(3, n_rows // 100_000),
+        "products": max(25, int(np.sqrt(n_rows))),
+    }
+
+
+def _campaigns(n: int) -> pa.Table:
+    return pa.table({
+        "campaign_id": np.arange(1, n + 1, dtype="int64"),
+        "campaign_name": [f"Campaña {i:04d}" for i in range(1, n + 1)],
+        "budget": np.full(n, 300.0),
+        "created_at": pa.array([BASE_TS] * n, pa.timestamp("us", tz="UTC")),
+    })
+
+
+def _products(rng, n: int) -> pa.Table:
+    sale_price = np.round(rng.uniform(20, 300, n), 2)
+    return pa.table({
+        "product_id": np.arange(1, n + 1, dtype="int64"),
+        "sku": [f"SKU{i:06d}" for i in range(1, n + 1)],
+        "product_name": [f"Producto {i:06d}" for i in range(1, n + 1)],
+        "sale_price": sale_price,
+        "unit_cost": np.round(sale_price * rng.uniform(0.4, 0.8, n), 2),
+        "created_at": pa.array([BASE_TS] * n, pa.timestamp("us", tz="UTC")),
+    })
+
+
+def _funnel(rng, n: int, aov_base):
+    """budget -> clicks -> conversiones -> revenue con ruido realista."""
+    budget = np.round(rng.lognormal(3.0, 0.6, n), 2)
+    cpc = np.round(rng.lognormal(-0.5, 0.3, n), 4)
+    cvr = rng.beta(2, 40, n)
+    aov = np.round(aov_base * rng.lognormal(0, 0.1, n), 2)
+    clicks = np.floor(budget / cpc)
+    conversions = rng.binomial(clicks.astype("int64"), cvr).astype("float64")
+    revenue = np.round(conversions * aov, 2)
+    return budget, cpc, cvr, aov, clicks, conversions, revenue
+
+
+def _adset_simulation(rng, start: int, n: int, dims: dict, products: pa.Table) -> pa.Table:
+    """
+    Filas [start, start+n) de adset_simulation. Cada corrida (run_ts) cubre como mucho
+    10k combinaciones distintas campaña × adset × producto.
+    """
+    combos = dims["campaigns"] * ADSETS_PER_CAMPAIGN * dims["products"]
+    per_run = min(10_000, combos)
+    idx = np.arange(start, start + n, dtype="int64")
+    run_no, combo = idx // per_run, idx % per_run
+    campaign_id = combo // (ADSETS_PER_CAMPAIGN * dims["products"]) + 1
+    adset_no = (combo // dims["products"]) % ADSETS_PER_CAMPAIGN
+    product_idx = combo % dims["products"]
+
+    price = products.column("sale_price").to_numpy()[product_idx]
+    cost = products.column("unit_cost").to_numpy()[product_idx]
+    budget, cpc, cvr, aov, clicks, conversions, revenue = _funnel(rng, n, price)
+    run_ts = np.array([(BASE_TS + timedelta(hours=int(r))).strftime("%Y-%m-%dT%H:%M:%S")
+                       for r in range(run_no[0], run_no[-1] + 1)])[run_no - run_no[0]]
+    return pa.table({
+        "run_ts": run_ts,
+        "campaign_id": campaign_id,
+        "adset_name": pa.array(np.char.add("adset_", adset_no.astype(str))),
+        "product_id": product_idx + 1,
+        "sku": pa.array(np.char.add("SKU", np.char.zfill((product_idx + 1).astype(str), 6))),
+        "budget": budget,
+        "cpc": cpc,
+        "cvr": np.round(cvr, 4),
+        "aov": aov,
+        "clicks": clicks,
+        "conversions": conversions,
+        "revenue": revenue,
+        "margin": np.round(revenue - conversions * cost - budget, 2),
+        "created_at": pa.array(BASE_NP + run_no.astype("timedelta64[h]"),
+                               pa.timestamp("us", tz="UTC")),
+    })
+
+
+def _ad_simulation(rng, start: int, n: int, dims: dict) -> pa.Table:
+    """Filas [start, start+n) de ad_simulation: una única corrida con un anuncio por fila."""
+    ad_id = np.arange(start + 1, start + n + 1, dtype="int64")
+    product_idx = rng.integers(0, dims["products"], n)
+    budget, cpc, _, aov, clicks, conversions, _ = _funnel(rng, n, rng.uniform(20, 300, n))
+    return pa.table({
+        "run_ts": np.full(n, BASE_TS.strftime("%Y-%m-%dT%H:%M:%S")),
+        "ad_id": ad_id,
+        "campaign_id": rng.integers(1, dims["campaigns"] + 1, n),
+        "adset_name": pa.array(np.char.add("adset_", rng.integers(0, ADSETS_PER_CAMPAIGN, n).astype(str))),
+        "category_id": rng.integers(1, 9, n),
+        "sku": pa.array(np.char.add("SKU", np.char.zfill((product_idx + 1).astype(str), 6))),
+        "budget": budget,
+        "cpc": cpc,
+        "aov": aov,
+        "clicks": clicks,
+        "conversions": conversions,
+        "impresions": np.floor(clicks / rng.uniform(0.01, 0.10, n)),
+        "created_at": pa.array(np.full(n, BASE_NP), pa.timestamp("us", tz="UTC")),
+    })
+
+
+def _sales(rng, start: int, n: int, dims: dict, products: pa.Table) -> pa.Table:
+    product_idx = rng.integers(0, dims["products"], n)
+    price = products.column("sale_price").to_numpy()[product_idx]
+    seconds = rng.integers(0, 365 * 24 * 3600, n)
+    return pa.table({
+        "sale_id": np.arange(start + 1, start + n + 1, dtype="int64"),
+        "product_id": product_idx + 1,
+        "qty": rng.integers(1, 6, n).astype("int32"),
+        "unit_price": np.round(price * rng.uniform(0.9, 1.0, n), 2),
+        "created_at": pa.array(BASE_NP + seconds.astype("timedelta64[s]"),
+                               pa.timestamp("us", tz="UTC")),
+    })
+
+
+def generate(n_rows: int, out_dir: str, seed: int = 42, chunk_rows: int = CHUNK_ROWS) -> dict:
+    """
+    Escribe out_dir/<tabla>.parquet para las cinco tablas. adset_simulation,
+    ad_simulation y sales tienen n_rows filas cada una; las dimensiones escalan con
+    dimension_sizes(). Devuelve {tabla: filas}.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    dims = dimension_sizes(n_rows)
+    products = _products(rng, dims["products"])
+    pq.write_table(_campaigns(dims["campaigns"]), os.path.join(out_dir, "campaigns.parquet"))
+    pq.write_table(products, os.path.join(out_dir, "products.parquet"))
+
+    facts = {
+        "adset_simulation": lambda s, n: _adset_simulation(rng, s, n, dims, products),
+        "ad_simulation": lambda s, n: _ad_simulation(rng, s, n, dims),
+        "sales": lambda s, n: _sales(rng, s, n, dims, products),
+    }
+    for name, make in facts.items():
+        writer = None
+        for start in range(0, n_rows, chunk_rows):
+            batch = make(start, min(chunk_rows, n_rows - start))
+            if writer is None:
+                writer = pq.ParquetWriter(os.path.join(out_dir, f"{name}.parquet"), batch.schema)
+            writer.write_table(batch)
+        writer.close()
+    return {"campaigns": dims["campaigns"], "products": dims["products"],
+            **{name: n_rows for name in facts}}
@@ -1,65 +1,91 @@
 # src/pipeline/10_extract_supabase.py
 
 import os
-import pickle
-import pandas as pd
-# Importamos el cliente usando una importación relativa
-from ..utils.supa_client import supabase
-
-# --- ESTA ES LA FUNCIÓN QUE FALTABA ---
-
-
-def fetch_table_as_df(table_name: str, limit: int = None):
-    """
-    Función genérica para leer una tabla completa de Supabase y convertirla a DataFrame.
-    """
-    if supabase is None:
-        print(
-            f"🔥 No hay conexión a Supabase. Abortando la carga de '{table_name}'.")
-        return None
-
-    try:
-        print(f"🚀 Realizando consulta a la tabla '{table_name}'...")
-        query = supabase.from_(table_name).select("*")
-
-        if limit:
-            query = query.limit(limit)
-
-        response = query.execute()
-        data = response.data
-        df = pd.DataFrame(data)
-        print(
-            f"✅ Tabla '{table_name}' cargada exitosamente ({len(df)} filas).")
-        return df
-
-    except Exception as e:
-        print(f"🔥 Error al consultar la tabla '{table_name}': {e}")
-        return None
+import argparse
+# Importamos el extractor paginado usando una importación relativa
+from ..utils.extract import fetch_tables
+from ..utils.incremental import WATERMARK_COLUMNS, read_watermarks, watermark_column
+from ..utils.raw_store import RAW_DIR, RawStoreWriter, write_manifest, column_max, raw_path
+from ..utils.pg_transport import export_to_parquet
+from ..utils.perf import stage
+from ..utils.warehouse import WAREHOUSE_PATH
 
 
 # --- Punto de entrada principal del script ---
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--full-refresh", action="store_true",
+                        help="Ignora las marcas de agua y descarga todas las filas.")
+    parser.add_argument("--transport", action="append", default=[], metavar="TABLA=postgres",
+                        help="Extrae la tabla por COPY directo a Postgres en vez de la API REST.")
+    args = parser.parse_args()
+
     print("\n--- [Paso 10] Iniciando el script de extracción desde Supabase ---")
 
-    output_dir = "out"
-    os.makedirs(output_dir, exist_ok=True)
-    output_path = os.path.join(output_dir, "raw_data.pkl")
+    warehouse_path = WAREHOUSE_PATH
 
     tables_to_extract = [
         "products", "suppliers", "campaigns",
-        "adsets", "adset_product"
+        "adsets", "adset_product",
+        "adset_simulation", "ad_simulation", "sales"
     ]
 
-    dataframes = {}
-    for table in tables_to_extract:
-        # Aquí es donde se llama a la función
-        dataframes[table] = fetch_table_as_df(table)
+    # Modo incremental: solo filas >= la marca de agua guardada en el warehouse. Solo
+    # las tablas append-only (WATERMARK_COLUMNS) tienen marca; las que se editan en el
+    # sitio se extraen siempre completas
+    watermarks = {} if args.full_refresh else read_watermarks(warehouse_path)
+    if watermarks:
+        print(f"🔁 Extracción incremental para: {', '.join(sorted(watermarks))}")
+
+    # Transporte por tabla: "rest" (PostgREST, por defecto) o "postgres" (COPY directo
+    # sobre SUPABASE_DB_URL). EXTRACT_TRANSPORTS=adset_simulation=postgres,sales=postgres
+    specs = [s for s in os.getenv("EXTRACT_TRANSPORTS", "").split(",") if s] + args.transport
+    transports = dict(spec.split("=", 1) for spec in specs)
+    rest_tables = [t for t in tables_to_extract if transports.get(t, "rest") == "rest"]
+    pg_tables = [t for t in tables_to_extract if transports.get(t) == "postgres"]
+
+    # Tablas REST: se extraen a la vez, paginadas sobre un pool de hilos
+    # (EXTRACT_PAGE_SIZE / EXTRACT_MAX_WORKERS en el .env). Cada página se escribe
+    # a disco en cuanto llega y al final se compacta en out/raw/<tabla>.parquet
+    writer = RawStoreWriter()
+    with stage("fetch_rest") as m:
+        row_counts = fetch_tables(rest_tables, since=watermarks, on_page=writer)
+        ok_tables = [t for t, n in row_counts.items() if n is not None]
+        m["rows_out"] = sum(row_counts[t] for t in ok_tables)
 
     try:
-        with open(output_path, "wb") as f:
-            pickle.dump(dataframes, f)
-        print(f"\n✅ Datos guardados exitosamente en: {output_path}")
+        with stage("compact_raw", rows_in=sum(row_counts[t] for t in ok_tables)):
+            paths = writer.finalize(ok_tables)
+
+        # Tablas por Postgres: COPY -> DuckDB -> Parquet, sin JSON ni DataFrame
+        for table in pg_tables:
+            try:
+                with stage(f"fetch_postgres.{table}") as m:
+                    rows = m["rows_out"] = export_to_parquet(
+                        table, raw_path(table), since=watermarks.get(table))
+                row_counts[table], paths[table] = rows, raw_path(table)
+                ok_tables.append(table)
+                print(f"✅ Tabla '{table}' extraída por Postgres ({rows} filas).")
+            except Exception as e:
+                print(f"🔥 Error al extraer '{table}' por Postgres: {e}")
+
+        # El manifiesto le dice al paso 30 si cada tabla es un delta o una carga completa
+        manifest = {}
+        for table in ok_tables:
+            previous = watermarks.get(table, (None, None))[1]
+            high_water = None
+            if table in WATERMARK_COLUMNS:
+                high_water = column_max(table, watermark_column(table)) or previous
+            manifest[table] = {
+                "mode": "incremental" if table in watermarks else "full",
+                "rows": row_counts[table],
+                "path": paths[table],
+                "high_water": high_water,
+            }
+        write_manifest(manifest)
+        print(f"\n✅ Datos guardados exitosamente en: {RAW_DIR}")
     except Exception as e:
         print(f"🔥 Error al guardar los datos: {e}")
+        exit(1)
 
     print("\n--- [Paso 10] Extracción completada. ---")
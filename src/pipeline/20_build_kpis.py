@@ -2,82 +2,87 @@
 import pandas as pd
 import numpy as np
 import os
-from ..utils.supa_client import supabase
+import argparse
+import duckdb
+from ..utils.perf import stage
+from ..utils.kpi_engine import MEASURES, aggregate_fine, compute_kpis
+from ..utils.server_kpis import fetch_kpi_views, kpis_from_views, refresh_kpi_views
+from ..utils.exports import export_all
+from ..utils.schema_registry import to_pandas
+from ..utils.warehouse import WAREHOUSE_PATH, connect_warehouse
 
 pd.options.display.float_format = '{:,.2f}'.format
 
 if __name__ == "__main__":
-    print("\n--- Iniciando script: Análisis y Exportación de KPIs ---")
-
-    # 1. Extraer la tabla adset_simulation
-    try:
-        response = supabase.from_('adset_simulation').select("*").execute()
-        df = pd.DataFrame(response.data)
-        print(f"✅ Tabla 'adset_simulation' cargada ({len(df)} filas).")
-    except Exception as e:
-        print(f"🔥 Error al cargar la tabla 'adset_simulation': {e}")
-        exit()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--transport", choices=["rest", "postgres"], default="rest",
+                        help="Con --server-kpis: postgres lee las vistas por conexión directa.")
+    parser.add_argument("--server-kpis", action="store_true",
+                        help="Lee los KPIs ya agregados en Postgres (vistas mv_kpi_*).")
+    parser.add_argument("--refresh-views", action="store_true",
+                        help="Con --server-kpis: refresca mv_kpi_* antes de leerlas "
+                             "(tras inserts hechos fuera del pipeline).")
+    args = parser.parse_args()
 
-    if df.empty:
-        print("\n🔥 La tabla 'adset_simulation' está vacía. No se puede continuar.")
-        exit()
-
-    # 2. Limpiar y preparar datos
-    df['clicks'] = pd.to_numeric(
-        df['clicks'], errors='coerce').fillna(0).astype(int)
-    df['budget'] = pd.to_numeric(df['budget'], errors='coerce').fillna(0)
-    df['conversions'] = pd.to_numeric(
-        df['conversions'], errors='coerce').fillna(0).astype(int)
-    df['revenue'] = pd.to_numeric(df['revenue'], errors='coerce').fillna(0)
-    df['margin'] = pd.to_numeric(df['margin'], errors='coerce').fillna(0)
-
-    df['simulated_ctr'] = np.random.uniform(0.01, 0.10, size=len(df))
-    df['simulated_impressions'] = (
-        df['clicks'] / df['simulated_ctr']).replace(np.inf, 0).astype(int)
+    print("\n--- Iniciando script: Análisis y Exportación de KPIs ---")
+    warehouse_path = WAREHOUSE_PATH
 
-    # 3. Calcular los KPIs
-    # KPI por Adset
-    kpi_adset = df.groupby(['campaign_id', 'adset_name']).agg(
-        total_budget=('budget', 'sum'),
-        total_clicks=('clicks', 'sum'),
-        total_impressions=('simulated_impressions', 'sum'),
-        total_conversions=('conversions', 'sum'),
-        total_revenue=('revenue', 'sum'),
-        total_margin=('margin', 'sum')
-    ).reset_index()
+    if args.server_kpis:
+        # 1-3. Postgres ya tiene los KPIs agregados (vistas mv_kpi_*): solo se bajan
+        # unas pocas filas por grano, sin tocar adset_simulation
+        with stage("fetch_server_kpis") as m:
+            try:
+                if args.refresh_views:
+                    refresh_kpi_views()
+                views = fetch_kpi_views(args.transport)
+            except Exception as e:
+                print(f"🔥 Error al leer las vistas de KPIs: {e}")
+                exit(1)
+            if any(df is None or df.empty for df in views.values()):
+                print("🔥 Las vistas mv_kpi_* están vacías o no existen "
+                      "(aplica 00_schema.sql y carga una simulación).")
+                exit(1)
+            m["rows_out"] = sum(len(df) for df in views.values())
+        with stage("kpis", rows_in=m["rows_out"]) as m:
+            kpi_global, kpi_campaign, kpi_adset, top_10_products = kpis_from_views(
+                views, n_products=10)
+            m["rows_out"] = len(kpi_adset)
+        print(f"✅ KPIs leídos de Postgres ({len(kpi_adset)} adsets, "
+              f"{len(kpi_campaign)} campañas).")
+    else:
+        # 1. Histórico desde el snapshot del warehouse: el paso 10 extrae (y es el único
+        # que mueve las marcas de agua) y el paso 30 fusiona el delta en el snapshot
+        with stage("load_adset_simulation") as m:
+            try:
+                con = connect_warehouse(warehouse_path, read_only=True)
+                try:
+                    df = to_pandas('adset_simulation', con.execute(
+                        "SELECT * FROM snapshot_adset_simulation").fetch_arrow_table())
+                finally:
+                    con.close()
+            except (duckdb.CatalogException, duckdb.IOException):
+                df = pd.DataFrame()
+            print(f"✅ Tabla 'adset_simulation' cargada desde el warehouse ({len(df)} filas).")
+            m["rows_out"] = len(df)
 
-    # KPI por Campaña
-    kpi_campaign = kpi_adset.groupby('campaign_id').agg(
-        total_budget=('total_budget', 'sum'),
-        total_clicks=('total_clicks', 'sum'),
-        total_impressions=('total_impressions', 'sum'),
-        total_conversions=('total_conversions', 'sum'),
-        total_revenue=('total_revenue', 'sum'),
-        total_margin=('total_margin', 'sum')
-    ).reset_index()
+        if df.empty:
+            print("\n🔥 La tabla 'adset_simulation' está vacía. No se puede continuar.")
+            print("➡️ Ejecuta primero los pasos 10 (extracción) y 30 (snapshots).")
+            exit(1)
 
-    # Top 10 Productos
-    top_10_products = df.groupby('product_id').agg(
-        total_revenue=('revenue', 'sum'),
-        total_conversions=('conversions', 'sum')
-    ).sort_values(by='total_revenue', ascending=False).head(10).reset_index()
+        with stage("kpis", rows_in=len(df)) as m:
+            # 2. Los tipos ya vienen limpios desde la extracción (schema_registry)
+            df['simulated_ctr'] = np.random.uniform(0.01, 0.10, size=len(df))
+            df['simulated_impressions'] = (
+                df['clicks'] / df['simulated_ctr']).replace(np.inf, 0).astype(int)
 
-    # KPI Global
-    kpi_global = {
-        'total_budget': kpi_campaign['total_budget'].sum(),
-        'total_revenue': kpi_campaign['total_revenue'].sum(),
-        'total_conversions': kpi_campaign['total_conversions'].sum(),
-        'total_clicks': kpi_campaign['total_clicks'].sum(),
-        'total_impressions': kpi_campaign['total_impressions'].sum()
-    }
-    kpi_global['cpa'] = kpi_global['total_budget'] / \
-        kpi_global['total_conversions'] if kpi_global['total_conversions'] else 0
-    kpi_global['roas'] = kpi_global['total_revenue'] / \
-        kpi_global['total_budget'] if kpi_global['total_budget'] else 0
-    kpi_global['cpc'] = kpi_global['total_budget'] / \
-        kpi_global['total_clicks'] if kpi_global['total_clicks'] else 0
-    kpi_global['ctr'] = kpi_global['total_clicks'] / \
-        kpi_global['total_impressions'] if kpi_global['total_impressions'] else 0
+            # 3. Calcular los KPIs (una sola agregación al grano fino + cascada)
+            fine = aggregate_fine(df, ['campaign_id', 'adset_name', 'product_id'],
+                                  measures={**MEASURES, 'simulated_impressions': 'total_impressions'})
+            kpi_global, kpi_campaign, kpi_adset, top_10_products = compute_kpis(
+                fine, campaign_key='campaign_id', adset_key='adset_name',
+                product_key='product_id', n_products=10)
+            m["rows_out"] = len(fine)
 
     # Convertir el diccionario de KPI Global a DataFrame para guardarlo
     kpi_global_df = pd.DataFrame([kpi_global])
@@ -100,15 +105,19 @@ if __name__ == "__main__":
 
     try:
         print(f"\n\n--- 💾 Exportando KPIs a la carpeta '{output_dir}' ---")
-        kpi_global_df.to_csv(os.path.join(
-            output_dir, "kpi_global.csv"), index=False)
-        kpi_campaign.to_csv(os.path.join(
-            output_dir, "kpi_campaign.csv"), index=False)
-        kpi_adset.to_csv(os.path.join(
-            output_dir, "kpi_adset.csv"), index=False)
-        top_10_products.to_csv(os.path.join(
-            output_dir, "top_10_products.csv"), index=False)
-        print("✅ Exportación completada exitosamente.")
+        with stage("export_csv", rows_in=len(kpi_campaign) + len(kpi_adset)) as m:
+            # Los cuatro CSV a la vez desde DuckDB; los que no cambiaron no se reescriben
+            with duckdb.connect() as con:
+                exports = export_all(con, [
+                    {"source": kpi_global_df, "path": os.path.join(output_dir, "kpi_global.csv")},
+                    {"source": kpi_campaign, "path": os.path.join(output_dir, "kpi_campaign.csv")},
+                    {"source": kpi_adset, "path": os.path.join(output_dir, "kpi_adset.csv")},
+                    {"source": top_10_products,
+                     "path": os.path.join(output_dir, "top_10_products.csv")},
+                ])
+            m["written"] = sum(s == "written" for s in exports.values())
+        print(f"✅ Exportación completada exitosamente "
+              f"({m['written']}/{len(exports)} archivos con cambios).")
     except Exception as e:
         print(f"🔥 Error durante la exportación: {e}")
 
@@ -1,127 +1,164 @@
 # src/pipeline/30_build_mart.py
-import os
-import pickle
+import argparse
 import pandas as pd
-import numpy as np
-import duckdb
+from ..utils.incremental import apply_snapshot
+from ..utils.perf import stage
+from ..utils.raw_store import RAW_DIR, read_manifest, read_table
+from ..utils.kpi_engine import grouping_sets_sql, kpis_from_grains
+from ..utils import approx_kpis
+from ..utils.marts import SIM_LEVELS, SIM_SOURCE, update_run_aggregates
+from ..utils.warehouse import WAREHOUSE_PATH, connect_warehouse
 
 pd.options.display.float_format = '{:,.2f}'.format
 
 
-def build_marts_from_snapshots(warehouse_path: str):
+def build_marts_from_snapshots(warehouse_path: str, top_n: int = 10, approx: dict = None):
     """
     Se conecta a DuckDB, lee los snapshots y construye los marts de KPIs.
+
+    Todas las granularidades (adset, campaña, producto y global), con sus ratios, se
+    calculan en DuckDB en una sola pasada con GROUPING SETS; a Python solo vuelven las
+    filas agregadas (vía Arrow), nunca el detalle de la simulación.
+
+    approx: opciones de approx_kpis.approx_marts (sample_rate, target_error, ...);
+    estima los mismos marts desde una muestra por campaña, con intervalos de confianza.
     """
     # Se conecta en modo de solo lectura, una buena práctica para análisis
-    con = duckdb.connect(warehouse_path, read_only=True)
-
-    # 1. Unir snapshots para crear una vista analítica completa
-    query = """
-    WITH merged_data AS (
+    con = connect_warehouse(warehouse_path, read_only=True)
+    if approx is not None:
+        try:
+            return approx_kpis.approx_marts(con, n_products=top_n, **approx)
+        finally:
+            con.close()
+
+    enriched = """
+    -- Unir snapshots y simular impresiones para poder calcular el CTR
+    (
         SELECT
-            sim.*,
             c.campaign_name,
-            p.product_name
+            sim.adset_name,
+            p.product_name,
+            sim.budget,
+            sim.clicks,
+            sim.conversions,
+            sim.revenue,
+            sim.margin,
+            -- Genera un CTR aleatorio entre 1% y 10% para calcular las impresiones
+            (sim.clicks / (random() * 0.09 + 0.01))::INTEGER AS impressions
         FROM snapshot_adset_simulation AS sim
         LEFT JOIN snapshot_campaigns AS c ON sim.campaign_id = c.campaign_id
         LEFT JOIN snapshot_products AS p ON sim.product_id = p.product_id
-    ),
-    
-    -- 2. Simular impresiones para poder calcular el CTR
-    enriched_data AS (
-        SELECT
-            *,
-            -- Genera un CTR aleatorio entre 1% y 10% para calcular las impresiones
-            (clicks / (random() * 0.09 + 0.01))::INTEGER AS simulated_impressions
-        FROM merged_data
-    )
-    
-    -- 3. Seleccionar todos los datos enriquecidos para el análisis
-    SELECT * FROM enriched_data;
+    ) AS enriched_data
     """
-    merged_df = con.execute(query).fetch_df()
+    keys = dict(campaign_key='campaign_name', adset_key='adset_name',
+                product_key='product_name')
+    query = grouping_sets_sql(enriched, n_products=top_n, **keys)
+    grains = con.execute(query).fetch_arrow_table().to_pandas()
     con.close()
 
-    # 4. Calcular KPIs agregados usando Pandas
-    kpi_adset = merged_df.groupby(['adset_name', 'campaign_name']).agg(
-        total_budget=('budget', 'sum'), total_clicks=('clicks', 'sum'),
-        total_impressions=('simulated_impressions', 'sum'), total_conversions=('conversions', 'sum'),
-        total_revenue=('revenue', 'sum'), total_margin=('margin', 'sum')
-    ).reset_index()
-
-    kpi_campaign = kpi_adset.groupby('campaign_name').agg(
-        total_budget=('total_budget', 'sum'), total_clicks=('total_clicks', 'sum'),
-        total_impressions=('total_impressions', 'sum'), total_conversions=('total_conversions', 'sum'),
-        total_revenue=('total_revenue', 'sum'), total_margin=('total_margin', 'sum')
-    ).reset_index()
-
-    top_10_products = merged_df.groupby('product_name').agg(
-        total_revenue=('revenue', 'sum'), total_conversions=('conversions', 'sum')
-    ).sort_values(by='total_revenue', ascending=False).head(10).reset_index()
-
-    kpi_global = {
-        'total_budget': kpi_campaign['total_budget'].sum(),
-        'total_revenue': kpi_campaign['total_revenue'].sum(),
-        'total_conversions': kpi_campaign['total_conversions'].sum(),
-        'total_clicks': kpi_campaign['total_clicks'].sum(),
-        'total_impressions': kpi_campaign['total_impressions'].sum()
-    }
-    # Se añade una condición para evitar división por cero
-    kpi_global['cpa'] = kpi_global['total_budget'] / \
-        kpi_global['total_conversions'] if kpi_global['total_conversions'] else 0
-    kpi_global['roas'] = kpi_global['total_revenue'] / \
-        kpi_global['total_budget'] if kpi_global['total_budget'] else 0
-    kpi_global['cpc'] = kpi_global['total_budget'] / \
-        kpi_global['total_clicks'] if kpi_global['total_clicks'] else 0
-    kpi_global['ctr'] = kpi_global['total_clicks'] / \
-        kpi_global['total_impressions'] if kpi_global['total_impressions'] else 0
-
-    return kpi_global, kpi_campaign, kpi_adset, top_10_products
+    return kpis_from_grains(grains, **keys)
 
 
-if __name__ == "__main__":
-    print("\n--- [Paso 30] Iniciando la construcción de Snapshots y KPIs ---")
-    input_path = "out/raw_data.pkl"
-    warehouse_path = "warehouse.duckdb"
-
-    # --- Carga de datos crudos ---
-    try:
-        with open(input_path, "rb") as f:
-            raw_data = pickle.load(f)
-        print(f"✅ Datos crudos cargados desde: {input_path}")
-    except FileNotFoundError:
+def refresh_snapshots(warehouse_path: str):
+    """Snapshots desde la capa cruda y agregados por corrida (escritura del warehouse)."""
+    # --- Carga de datos crudos (manifiesto de la capa Parquet) ---
+    manifest = read_manifest()
+    if not manifest:
         print(
-            f"🔥 Error: No se encontró el archivo de datos en '{input_path}'.")
+            f"🔥 Error: No se encontró la capa cruda en '{RAW_DIR}'.")
         print("➡️ Asegúrate de ejecutar primero el script '10_extract_supabase.py'.")
-        exit()
-
-    # --- Creación de Snapshots (con verificación de datos) ---
-    con = duckdb.connect(warehouse_path)
-    valid_tables = []
-    for name, df in raw_data.items():
-        if df.empty:
-            print(
-                f"⚠️ ¡Atención! La tabla '{name}' está vacía y será ignorada.")
-            continue
-
-        table_name = f"snapshot_{name}"
-        con.execute(
-            f"CREATE OR REPLACE TABLE {table_name} AS SELECT * FROM df")
-        print(f"✅ Snapshot '{table_name}' creado en DuckDB.")
-        valid_tables.append(name)
-    con.close()
+        exit(1)
+    print(f"✅ Manifiesto de datos crudos cargado desde: {RAW_DIR}")
+
+    # --- Snapshots y agregados en una sola sesión de escritura: una sola versión nueva
+    # del warehouse; si algo falla (o falta la simulación) no se publica nada ---
+    with connect_warehouse(warehouse_path) as con:
+        # --- Creación de Snapshots (con verificación de datos) ---
+        valid_tables = []
+        for name, meta in manifest.items():
+            table_name = f"snapshot_{name}"
+            mode = meta.get("mode", "full")
+            with stage(f"snapshot.{name}") as m:
+                # Arrow memory-mapped: DuckDB lo ingiere sin copiarlo a pandas
+                df = read_table(name)
+                m["rows_out"] = df.num_rows if df is not None else 0
+
+                if mode == "incremental":
+                    # Delta: upsert por clave primaria sobre el snapshot existente
+                    if df is not None and df.num_rows:
+                        apply_snapshot(con, name, df, mode="incremental",
+                                       high_water=meta.get("high_water"))
+                        print(f"✅ Snapshot '{table_name}' actualizado (+{len(df)} filas).")
+                    else:
+                        print(f"➖ Snapshot '{table_name}' sin cambios.")
+                    valid_tables.append(name)
+                    continue
+
+                if df is None or not df.num_rows:
+                    print(
+                        f"⚠️ ¡Atención! La tabla '{name}' está vacía y será ignorada.")
+                    continue
+
+                apply_snapshot(con, name, df, mode="full",
+                               high_water=meta.get("high_water"))
+                print(f"✅ Snapshot '{table_name}' creado en DuckDB.")
+                valid_tables.append(name)
+
+        # Comprobar si tenemos los datos necesarios para continuar
+        if 'adset_simulation' not in valid_tables:
+            print("\n🔥 La tabla 'adset_simulation' está vacía. No se pueden calcular los KPIs.")
+            print("➡️ Por favor, añade datos a la tabla 'adset_simulation' en Supabase y vuelve a ejecutar el pipeline.")
+            con.abort()
+            exit(1)
+
+        # --- Agregados por corrida: solo las corridas nuevas si el delta es incremental ---
+        runs = None
+        if manifest["adset_simulation"].get("mode") == "incremental":
+            delta = read_table("adset_simulation", columns=["run_ts"])
+            runs = set(delta.column("run_ts").unique().to_pylist()) if delta is not None else set()
+        with stage("run_aggregates") as m:
+            update_run_aggregates(con, SIM_SOURCE, SIM_LEVELS, runs=runs)
+            m["rows_out"] = con.execute("SELECT count(*) FROM mart.kpi_run_adset").fetchone()[0]
+    print(f"✅ Agregados por corrida actualizados "
+          f"({'todas las corridas' if runs is None else f'{len(runs)} corridas nuevas'}).")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--kpis-only", action="store_true",
+                        help="No toca los snapshots: solo calcula KPIs sobre los ya cargados.")
+    parser.add_argument("--approx", action="store_true",
+                        help="KPIs estimados desde una muestra por campaña, con intervalos de confianza.")
+    parser.add_argument("--sample-rate", type=float, default=approx_kpis.APPROX_SAMPLE_RATE,
+                        help="Fracción de filas a muestrear (con --approx).")
+    parser.add_argument("--target-error", type=float, default=approx_kpis.APPROX_TARGET_ERROR,
+                        help="Error relativo buscado del ROAS global; ajusta la tasa sola.")
+    parser.add_argument("--confidence", type=float, default=approx_kpis.APPROX_CONFIDENCE)
+    parser.add_argument("--method", choices=approx_kpis.SAMPLE_METHODS,
+                        default=approx_kpis.APPROX_METHOD)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    print("\n--- [Paso 30] Iniciando la construcción de Snapshots y KPIs ---")
+    warehouse_path = WAREHOUSE_PATH
+    if not args.kpis_only:
+        refresh_snapshots(warehouse_path)
 
-    # Comprobar si tenemos los datos necesarios para continuar
-    if 'adset_simulation' not in valid_tables:
-        print("\n🔥 La tabla 'adset_simulation' está vacía. No se pueden calcular los KPIs.")
-        print("➡️ Por favor, añade datos a la tabla 'adset_simulation' en Supabase y vuelve a ejecutar el pipeline.")
-        exit()
+    approx = None
+    if args.approx:
+        approx = {"rate": args.sample_rate, "target_error": args.target_error,
+                  "confidence": args.confidence, "method": args.method, "seed": args.seed}
 
     print("\n--- Construyendo KPIs desde los Snapshots ---")
-    global_kpis, campaign_kpis, adset_kpis, top_products = build_marts_from_snapshots(
-        warehouse_path)
+    with stage("build_marts") as m:
+        global_kpis, campaign_kpis, adset_kpis, top_products = build_marts_from_snapshots(
+            warehouse_path, approx=approx)
+        m["rows_out"] = len(campaign_kpis) + len(adset_kpis) + len(top_products)
 
     print("\n\n--- 📊 RESULTADOS DE INDICADORES ---")
+    if approx is not None:
+        print(f"⚠️ Aproximados: muestra {global_kpis['sample_rate']:.2%} "
+              f"({global_kpis['rows_sampled']:,} de {global_kpis['rows_total']:,} filas), "
+              f"IC {global_kpis['confidence']:.0%} en las columnas _lo / _hi.")
     print("\n--- Indicadores Globales ---")
     print(pd.Series(global_kpis))
     print("\n\n--- Top 10 Productos más Vendidos (por Ingresos) ---")
@@ -0,0 +1,75 @@
+# src/pipeline/40_simulate_adsets.py
+import os
+import time
+import argparse
+import duckdb
+from ..utils.montecarlo import (load_dimensions, simulate_runs,
+                                write_duckdb, write_parquet, write_postgres)
+from ..utils.supa_client import get_conn
+from ..utils.server_kpis import refresh_kpi_views
+from ..utils.perf import stage
+from ..utils.warehouse import WAREHOUSE_PATH, connect_warehouse
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Genera corridas Monte Carlo de adset_simulation por lotes.")
+    parser.add_argument("--runs", type=int, default=1000, help="Número de corridas.")
+    parser.add_argument("--seed", type=int, default=None, help="Semilla (reproducible).")
+    parser.add_argument("--batch-runs", type=int, default=100,
+                        help="Corridas generadas por lote vectorizado.")
+    parser.add_argument("--target", choices=["duckdb", "parquet", "postgres"], default="parquet")
+    parser.add_argument("--table", default="sim_adset_simulation",
+                        help="Tabla destino en DuckDB (target=duckdb).")
+    parser.add_argument("--out", default="out/sim_adset_simulation.parquet",
+                        help="Archivo destino (target=parquet).")
+    parser.add_argument("--clicks-dist", choices=["poisson", "negbin"], default="poisson")
+    parser.add_argument("--cpc-sigma", type=float, default=0.15)
+    parser.add_argument("--cvr-concentration", type=float, default=200.0)
+    parser.add_argument("--aov-sigma", type=float, default=0.10)
+    parser.add_argument("--nb-dispersion", type=float, default=10.0)
+    args = parser.parse_args()
+
+    print("\n--- [Paso 40] Simulación Monte Carlo de adset_simulation ---")
+    warehouse_path = WAREHOUSE_PATH
+
+    # Las dimensiones (campañas, adsets, productos) salen de los snapshots del paso 30
+    con = connect_warehouse(warehouse_path, read_only=args.target != "duckdb")
+    try:
+        dims = load_dimensions(con)
+    except duckdb.CatalogException as e:
+        print(f"🔥 Faltan snapshots en el warehouse: {e}")
+        print("➡️ Ejecuta primero los pasos 10 y 30.")
+        exit()
+    print(f"✅ {len(dims['adset_name'])} adsets × {len(dims['product_id'])} productos "
+          f"× {args.runs} corridas = {len(dims['adset_name']) * len(dims['product_id']) * args.runs:,} filas")
+
+    batches = simulate_runs(
+        dims, args.runs, seed=args.seed, batch_runs=args.batch_runs,
+        clicks_dist=args.clicks_dist, cpc_sigma=args.cpc_sigma,
+        cvr_concentration=args.cvr_concentration, aov_sigma=args.aov_sigma,
+        nb_dispersion=args.nb_dispersion)
+
+    t0 = time.perf_counter()
+    # Los lotes se generan al consumirlos: la etapa mide generación + escritura
+    with stage(f"simulate.{args.target}") as m:
+        if args.target == "duckdb":
+            rows = write_duckdb(con, args.table, batches)
+            destino = f"{warehouse_path}:{args.table}"
+        elif args.target == "parquet":
+            os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+            rows = write_parquet(args.out, batches)
+            destino = args.out
+        else:
+            with get_conn() as pg:
+                rows = write_postgres(pg, batches)
+                # Los KPIs materializados quedan al día con la carga recién hecha
+                refresh_kpi_views(pg)
+            destino = "public.adset_simulation (+ mv_kpi_* refrescadas)"
+        m["rows_out"] = rows
+    elapsed = time.perf_counter() - t0
+    con.close()
+
+    print(f"✅ {rows:,} filas escritas en {destino} en {elapsed:.2f}s "
+          f"({rows / max(elapsed, 1e-9):,.0f} filas/s)")
+    print("\n--- [Paso 40] Simulación completada. ---")
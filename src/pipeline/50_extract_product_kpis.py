@@ -1,61 +1,77 @@
 # src/pipeline/50_extract_product_kpis.py
+# KPIs y segmentación de productos (Estrella / Nicho / Volumen / Durmiente) en DuckDB,
+# sobre los snapshots de ventas y productos que deja el paso 30. Solo se procesan las
+# ventas nuevas y se re-segmentan los productos que cambiaron (ver utils/segmentation).
+import os
+import argparse
+import duckdb
 import pandas as pd
-from ..utils.supa_client import supabase
+from ..utils.perf import stage
+from ..utils.segmentation import segment_products
+from ..utils.exports import export_all
+from ..utils.warehouse import WAREHOUSE_PATH, connect_warehouse
 
 pd.options.display.float_format = '{:,.2f}'.format
 pd.set_option('display.width', 1000)
 
 
-def fetch_table_as_df(table_name: str):
-    """Lee una tabla de Supabase y la convierte a DataFrame."""
-    try:
-        response = supabase.from_(table_name).select("*").execute()
-        return pd.DataFrame(response.data)
-    except Exception as e:
-        print(f"🔥 Error al cargar la tabla '{table_name}': {e}")
-        return None
-
-
 if __name__ == "__main__":
-    print("\n--- Extrayendo KPIs de Productos para Análisis ---")
-
-    sales_df = fetch_table_as_df('sales')
-    products_df = fetch_table_as_df('products')
+    parser = argparse.ArgumentParser(description="KPIs y segmentación de productos.")
+    parser.add_argument("--full", action="store_true",
+                        help="Recalcula las métricas de todos los productos desde cero.")
+    parser.add_argument("--quantile", type=float,
+                        default=float(os.getenv("SEGMENT_QUANTILE", "0.5")),
+                        help="Cuantil de volumen y margen que separa los cuadrantes.")
+    parser.add_argument("--tolerance", type=float,
+                        default=float(os.getenv("SEGMENT_TOLERANCE", "0.0")),
+                        help="Variación relativa de los umbrales tolerada sin re-segmentar todo.")
+    args = parser.parse_args()
 
-    # --- CÓDIGO DE DEPURACIÓN ---
-    if sales_df is not None:
-        print("\n--- Columnas disponibles en la tabla 'sales' ---")
-        print(list(sales_df.columns))
-        print("--------------------------------------------------\n")
-    # --- FIN DEL CÓDIGO DE DEPURACIÓN ---
+    print("\n--- KPIs y segmentación de productos ---")
+    warehouse_path = WAREHOUSE_PATH
 
-    if sales_df is None or products_df is None or sales_df.empty:
-        print("🔥 Faltan datos de ventas o productos. Abortando.")
-        exit()
-
-    # Asegúrate de que los nombres de columna aquí coincidan con los de tu tabla
-    # MODIFICA 'qty' y 'unit_price' si es necesario
-    sales_df['revenue'] = sales_df['qty'] * sales_df['unit_price']
-
-    product_kpis = sales_df.groupby('product_id').agg(
-        sales_frequency=('sale_id', 'count'),
-        sales_volume=('qty', 'sum'),  # <- TAMBIÉN AQUÍ
-        total_revenue=('revenue', 'sum')
-    ).reset_index()
-
-    product_kpis = pd.merge(product_kpis, products_df,
-                            on='product_id', how='left')
+    con = connect_warehouse(warehouse_path)
+    try:
+        with stage("segment") as m:
+            summary = segment_products(con, full=args.full, quantile=args.quantile,
+                                       tolerance=args.tolerance)
+            m.update(rows_out=summary["n_resegmented"], mode=summary["mode"],
+                     n_changed=summary["n_changed"])
+    except duckdb.CatalogException as e:
+        print(f"🔥 Faltan los snapshots de ventas o productos: {e}")
+        print("➡️ Ejecuta primero los pasos 10 y 30.")
+        con.abort()
+        exit(1)
 
-    product_kpis['profit_margin_pct'] = (
-        (product_kpis['sale_price'] - product_kpis['unit_cost']) / product_kpis['sale_price']).fillna(0) * 100
+    print(f"✅ {summary['n_products']:,} productos · {summary['n_changed']:,} con cambios · "
+          f"{summary['n_resegmented']:,} re-segmentados ({summary['mode']})")
+    print(f"   Umbrales: volumen >= {summary['volume_threshold']:,.2f} · "
+          f"margen >= {summary['margin_threshold']:,.2f}%")
 
-    output_df = product_kpis[[
-        'product_id', 'product_name', 'total_revenue',
-        'sales_frequency', 'sales_volume', 'profit_margin_pct'
-    ]].sort_values(by='total_revenue', ascending=False)
+    with stage("export") as m:
+        export_all(con, [
+            {"source": "mart.snap_product_segments", "path": "out/snap_product_segments.parquet",
+             "order_by": ["product_id"]},
+            {"source": "mart.snap_product_segments", "path": "out/snap_product_segments.csv",
+             "order_by": ["product_id"], "round_digits": 2},
+        ])
+        segments = con.execute("""
+            SELECT segment, count(*) AS products, sum(total_revenue) AS total_revenue,
+                   sum(sales_volume) AS sales_volume, avg(profit_margin_pct) AS avg_margin_pct
+            FROM mart.snap_product_segments GROUP BY segment ORDER BY total_revenue DESC
+        """).fetch_df()
+        top = con.execute("""
+            SELECT product_id, product_name, total_revenue, sales_frequency, sales_volume,
+                   profit_margin_pct, segment
+            FROM mart.snap_product_segments ORDER BY total_revenue DESC LIMIT 20
+        """).fetch_df()
+        m["rows_out"] = summary["n_products"]
+    con.close()
 
-    print("\n\n--- COPIA Y PEGA LA SIGUIENTE TABLA EN CHATGPT ---\n")
-    print("Por favor, clasifica los siguientes productos en 4 segmentos (ej. 'Estrella', 'Nicho', 'Volumen', 'Durmiente') basándote en estas métricas:\n")
-    print(output_df.to_string(index=False))
+    print("\n--- Segmentos ---")
+    print(segments.to_string(index=False))
+    print("\n--- Top 20 productos por ingresos ---")
+    print(top.to_string(index=False))
 
-    print("\n\n--- Extracción de KPIs completada. ---")
+    print("\n✅ mart.snap_product_segments / out/snap_product_segments.(parquet|csv)")
+    print("\n--- KPIs de productos completados. ---")
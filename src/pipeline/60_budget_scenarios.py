@@ -0,0 +1,81 @@
+# src/pipeline/60_budget_scenarios.py
+import os
+import time
+import argparse
+import numpy as np
+import pandas as pd
+import duckdb
+from ..utils.budget_optimizer import check_elasticity, sweep_pareto_scenarios
+from ..utils.perf import stage
+from ..utils.marts import write_run_partition
+from ..utils.exports import export_all
+from ..utils.warehouse import WAREHOUSE_PATH, connect_warehouse
+
+pd.options.display.float_format = '{:,.2f}'.format
+
+
+def parse_grid(spec: str):
+    """'inicio:fin:n' -> np.linspace(inicio, fin, n); 'a,b,c' -> lista explícita."""
+    if ":" in spec:
+        start, stop, num = spec.split(":")
+        return np.linspace(float(start), float(stop), int(num))
+    return np.array([float(x) for x in spec.split(",")])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Barrido what-if de umbral Pareto × presupuesto total sobre el último run.")
+    parser.add_argument("--thresholds", default="0.05:1.0:40",
+                        help="Umbrales de revenue acumulado (inicio:fin:n o lista).")
+    parser.add_argument("--budget-mults", default="0.5:2.0:25",
+                        help="Múltiplos del presupuesto total actual (inicio:fin:n o lista).")
+    parser.add_argument("--elasticity", default=os.getenv("BUDGET_ELASTICITY", "0.6"),
+                        help="β de las curvas de respuesta, 0 < β < 1.")
+    args = parser.parse_args()
+    try:
+        args.elasticity = check_elasticity(args.elasticity)
+    except ValueError as e:
+        parser.error(str(e))
+
+    print("\n--- [Paso 60] Barrido de escenarios de presupuesto ---")
+    warehouse_path = WAREHOUSE_PATH
+
+    # Se reutilizan los KPIs por anuncio que step11 ya dejó en el warehouse (último run)
+    con = connect_warehouse(warehouse_path)
+    try:
+        ads = con.execute("""
+            SELECT run_ts, ad_id, budget, revenue FROM mart.snap_ads_kpis
+            WHERE run_ts = (SELECT max(run_ts) FROM mart.snap_ads_kpis)
+        """).fetch_df()
+    except duckdb.CatalogException:
+        print("🔥 No existe mart.snap_ads_kpis. Ejecuta primero step11_ads_snapshots.py.")
+        exit(1)
+
+    thresholds = parse_grid(args.thresholds)
+    budgets = float(ads["budget"].sum()) * parse_grid(args.budget_mults)
+
+    t0 = time.perf_counter()
+    with stage("sweep", rows_in=len(ads)) as m:
+        scenarios = sweep_pareto_scenarios(ads, thresholds, budgets, elasticity=args.elasticity)
+        scenarios.insert(0, "run_ts", ads["run_ts"].iloc[0] if len(ads) else None)
+        m["rows_out"] = len(scenarios)
+    elapsed = time.perf_counter() - t0
+    print(f"✅ {len(scenarios):,} escenarios sobre {len(ads):,} anuncios en {elapsed:.3f}s")
+    if scenarios.empty:
+        con.abort()  # nada que escribir: no se publica una versión nueva
+        print("⚠️ El último run no tiene anuncios: no hay escenarios que guardar.")
+        exit()
+
+    with stage("write", rows_in=len(scenarios)):
+        con.register("scenarios_df", scenarios)
+        con.execute("BEGIN TRANSACTION")
+        write_run_partition(con, "mart.snap_budget_scenarios", "scenarios_df",
+                            scenarios["run_ts"].iloc[0])
+        con.execute("COMMIT")
+        export_all(con, [{"source": scenarios, "path": "out/snap_budget_scenarios.parquet"}])
+    con.close()
+
+    print("\n--- Mejores escenarios por margen proyectado ---")
+    print(scenarios.nlargest(10, "margin_new").to_string(index=False))
+    print("\n✅ mart.snap_budget_scenarios / out/snap_budget_scenarios.parquet")
+    print("\n--- [Paso 60] Barrido completado. ---")
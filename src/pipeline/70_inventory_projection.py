@@ -0,0 +1,92 @@
+# src/pipeline/70_inventory_projection.py
+# Proyección de stock, puntos de pedido y quiebres por SKU (ver utils/inventory):
+# demanda = conversiones proyectadas de adset_simulation (× plan de step11), lead time
+# y lotes del proveedor. Escribe mart.snap_inventory_projection (una fila por SKU).
+import os
+import time
+import argparse
+import duckdb
+import pandas as pd
+from ..utils.perf import stage
+from ..utils.inventory import (load_sku_inputs, project_inventory, write_projection,
+                               daily_levels_table, summarize)
+from ..utils.exports import export_all, export_specs
+from ..utils.warehouse import WAREHOUSE_PATH, connect_warehouse
+
+pd.options.display.float_format = '{:,.2f}'.format
+pd.set_option('display.width', 1000)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Proyección de inventario por SKU.")
+    parser.add_argument("--horizon", type=int,
+                        default=int(os.getenv("INVENTORY_HORIZON_DAYS", "365")),
+                        help="Días a proyectar.")
+    parser.add_argument("--start", default=None,
+                        help="Fecha del primer día proyectado (por defecto, hoy).")
+    parser.add_argument("--start-cover-days", type=float,
+                        default=float(os.getenv("INVENTORY_START_COVER_DAYS", "30")),
+                        help="Stock inicial en días de demanda (el esquema no guarda stock).")
+    parser.add_argument("--service-level", type=float,
+                        default=float(os.getenv("INVENTORY_SERVICE_LEVEL", "0.95")),
+                        help="Nivel de servicio del stock de seguridad.")
+    parser.add_argument("--holding-rate", type=float,
+                        default=float(os.getenv("INVENTORY_HOLDING_RATE", "0.25")),
+                        help="Costo anual de mantener stock como fracción del costo unitario.")
+    parser.add_argument("--no-plan", action="store_true",
+                        help="No escalar la demanda con el plan de presupuesto de step11.")
+    parser.add_argument("--daily", action="store_true",
+                        help="Exporta además el stock diario (SKU × día) a out/inventory_daily.parquet.")
+    args = parser.parse_args()
+
+    print("\n--- [Paso 70] Proyección de inventario ---")
+    warehouse_path = WAREHOUSE_PATH
+
+    con = connect_warehouse(warehouse_path)
+    try:
+        with stage("inputs") as m:
+            inputs = load_sku_inputs(con, use_plan=not args.no_plan,
+                                     default_lead_time=int(os.getenv("INVENTORY_DEFAULT_LEAD_TIME", "7")))
+            m["rows_out"] = len(inputs)
+    except (duckdb.CatalogException, duckdb.BinderException) as e:
+        print(f"🔥 Faltan los snapshots de productos o de adset_simulation (o sus columnas): {e}")
+        print("➡️ Ejecuta primero los pasos 10 y 30.")
+        con.abort()
+        exit(1)
+
+    t0 = time.perf_counter()
+    with stage("project", rows_in=len(inputs)) as m:
+        summary, levels = project_inventory(inputs, horizon=args.horizon, start_date=args.start,
+                                            start_cover_days=args.start_cover_days,
+                                            service_level=args.service_level,
+                                            holding_rate=args.holding_rate)
+        m["rows_out"] = levels.size
+    elapsed = time.perf_counter() - t0
+    totals = summarize(summary)
+    print(f"✅ {totals['n_skus']:,} SKU × {args.horizon} días en {elapsed:.2f}s · "
+          f"{totals['n_stockouts']:,} con quiebre · {totals['n_orders']:,} pedidos · "
+          f"fill rate {totals['fill_rate']:.1%}")
+
+    with stage("write", rows_in=len(summary)):
+        con.execute("BEGIN TRANSACTION")
+        write_projection(con, summary)
+        con.execute("COMMIT")
+        specs = export_specs("mart.snap_inventory_projection", "out/snap_inventory_projection",
+                             order_by=["product_id"], round_digits=2)
+        if args.daily:
+            specs.append({"source": daily_levels_table(summary, levels),
+                          "path": "out/inventory_daily.parquet"})
+        export_all(con, specs)
+        risk = con.execute("""
+            SELECT product_id, sku, daily_demand, reorder_point, order_qty, lead_time_days,
+                   first_reorder_date, stockout_date, fill_rate
+            FROM mart.snap_inventory_projection
+            WHERE stockout_date IS NOT NULL
+            ORDER BY stockout_date, daily_demand DESC LIMIT 20
+        """).fetch_df()
+    con.close()
+
+    print("\n--- Primeros SKU en quedarse sin stock ---")
+    print(risk.to_string(index=False) if len(risk) else "Sin quiebres en el horizonte.")
+    print("\n✅ mart.snap_inventory_projection / out/snap_inventory_projection.(parquet|csv)")
+    print("\n--- [Paso 70] Proyección completada. ---")
@@ -0,0 +1,83 @@
+# src/pipeline/80_demand_forecast.py
+# Pronóstico de demanda por SKU (Holt / naive estacional, ver utils/forecasting) sobre
+# la matriz SKU × período que arma DuckDB. Solo procesa los períodos nuevos desde la
+# corrida anterior; escribe mart.snap_demand_forecast.
+import os
+import time
+import argparse
+import duckdb
+import pandas as pd
+from ..utils.perf import stage
+from ..utils.forecasting import forecast_demand, PERIODS, SOURCES
+from ..utils.exports import export_all, export_specs
+from ..utils.warehouse import WAREHOUSE_PATH, connect_warehouse
+
+pd.options.display.float_format = '{:,.2f}'.format
+pd.set_option('display.width', 1000)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pronóstico de demanda por SKU.")
+    parser.add_argument("--source", choices=SOURCES,
+                        default=os.getenv("FORECAST_SOURCE", "sales"),
+                        help="Ventas por período o conversiones por corrida de adset_simulation.")
+    parser.add_argument("--period", choices=list(PERIODS),
+                        default=os.getenv("FORECAST_PERIOD", "week"),
+                        help="Granularidad de las series de ventas (con --source simulation, run).")
+    parser.add_argument("--horizon", type=int,
+                        default=int(os.getenv("FORECAST_HORIZON", "12")),
+                        help="Períodos a pronosticar.")
+    parser.add_argument("--season", type=int, default=None,
+                        help="Largo de la temporada (por defecto 7 / 52 / 12 según el período).")
+    parser.add_argument("--interval", type=float,
+                        default=float(os.getenv("FORECAST_INTERVAL", "0.9")),
+                        help="Cobertura del intervalo de pronóstico.")
+    parser.add_argument("--refit-every", type=int,
+                        default=int(os.getenv("FORECAST_REFIT_EVERY", "8")),
+                        help="Períodos nuevos tras los que se vuelve a ajustar la grilla α × β.")
+    parser.add_argument("--full", action="store_true",
+                        help="Reajusta todas las series con toda la historia.")
+    args = parser.parse_args()
+
+    print("\n--- [Paso 80] Pronóstico de demanda ---")
+    warehouse_path = WAREHOUSE_PATH
+
+    con = connect_warehouse(warehouse_path)
+    t0 = time.perf_counter()
+    try:
+        with stage("forecast") as m:
+            summary = forecast_demand(con, source=args.source, period=args.period,
+                                      horizon=args.horizon, season=args.season,
+                                      interval=args.interval, full=args.full,
+                                      refit_every=args.refit_every)
+            m.update(rows_out=summary["n_series"] * args.horizon, mode=summary["mode"],
+                     n_new_periods=summary["n_new_periods"])
+    except duckdb.CatalogException as e:
+        print(f"🔥 Faltan los snapshots de ventas, productos o adset_simulation: {e}")
+        print("➡️ Ejecuta primero los pasos 10 y 30.")
+        con.abort()
+        exit(1)
+    elapsed = time.perf_counter() - t0
+
+    print(f"✅ {summary['n_series']:,} series · {summary['n_new_periods']:,} períodos nuevos "
+          f"({summary['mode']}) en {elapsed:.2f}s · último período {summary['last_period']} · "
+          f"{summary['n_seasonal']:,} con naive estacional")
+
+    with stage("export") as m:
+        export_all(con, export_specs(
+            f"(SELECT * FROM mart.snap_demand_forecast WHERE source = '{args.source}')",
+            f"out/snap_demand_forecast_{args.source}",
+            order_by=["product_id", "horizon"], round_digits=2))
+        top = con.execute("""
+            SELECT product_id, model, sum(forecast) AS forecast, sum(lower) AS lower,
+                   sum(upper) AS upper
+            FROM mart.snap_demand_forecast WHERE source = ?
+            GROUP BY product_id, model ORDER BY forecast DESC LIMIT 20
+        """, [args.source]).fetch_df()
+        m["rows_out"] = summary["n_series"] * args.horizon
+    con.close()
+
+    print(f"\n--- Top 20 productos por demanda pronosticada ({args.horizon} períodos) ---")
+    print(top.to_string(index=False))
+    print(f"\n✅ mart.snap_demand_forecast / out/snap_demand_forecast_{args.source}.(parquet|csv)")
+    print("\n--- [Paso 80] Pronóstico completado. ---")
@@ -0,0 +1,149 @@
+# src/pipeline/run_pipeline.py
+# Ejecuta el pipeline completo como un DAG:
+#
+#   extract (10) ─┬─> mart (30) ─┬─> kpis (20)
+#                 │              ├─> product_kpis (50)
+#                 │              ├─> forecast (80)
+#                 │              └─────────────────────┐
+#                 └─> ads (step11) ─┬─> budget_scenarios (60)
+#                                   └─> inventory (70) <┘
+#
+# Uso: python -m src.pipeline.run_pipeline [--force] [--only paso ...] [--jobs N] [--dry-run]
+#      python -m src.pipeline.run_pipeline --load-metrics   (métricas de scripts sueltos)
+import os
+import time
+import argparse
+
+from ..utils import perf
+from ..utils.dag import run_dag
+from ..utils.raw_store import RAW_DIR
+from ..utils.warehouse import WAREHOUSE_PATH
+
+EXTRACT_TABLES = ["products", "suppliers", "campaigns", "adsets", "adset_product",
+                  "adset_simulation", "ad_simulation", "sales"]
+# La huella remota (conteo + máximo de created_at / run_ts) no ve las ediciones en el
+# sitio de las tablas sin updated_at: la extracción se repite igual pasado este plazo
+EXTRACT_MAX_AGE = float(os.getenv("PIPELINE_EXTRACT_MAX_AGE", "86400"))
+
+# warehouse: "read" / "write" si el paso abre el warehouse (un solo escritor a la vez;
+# los lectores usan la versión publicada y no esperan)
+STEPS = {
+    "extract": {
+        "cmd": ["-m", "src.pipeline.10_extract_supabase"],
+        "source": "src/pipeline/10_extract_supabase.py",
+        "remote": EXTRACT_TABLES,
+        "max_age": EXTRACT_MAX_AGE,
+        "outputs": [f"{RAW_DIR}/_manifest.json"],
+        "warehouse": "read",
+    },
+    "mart": {
+        "cmd": ["-m", "src.pipeline.30_build_mart"],
+        "source": "src/pipeline/30_build_mart.py",
+        "deps": ["extract"],
+        "inputs": [f"{RAW_DIR}/*.parquet", f"{RAW_DIR}/_manifest.json"],
+        "warehouse": "write",
+    },
+    "kpis": {
+        "cmd": ["-m", "src.pipeline.20_build_kpis"],
+        "source": "src/pipeline/20_build_kpis.py",
+        "deps": ["mart"],
+        "outputs": ["out/kpi_global.csv", "out/kpi_campaign.csv",
+                    "out/kpi_adset.csv", "out/top_10_products.csv"],
+        "warehouse": "read",
+    },
+    "ads": {
+        "cmd": ["src/step11_ads_snapshots.py"],
+        "source": "src/step11_ads_snapshots.py",
+        "deps": ["extract"],
+        "inputs": [f"{RAW_DIR}/ad_simulation.parquet"],
+        "outputs": ["out/snap_ads_kpis.parquet", "out/snap_ads_top5.parquet",
+                    "out/snap_budget_plan.parquet"],
+        "warehouse": "write",
+    },
+    "budget_scenarios": {
+        "cmd": ["-m", "src.pipeline.60_budget_scenarios"],
+        "source": "src/pipeline/60_budget_scenarios.py",
+        "deps": ["ads"],
+        "inputs": ["out/snap_ads_kpis.parquet"],
+        "outputs": ["out/snap_budget_scenarios.parquet"],
+        "warehouse": "write",
+    },
+    "product_kpis": {
+        "cmd": ["-m", "src.pipeline.50_extract_product_kpis"],
+        "source": "src/pipeline/50_extract_product_kpis.py",
+        "deps": ["mart"],
+        "outputs": ["out/snap_product_segments.parquet", "out/snap_product_segments.csv"],
+        "warehouse": "write",
+    },
+    "inventory": {
+        "cmd": ["-m", "src.pipeline.70_inventory_projection"],
+        "source": "src/pipeline/70_inventory_projection.py",
+        "deps": ["mart", "ads"],
+        "outputs": ["out/snap_inventory_projection.parquet",
+                    "out/snap_inventory_projection.csv"],
+        "warehouse": "write",
+    },
+    "forecast": {
+        "cmd": ["-m", "src.pipeline.80_demand_forecast"],
+        "source": "src/pipeline/80_demand_forecast.py",
+        "deps": ["mart"],
+        "outputs": ["out/snap_demand_forecast_sales.parquet",
+                    "out/snap_demand_forecast_sales.csv"],
+        "warehouse": "write",
+    },
+}
+
+
+def with_dependencies(names) -> list:
+    """Los pasos pedidos más todo lo que necesitan aguas arriba."""
+    selected, stack = set(), list(names)
+    while stack:
+        name = stack.pop()
+        if name not in selected:
+            selected.add(name)
+            stack.extend(STEPS[name].get("deps", []))
+    return sorted(selected)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ejecuta el pipeline como DAG con caché.")
+    parser.add_argument("--only", nargs="+", choices=list(STEPS),
+                        help="Ejecuta solo estos pasos (y sus dependencias).")
+    parser.add_argument("--force", action="store_true",
+                        help="Ejecuta todos los pasos aunque sus entradas no hayan cambiado.")
+    parser.add_argument("--jobs", type=int, default=4, help="Pasos en paralelo como máximo.")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Muestra qué pasos se ejecutarían, sin ejecutarlos.")
+    parser.add_argument("--load-metrics", action="store_true",
+                        help="Solo carga al warehouse las métricas del JSONL que aún no están "
+                             "(p. ej. de pasos ejecutados a mano) y termina.")
+    args = parser.parse_args()
+
+    if args.load_metrics:
+        n = perf.load_metrics(WAREHOUSE_PATH)
+        print(f"📈 {n} etapas cargadas en mart.pipeline_stage_metrics desde {perf.METRICS_PATH}")
+        exit(0)
+
+    print(f"\n--- Pipeline (DAG) · run {perf.RUN_ID} ---")
+    # Los pasos heredan el run_id y solo escriben sus métricas al JSONL; el volcado
+    # al warehouse se hace aquí, cuando ya no hay pasos escribiendo en él
+    os.environ["PIPELINE_RUN_ID"] = perf.RUN_ID
+    t0 = time.perf_counter()
+    selected = with_dependencies(args.only) if args.only else None
+    with perf.stage("dag") as m:
+        status = run_dag(STEPS, jobs=args.jobs, force=args.force, selected=selected,
+                         dry_run=args.dry_run)
+        m.update({name: result for name, result in status.items()})
+    elapsed = time.perf_counter() - t0
+
+    # Una sola escritura al final, y solo si algún paso corrió
+    records = perf.read_jsonl(perf.RUN_ID)
+    if not args.dry_run and any(r["script"] != "run_pipeline" for r in records):
+        n = perf.load_metrics(WAREHOUSE_PATH, run_id=perf.RUN_ID)
+        print(f"📈 {n} etapas registradas en mart.pipeline_stage_metrics")
+
+    print(f"\n--- Resumen ({elapsed:.2f}s) ---")
+    for name, result in status.items():
+        print(f" - {name}: {result}")
+    if any(result in ("failed", "blocked") for result in status.values()):
+        exit(1)
@@ -0,0 +1,35 @@
+# src/serve_kpis.py
+# Servicio local de KPIs sobre warehouse.duckdb (ver utils/kpi_service): los
+# dashboards piden JSON o Arrow por HTTP en lugar de relanzar scripts y leer out/.
+#
+# Uso: python -m src.serve_kpis [--host 127.0.0.1] [--port 8765]
+#      curl 'http://127.0.0.1:8765/kpi/campaign?run_ts=latest'
+import os
+import asyncio
+import argparse
+from .utils.kpi_service import KpiService, ENDPOINTS
+from .utils.warehouse import WAREHOUSE_PATH, current_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servicio HTTP de KPIs del warehouse.")
+    parser.add_argument("--host", default=os.getenv("KPI_SERVICE_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("KPI_SERVICE_PORT", "8765")))
+    parser.add_argument("--warehouse", default=WAREHOUSE_PATH)
+    parser.add_argument("--pool-size", type=int, default=int(os.getenv("KPI_POOL_SIZE", "4")),
+                        help="Consultas simultáneas contra DuckDB.")
+    parser.add_argument("--cache-size", type=int, default=int(os.getenv("KPI_CACHE_SIZE", "256")),
+                        help="Respuestas guardadas en el LRU.")
+    args = parser.parse_args()
+
+    if not os.path.exists(current_path(args.warehouse)):
+        print(f"🔥 No existe {args.warehouse}. Ejecuta primero el pipeline.")
+        exit(1)
+
+    service = KpiService(args.warehouse, pool_size=args.pool_size, cache_size=args.cache_size)
+    print(f"🚀 Servicio de KPIs en http://{args.host}:{args.port}")
+    print(f"   Endpoints: {', '.join(f'/kpi/{e}' for e in ENDPOINTS)}, /health")
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        print("\n--- Servicio de KPIs detenido. ---")
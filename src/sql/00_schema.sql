@@ -45,14 +45,243 @@ create table if not exists public.adset_simulation (
   created_at   timestamptz not null default now()
 );
 
+-- Resultados de simulación por anuncio (una corrida = un run_ts)
+create table if not exists public.ad_simulation (
+  run_ts       text   not null,
+  ad_id        bigint not null,
+  campaign_id  bigint not null references public.campaigns(campaign_id) on delete cascade,
+  adset_name   text   not null,
+  category_id  bigint,
+  sku          text   not null,
+  budget       numeric not null default 0,
+  cpc          numeric not null default 0,
+  aov          numeric not null default 0,
+  clicks       numeric not null default 0,
+  conversions  numeric not null default 0,
+  impresions   numeric not null default 0,
+  created_at   timestamptz not null default now(),
+  primary key (run_ts, ad_id)
+);
+
+-- Ventas
+create table if not exists public.sales (
+  sale_id     bigserial primary key,
+  product_id  bigint  not null references public.products(product_id) on delete cascade,
+  qty         integer not null check (qty > 0),
+  unit_price  numeric not null check (unit_price >= 0),
+  created_at  timestamptz not null default now()
+);
+
 -- Índices recomendados
 create index if not exists idx_adset_sim_run_ts       on public.adset_simulation(run_ts);
 create index if not exists idx_adset_sim_campaign     on public.adset_simulation(campaign_id);
 create index if not exists idx_adset_sim_product      on public.adset_simulation(product_id);
 create index if not exists idx_adset_sim_campaign_prod on public.adset_simulation(campaign_id, product_id);
+create index if not exists idx_sales_product          on public.sales(product_id);
+create index if not exists idx_sales_created_at       on public.sales(created_at);
+
+-- =========================
+-- Registro de corridas de simulación
+-- =========================
+
+-- Una fila por (tabla, run_ts) con el run_ts tipado, filas y estado. La mantienen
+-- triggers por sentencia: el último run sale del índice, sin max(run_ts) sobre la
+-- tabla de resultados.
+create table if not exists public.simulation_runs (
+  source      text        not null,               -- 'adset_simulation' | 'ad_simulation'
+  run_ts      text        not null,
+  run_at      timestamptz,                        -- null si run_ts no es una fecha
+  n_rows      bigint      not null default 0,
+  status      text        not null default 'loaded'
+              check (status in ('loaded', 'empty', 'failed')),
+  created_at  timestamptz not null default now(),
+  updated_at  timestamptz not null default now(),
+  primary key (source, run_ts)
+);
+
+-- Cubre la búsqueda del último run (index-only scan, una sola fila)
+create index if not exists idx_simulation_runs_latest
+  on public.simulation_runs (source, run_at desc nulls last, run_ts desc)
+  include (n_rows)
+  where status = 'loaded';
+
+-- run_ts del simulador Monte Carlo: '<inicio>#<nº de corrida>' (el sufijo no es fecha)
+create or replace function public.parse_run_ts(p_run_ts text)
+returns timestamptz language plpgsql stable as $$
+begin
+  return split_part(p_run_ts, '#', 1)::timestamptz;
+exception when others then
+  return null;
+end $$;
+
+-- Suma / resta las filas de cada run insertado o borrado (tablas de transición:
+-- un COPY de millones de filas dispara una sola agregación)
+create or replace function public.register_simulation_runs()
+returns trigger language plpgsql as $$
+begin
+  if tg_op = 'INSERT' then
+    insert into public.simulation_runs as r (source, run_ts, run_at, n_rows)
+    select tg_table_name, run_ts, public.parse_run_ts(run_ts), count(*)
+    from new_rows
+    group by run_ts
+    on conflict (source, run_ts) do update
+      set n_rows = r.n_rows + excluded.n_rows, status = 'loaded', updated_at = now();
+  else
+    update public.simulation_runs as r
+       set n_rows = greatest(r.n_rows - d.n, 0),
+           status = case when r.n_rows - d.n > 0 then r.status else 'empty' end,
+           updated_at = now()
+      from (select run_ts, count(*) as n from old_rows group by run_ts) as d
+     where r.source = tg_table_name and r.run_ts = d.run_ts;
+  end if;
+  return null;
+end $$;
+
+create or replace function public.clear_simulation_runs()
+returns trigger language plpgsql as $$
+begin
+  delete from public.simulation_runs where source = tg_table_name;
+  return null;
+end $$;
+
+drop trigger if exists trg_adset_sim_runs_ins on public.adset_simulation;
+create trigger trg_adset_sim_runs_ins after insert on public.adset_simulation
+  referencing new table as new_rows
+  for each statement execute function public.register_simulation_runs();
+drop trigger if exists trg_adset_sim_runs_del on public.adset_simulation;
+create trigger trg_adset_sim_runs_del after delete on public.adset_simulation
+  referencing old table as old_rows
+  for each statement execute function public.register_simulation_runs();
+drop trigger if exists trg_adset_sim_runs_trunc on public.adset_simulation;
+create trigger trg_adset_sim_runs_trunc after truncate on public.adset_simulation
+  for each statement execute function public.clear_simulation_runs();
+
+drop trigger if exists trg_ad_sim_runs_ins on public.ad_simulation;
+create trigger trg_ad_sim_runs_ins after insert on public.ad_simulation
+  referencing new table as new_rows
+  for each statement execute function public.register_simulation_runs();
+drop trigger if exists trg_ad_sim_runs_del on public.ad_simulation;
+create trigger trg_ad_sim_runs_del after delete on public.ad_simulation
+  referencing old table as old_rows
+  for each statement execute function public.register_simulation_runs();
+drop trigger if exists trg_ad_sim_runs_trunc on public.ad_simulation;
+create trigger trg_ad_sim_runs_trunc after truncate on public.ad_simulation
+  for each statement execute function public.clear_simulation_runs();
+
+-- Recuento desde las tablas (corridas cargadas antes de existir los triggers)
+insert into public.simulation_runs (source, run_ts, run_at, n_rows)
+select 'adset_simulation', run_ts, public.parse_run_ts(run_ts), count(*)
+from public.adset_simulation group by run_ts
+union all
+select 'ad_simulation', run_ts, public.parse_run_ts(run_ts), count(*)
+from public.ad_simulation group by run_ts
+on conflict (source, run_ts) do update
+  set n_rows = excluded.n_rows, status = 'loaded', updated_at = now();
+
+-- =========================
+-- RPC: filas de una corrida en una sola llamada
+-- =========================
+
+-- run_ts del último run cargado de una tabla (búsqueda en idx_simulation_runs_latest)
+create or replace function public.latest_simulation_run(p_source text)
+returns text language sql stable as $$
+  select run_ts
+  from public.simulation_runs
+  where source = p_source and status = 'loaded'
+  order by run_at desc nulls last, run_ts desc
+  limit 1
+$$;
+
+-- Filas del run pedido (o del último si p_run_ts es null); el filtro por run_ts usa
+-- idx_adset_sim_run_ts / la PK (run_ts, ad_id)
+create or replace function public.adset_simulation_run(p_run_ts text default null)
+returns setof public.adset_simulation language sql stable as $$
+  select *
+  from public.adset_simulation
+  where run_ts = coalesce(p_run_ts, public.latest_simulation_run('adset_simulation'))
+$$;
+
+create or replace function public.ad_simulation_run(p_run_ts text default null)
+returns setof public.ad_simulation language sql stable as $$
+  select *
+  from public.ad_simulation
+  where run_ts = coalesce(p_run_ts, public.latest_simulation_run('ad_simulation'))
+$$;
 
 -- Vista simple (opcional) del último run
 create or replace view public.v_adset_sim_last as
 select *
+from public.adset_simulation_run();
+
+-- =========================
+-- KPIs materializados (20_build_kpis --server-kpis)
+-- =========================
+
+-- Grano fino campaña × adset × producto: su tamaño depende de las dimensiones, no del
+-- número de corridas. Las impresiones se simulan con un CTR uniforme en [0.01, 0.10)
+-- derivado de un hash de la fila (no de random()), así un REFRESH CONCURRENTLY solo
+-- reescribe los grupos que cambiaron.
+create materialized view if not exists public.mv_kpi_fine as
+select campaign_id, adset_name, product_id,
+       sum(budget)      as total_budget,
+       sum(clicks)      as total_clicks,
+       sum(floor(clicks / (0.01 + 0.09 * ((hashtext(run_ts || '|' || adset_name || '|' || product_id)
+                                            & 2147483647) / 2147483648.0))))
+                        as total_impressions,
+       sum(conversions) as total_conversions,
+       sum(revenue)     as total_revenue,
+       sum(margin)      as total_margin,
+       count(*)         as n_rows
 from public.adset_simulation
-where run_ts = (select max(run_ts) from public.adset_simulation);
+group by campaign_id, adset_name, product_id;
+
+create materialized view if not exists public.mv_kpi_adset as
+select adset_name, campaign_id,
+       sum(total_budget) as total_budget, sum(total_clicks) as total_clicks,
+       sum(total_impressions) as total_impressions, sum(total_conversions) as total_conversions,
+       sum(total_revenue) as total_revenue, sum(total_margin) as total_margin
+from public.mv_kpi_fine
+group by adset_name, campaign_id;
+
+create materialized view if not exists public.mv_kpi_campaign as
+select campaign_id,
+       sum(total_budget) as total_budget, sum(total_clicks) as total_clicks,
+       sum(total_impressions) as total_impressions, sum(total_conversions) as total_conversions,
+       sum(total_revenue) as total_revenue, sum(total_margin) as total_margin
+from public.mv_kpi_fine
+group by campaign_id;
+
+create materialized view if not exists public.mv_kpi_product as
+select product_id,
+       sum(total_budget) as total_budget, sum(total_clicks) as total_clicks,
+       sum(total_impressions) as total_impressions, sum(total_conversions) as total_conversions,
+       sum(total_revenue) as total_revenue, sum(total_margin) as total_margin
+from public.mv_kpi_fine
+group by product_id;
+
+-- Una sola fila; la columna grain existe para el índice único que exige CONCURRENTLY
+create materialized view if not exists public.mv_kpi_global as
+select 'global'::text as grain,
+       coalesce(sum(total_budget), 0) as total_budget, coalesce(sum(total_clicks), 0) as total_clicks,
+       coalesce(sum(total_impressions), 0) as total_impressions,
+       coalesce(sum(total_conversions), 0) as total_conversions,
+       coalesce(sum(total_revenue), 0) as total_revenue, coalesce(sum(total_margin), 0) as total_margin
+from public.mv_kpi_fine;
+
+create unique index if not exists ux_mv_kpi_fine     on public.mv_kpi_fine(campaign_id, adset_name, product_id);
+create unique index if not exists ux_mv_kpi_adset    on public.mv_kpi_adset(campaign_id, adset_name);
+create unique index if not exists ux_mv_kpi_campaign on public.mv_kpi_campaign(campaign_id);
+create unique index if not exists ux_mv_kpi_product  on public.mv_kpi_product(product_id);
+create unique index if not exists ux_mv_kpi_global   on public.mv_kpi_global(grain);
+
+-- Refresco sin bloquear a los lectores; primero el grano fino, del que salen los demás.
+-- Se llama tras cada carga de simulación (40_simulate_adsets --target postgres).
+create or replace function public.refresh_kpi_views()
+returns void language plpgsql as $$
+begin
+  refresh materialized view concurrently public.mv_kpi_fine;
+  refresh materialized view concurrently public.mv_kpi_adset;
+  refresh materialized view concurrently public.mv_kpi_campaign;
+  refresh materialized view concurrently public.mv_kpi_product;
+  refresh materialized view concurrently public.mv_kpi_global;
+end $$;
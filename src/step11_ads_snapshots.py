@@ -1,11 +1,18 @@
 # src/step11_ads_snapshots.py
-from utils.supa_client import get_client
 import os
 from pathlib import Path
 import duckdb
 import pandas as pd
 import numpy as np
 from utils.supa_client import get_client  # tu helper existente
+from utils.raw_store import raw_path
+from utils.kpi_engine import ad_kpis, top_n
+from utils.budget_optimizer import build_budget_plan, check_elasticity
+from utils.perf import stage
+from utils.marts import ADS_LEVELS, ADS_SOURCE, write_run_partition, update_run_aggregates
+from utils.exports import export_all, export_specs
+from utils.schema_registry import apply_dtypes, to_pandas
+from utils.warehouse import WAREHOUSE_PATH, connect_warehouse
 
 import sys
 import os
@@ -17,150 +24,141 @@ sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
 # -----------------------
 
 
-def ensure_out(p):
-    Path(p).parent.mkdir(parents=True, exist_ok=True)
-
-
-def to_csv(df, path):
-    ensure_out(path)
-    df = df.copy()
-    for c in df.select_dtypes(include="number").columns:
-        df[c] = df[c].astype(float).round(2)
-    # separador decimal punto (Sheets lo detecta bien)
-    df.to_csv(path, index=False)
+def load_last_run_from_raw(columns):
+    """
+    Último run desde la capa cruda (out/raw/ad_simulation.parquet), leyendo solo
+    las columnas necesarias; el filtro por run_ts se resuelve con las estadísticas
+    de los row groups. Devuelve None si el paso 10 aún no generó la tabla.
+    """
+    path = raw_path("ad_simulation")
+    if not os.path.exists(path):
+        return None
+    return to_pandas("ad_simulation", duckdb.sql(f"""
+        SELECT {', '.join(columns)}
+        FROM read_parquet('{path}')
+        WHERE run_ts = (SELECT max(run_ts) FROM read_parquet('{path}'))
+    """).fetch_arrow_table())
+
+
+def load_last_run_from_supabase(columns, page_size=1000):
+    """
+    Último run en una sola llamada: la función ad_simulation_run() resuelve el run_ts
+    con el registro public.simulation_runs y devuelve sus filas. Solo si el run no
+    cabe en una página se piden más, fijando el run_ts de la primera.
+    """
+    sb = get_client()
+    rows, run_ts = [], None
+    while True:
+        params = {"p_run_ts": run_ts} if run_ts else {}
+        page = (
+            sb.rpc("ad_simulation_run", params)
+              .select(", ".join(columns))
+              .order("ad_id")
+              .range(len(rows), len(rows) + page_size - 1)
+              .execute()
+        ).data
+        rows.extend(page)
+        if len(page) < page_size:
+            break
+        run_ts = page[0]["run_ts"]
+    if not rows:
+        raise SystemExit("No hay datos en ad_simulation.")
+    return apply_dtypes("ad_simulation", pd.DataFrame(rows))
 
 
 # -----------------------
 # 1) Cargar últimos anuncios simulados
 # -----------------------
-sb = get_client()
-last = (
-    sb.table("ad_simulation")
-      .select("run_ts")
-      .order("run_ts", desc=True)
-      .limit(1)
-      .execute()
-)
-if not last.data:
-    raise SystemExit("No hay datos en ad_simulation.")
-run_ts = last.data[0]["run_ts"]
-
-rows = (
-    sb.table("ad_simulation")
-      .select("ad_id, run_ts, campaign_id, adset_name, budget, cpc, aov, clicks, conversions, category_id, sku, impresions")
-      .eq("run_ts", run_ts)
-      .execute()
-).data
-
-ads = pd.DataFrame(rows)
-if ads.empty:
-    raise SystemExit("Último run vacío en ad_simulation.")
-
-# Normaliza y llena nulos razonables
-num_cols = ["budget", "cpc", "aov", "clicks", "conversions", "impresions"]
-for c in num_cols:
-    ads[c] = pd.to_numeric(ads[c], errors="coerce").fillna(0.0)
+AD_COLUMNS = ["ad_id", "run_ts", "campaign_id", "adset_name", "budget", "cpc", "aov",
+              "clicks", "conversions", "category_id", "sku", "impresions"]
+
+with stage("load_last_run") as m:
+    ads = load_last_run_from_raw(AD_COLUMNS)
+    if ads is None:
+        ads = load_last_run_from_supabase(AD_COLUMNS)
+    if ads.empty:
+        raise SystemExit("Último run vacío en ad_simulation.")
+    # Tipos y nulos ya normalizados al extraer (schema_registry)
+    m["rows_out"] = len(ads)
 
 # -----------------------
 # 2) KPIs por anuncio
 # -----------------------
-ads["ctr"] = np.where(ads["impresions"] > 0,
-                      ads["clicks"]/ads["impresions"], 0.0)
-ads["revenue"] = ads["conversions"] * ads["aov"]
-ads["cpa"] = np.where(ads["conversions"] > 0,
-                      ads["budget"]/ads["conversions"], np.nan)
-ads["roas"] = np.where(ads["budget"] > 0, ads["revenue"]/ads["budget"], np.nan)
-# margen “bruto” vs inversión
-ads["margin"] = ads["revenue"] - ads["budget"]
-ads["margin_pct"] = np.where(
-    ads["revenue"] > 0, ads["margin"]/ads["revenue"], np.nan)
-
-# Clasificaciones
-ads["class_profit"] = np.select(
-    [
-        ads["margin"] <= 0,
-        (ads["margin"].abs()/ads["revenue"].replace(0, np.nan)
-         ) <= 0.01,   # ±1% ~ break-even
-        ads["margin_pct"] >= 0.10
-    ],
-    ["no_rentable", "break_even", "rentable_10p"],
-    default="mixto"
-)
-
-# -----------------------
-# 3) Top 5 por rentabilidad (margen)
-# -----------------------
-top5 = ads.sort_values("margin", ascending=False).head(5)
+with stage("ad_kpis", rows_in=len(ads)) as m:
+    ads = ad_kpis(ads)
+
+    # Clasificaciones
+    ads["class_profit"] = np.select(
+        [
+            ads["margin"] <= 0,
+            (ads["margin"].abs()/ads["revenue"].replace(0, np.nan)
+             ) <= 0.01,   # ±1% ~ break-even
+            ads["margin_pct"] >= 0.10
+        ],
+        ["no_rentable", "break_even", "rentable_10p"],
+        default="mixto"
+    )
+
+    # -----------------------
+    # 3) Top 5 por rentabilidad (margen)
+    # -----------------------
+    top5 = top_n(ads, 5, "margin")
+    m["rows_out"] = len(ads)
 
 # -----------------------
-# 4) Reasignación de presupuesto a quienes explican 75% del revenue
-#    (Pareto simple, proporcional a su revenue dentro del grupo)
+# 4) Reasignación del presupuesto total con rendimientos decrecientes
+#    (curva cóncava por anuncio + igualación del ROAS marginal)
 # -----------------------
 TOTAL_BUDGET = float(ads["budget"].sum())
-ads_sorted_rev = ads.sort_values("revenue", ascending=False)
-cum_share = ads_sorted_rev["revenue"].cumsum(
-) / ads_sorted_rev["revenue"].sum().replace(0, np.nan)
-pareto_cut = ads_sorted_rev.loc[cum_share <= 0.75]
-if pareto_cut.empty:
-    # si no cumple, al menos el top 1
-    pareto_cut = ads_sorted_rev.head(1)
-
-# Nuevo presupuesto solo para el grupo Pareto, proporcional a su revenue
-weights = pareto_cut["revenue"] / \
-    pareto_cut["revenue"].sum().replace(0, np.nan)
-new_budget = weights * TOTAL_BUDGET
-
-plan = pareto_cut[["ad_id", "campaign_id", "adset_name", "sku",
-                   "budget", "revenue", "margin", "cpa", "roas", "ctr"]].copy()
-plan["new_budget"] = new_budget.values
-plan["delta_budget"] = plan["new_budget"] - plan["budget"]
-plan["delta_budget_pct"] = np.where(
-    plan["budget"] > 0, plan["delta_budget"]/plan["budget"], np.nan)
-
-# Nota: proyecciones simples manteniendo CPC/CTR/CVR constantes:
-# (si quieres, puedes afinar luego con elasticidades)
-plan["clicks_new"] = np.where(ads.set_index("ad_id").loc[plan["ad_id"], "cpc"].values > 0,
-                              plan["new_budget"]/ads.set_index("ad_id").loc[plan["ad_id"], "cpc"].values, 0.0)
-plan["conversions_new"] = plan["clicks_new"] * ads.set_index(
-    # ~ clicks / (budget/conversions)
-    "ad_id").loc[plan["ad_id"], "cpa"].rpow(-1).values
-plan["revenue_new"] = plan["conversions_new"] * \
-    ads.set_index("ad_id").loc[plan["ad_id"], "aov"].values
-plan["margin_new"] = plan["revenue_new"] - plan["new_budget"]
-plan["delta_revenue"] = plan["revenue_new"] - plan["revenue"]
-plan["delta_margin"] = plan["margin_new"] - plan["margin"]
+ELASTICITY = check_elasticity(os.getenv("BUDGET_ELASTICITY", "0.6"))
+MIN_MULT = float(os.getenv("BUDGET_MIN_MULT", "0.0"))
+MAX_MULT = float(os.getenv("BUDGET_MAX_MULT", "3.0"))
+
+with stage("budget_plan", rows_in=len(ads)) as m:
+    plan = build_budget_plan(ads, TOTAL_BUDGET, elasticity=ELASTICITY,
+                             min_mult=MIN_MULT, max_mult=MAX_MULT)
+    m["rows_out"] = len(plan)
 
 # -----------------------
 # 5) Guardar snapshots en DuckDB + CSV para Looker
 # -----------------------
 Path("out").mkdir(exist_ok=True, parents=True)
-con = duckdb.connect("warehouse.duckdb")
+con = connect_warehouse(WAREHOUSE_PATH)
 con.execute("CREATE SCHEMA IF NOT EXISTS mart;")
 
-# Materializamos
-con.register("ads_df", ads)
-con.register("top5_df", top5)
-con.register("plan_df", plan)
-
-con.execute("CREATE OR REPLACE TABLE mart.snap_ads_kpis AS SELECT * FROM ads_df;")
-con.execute(
-    "CREATE OR REPLACE TABLE mart.snap_ads_top5 AS SELECT * FROM top5_df;")
-con.execute(
-    "CREATE OR REPLACE TABLE mart.snap_budget_plan AS SELECT * FROM plan_df;")
-
-# Parquet (rápido) y CSV (para Looker/GSheets)
-con.execute(
-    "COPY mart.snap_ads_kpis   TO 'out/snap_ads_kpis.parquet'   (FORMAT PARQUET);")
-con.execute(
-    "COPY mart.snap_ads_top5   TO 'out/snap_ads_top5.parquet'   (FORMAT PARQUET);")
-con.execute(
-    "COPY mart.snap_budget_plan TO 'out/snap_budget_plan.parquet' (FORMAT PARQUET);")
-
-to_csv(ads,  "out/snap_ads_kpis.csv")
-to_csv(top5, "out/snap_ads_top5.csv")
-to_csv(plan, "out/snap_budget_plan.csv")
-
-print("✅ Snapshots listos:")
+# Materializamos: cada corrida es una partición (run_ts) de las tablas del mart; solo
+# se reemplaza la del run actual y se conservan las anteriores para comparar
+RUN_TS = str(ads["run_ts"].iloc[0])
+plan.insert(0, "run_ts", RUN_TS)
+n_rows = len(ads) + len(top5) + len(plan)
+with stage("write_mart", rows_in=n_rows):
+    con.register("ads_df", ads)
+    con.register("top5_df", top5)
+    con.register("plan_df", plan)
+
+    con.execute("BEGIN TRANSACTION")
+    write_run_partition(con, "mart.snap_ads_kpis", "ads_df", RUN_TS)
+    write_run_partition(con, "mart.snap_ads_top5", "top5_df", RUN_TS)
+    write_run_partition(con, "mart.snap_budget_plan", "plan_df", RUN_TS)
+    con.execute("COMMIT")
+
+    # Totales por corrida / acumulados por campaña y adset (solo esta partición)
+    update_run_aggregates(con, ADS_SOURCE, ADS_LEVELS, runs={RUN_TS})
+
+# Parquet (rápido) y CSV redondeado a 2 decimales (para Looker/GSheets), solo del run
+# actual; en paralelo y sin reescribir los archivos que no cambiaron
+with stage("export", rows_in=n_rows) as m:
+    exports = export_all(con, [
+        *export_specs(ads, "out/snap_ads_kpis", round_digits=2),
+        *export_specs(top5, "out/snap_ads_top5", round_digits=2),
+        *export_specs(plan, "out/snap_budget_plan", round_digits=2),
+    ])
+    m["written"] = sum(s == "written" for s in exports.values())
+con.close()
+
+print(f"✅ Snapshots listos ({m['written']}/{len(exports)} archivos reescritos, "
+      "el resto sin cambios):")
+print(f" - run_ts = {RUN_TS} (partición)")
 print(" - mart.snap_ads_kpis / out/snap_ads_kpis.(parquet|csv)")
 print(" - mart.snap_ads_top5 / out/snap_ads_top5.(parquet|csv)")
 print(" - mart.snap_budget_plan / out/snap_budget_plan.(parquet|csv)")
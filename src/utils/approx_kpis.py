@@ -0,0 +1,389 @@
+# src/utils/approx_kpis.py
+# Modo aproximado de los KPIs de 30_build_mart, para previsualizar corridas enormes
+# sin recorrer toda snapshot_adset_simulation:
+#
+#   1. Estratos = campañas. Su tamaño N_h sale de mart.kpi_cum_campaign (n_rows), sin
+#      leer la simulación; si el mart no cuadra con el snapshot se cuenta con un GROUP BY.
+#   2. Muestra: TABLESAMPLE de DuckDB a la tasa pedida. "system" toma vectores enteros
+#      (2048 filas) y se salta el resto del archivo; "bernoulli" toma filas sueltas pero
+#      lee toda la tabla. Una campaña que queda con menos de `min_units` unidades
+#      (vectores o filas) se lee completa (censo): así ninguna queda sin estimar.
+#   3. Estimación post-estratificada: cada fila pesa N_h / n_h. Los totales salen de
+#      sumas ponderadas y las razones (CPA, ROAS, CPC, CTR) llevan su intervalo de
+#      confianza por linealización (método delta), con las unidades como conglomerados:
+#
+#          e_u = w_h · Σ_{i∈u} (y_i - R·x_i)
+#          Var(R) ≈ Σ_h (1 - f_h) · m_h / (m_h - 1) · Σ_u (e_u - ē_h)² / X²
+#
+#      con m_h las unidades muestreadas del estrato y f_h su fracción (censo: f_h = 1,
+#      sin error). Las filas de un vector suelen ser de la misma corrida y adset, por eso
+#      el error se mide entre vectores y no entre filas.
+#   4. Cuantiles por campaña (approx_quantile) del ROAS y el CPC fila a fila: dentro de
+#      un estrato todas las filas tienen la misma probabilidad, así que la muestra sirve
+#      tal cual.
+#   5. Corridas y adsets distintos por campaña con approx_count_distinct (HyperLogLog)
+#      sobre mart.kpi_run_adset, que tiene una fila por corrida × adset y se publica
+#      junto con los snapshots; sin el mart, sobre la simulación completa. Una muestra
+#      no sirve para contar distintos (no ve los que no cayeron en ella).
+#
+# Con `target_error` la tasa se elige sola: una muestra piloto mide el error relativo
+# del ROAS global y, si no alcanza, se vuelve a muestrear con la tasa necesaria
+# (la varianza escala con (1 - f) / f).
+import os
+from statistics import NormalDist
+
+import duckdb
+import numpy as np
+import pandas as pd
+import pyarrow.compute as pc
+
+from .kpi_engine import MEASURES, TOTALS, RATIO_TERMS, add_ratios, safe_div, top_n
+
+APPROX_SAMPLE_RATE = float(os.getenv("APPROX_SAMPLE_RATE", "0.01"))
+APPROX_TARGET_ERROR = float(os.getenv("APPROX_TARGET_ERROR", "0") or 0) or None
+APPROX_CONFIDENCE = float(os.getenv("APPROX_CONFIDENCE", "0.95"))
+APPROX_MIN_UNITS = int(os.getenv("APPROX_MIN_UNITS", "5"))
+APPROX_METHOD = os.getenv("APPROX_METHOD", "system")
+APPROX_MAX_RATE = float(os.getenv("APPROX_MAX_RATE", "0.1"))
+
+SAMPLE_METHODS = ("system", "bernoulli")
+VECTOR_SIZE = 2048  # filas por vector de DuckDB: la unidad del muestreo "system"
+
+SOURCE = "snapshot_adset_simulation"
+SAMPLE_TABLE = "approx_sample"
+
+# Columnas de la muestra (mismas impresiones simuladas que el modo exacto)
+SAMPLE_COLUMNS = """
+    campaign_id, adset_name, product_id,
+    budget::DOUBLE AS budget, clicks::DOUBLE AS clicks,
+    (clicks / (random() * 0.09 + 0.01))::INTEGER::DOUBLE AS impressions,
+    conversions::DOUBLE AS conversions, revenue::DOUBLE AS revenue, margin::DOUBLE AS margin
+"""
+
+
+def stratum_sizes(con) -> pd.DataFrame:
+    """Filas por campaña (N_h). Del mart acumulado si cuadra con el snapshot."""
+    total = con.execute(f"SELECT count(*) FROM {SOURCE}").fetchone()[0]
+    try:
+        sizes = con.execute("""
+            SELECT campaign_id, n_rows FROM mart.kpi_cum_campaign WHERE n_rows > 0
+        """).df()
+    except duckdb.CatalogException:
+        sizes = None
+    if sizes is None or int(sizes["n_rows"].sum()) != total:
+        sizes = con.execute(f"""
+            SELECT campaign_id, count(*) AS n_rows FROM {SOURCE} GROUP BY campaign_id
+        """).df()
+    return sizes
+
+
+def t_quantile(confidence: float, df) -> np.ndarray:
+    """
+    Cuantil bilateral de la t de Student (expansión de Cornish-Fisher sobre la normal,
+    sin scipy): con pocas unidades el intervalo normal se queda corto.
+    """
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    df = np.maximum(np.asarray(df, dtype=float), 1.0)
+    g1 = (z ** 3 + z) / 4
+    g2 = (5 * z ** 5 + 16 * z ** 3 + 3 * z) / 96
+    g3 = (3 * z ** 7 + 19 * z ** 5 + 17 * z ** 3 - 15 * z) / 384
+    g4 = (79 * z ** 9 + 776 * z ** 7 + 1482 * z ** 5 - 1920 * z ** 3 - 945 * z) / 92160
+    return z + g1 / df + g2 / df ** 2 + g3 / df ** 3 + g4 / df ** 4
+
+
+def _id_list(ids) -> str:
+    return ", ".join(str(int(i)) for i in ids)
+
+
+def draw_sample(con, sizes: pd.DataFrame, rate: float, method: str = APPROX_METHOD,
+                min_units: int = APPROX_MIN_UNITS, seed: int = 42) -> pd.DataFrame:
+    """
+    Deja la muestra en la tabla temporal approx_sample (filas con su unidad de
+    muestreo) y devuelve los estratos con n_rows, n_sampled, units, fraction,
+    weight (N_h / n_h) y fpc ((1 - f_h) · m_h / (m_h - 1), 0 en los censos).
+    """
+    if method not in SAMPLE_METHODS:
+        raise ValueError(f"Método de muestreo no soportado: {method} "
+                         f"({', '.join(SAMPLE_METHODS)})")
+    min_units = max(int(min_units), 2)
+    strata = sizes[["campaign_id", "n_rows"]].copy()
+    # Censo directo: campañas que ni con una unidad por fila llegarían a min_units, y
+    # las que no pesan más que la muestra media por campaña (leerlas enteras es barato)
+    cheap = rate * strata["n_rows"].sum() / max(len(strata), 1)
+    census = set(strata.loc[(strata["n_rows"] * rate < min_units)
+                            | (strata["n_rows"] <= cheap), "campaign_id"])
+    if rate >= 1:
+        census = set(strata["campaign_id"])
+    unit = f"rowid // {VECTOR_SIZE}" if method == "system" else "rowid"
+    con.execute("SELECT setseed(?)", [(int(seed) % 1000) / 1000])
+
+    skip = f"WHERE campaign_id NOT IN ({_id_list(census)})" if census else ""
+    sample = (f"{SOURCE} TABLESAMPLE {rate * 100:.6f}% ({method}, {int(seed)}) {skip}"
+              if len(census) < len(strata) else f"{SOURCE} LIMIT 0")
+    con.execute(f"""
+        CREATE OR REPLACE TEMP TABLE {SAMPLE_TABLE} AS
+        SELECT {SAMPLE_COLUMNS}, {unit} AS unit FROM {sample}
+    """)
+    sampled = con.execute(f"""
+        SELECT campaign_id, count(*) AS n_sampled, count(DISTINCT unit) AS units
+        FROM {SAMPLE_TABLE} GROUP BY campaign_id
+    """).df()
+    strata = strata.merge(sampled, on="campaign_id", how="left").fillna(
+        {"n_sampled": 0, "units": 0})
+
+    # Campañas que cayeron en muy pocas unidades: se vuelven a muestrear solas a una
+    # tasa mayor (el costo sigue siendo proporcional a la tasa); al llegar al 100%, censo
+    short = set(strata.loc[strata["units"] < min_units, "campaign_id"]) - census
+    boost = rate
+    while short:
+        con.execute(f"DELETE FROM {SAMPLE_TABLE} WHERE campaign_id IN ({_id_list(short)})")
+        boost = min(1.0, boost * 4)
+        cheap = boost * strata["n_rows"].sum() / len(strata)
+        to_census = short if boost >= 1 else set(strata.loc[
+            strata["campaign_id"].isin(short) & (strata["n_rows"] <= cheap), "campaign_id"])
+        census |= to_census
+        short -= to_census
+        if not short:
+            break
+        con.execute(f"""
+            INSERT INTO {SAMPLE_TABLE}
+            SELECT {SAMPLE_COLUMNS}, {unit} AS unit
+            FROM {SOURCE} TABLESAMPLE {boost * 100:.6f}% ({method}, {int(seed)})
+            WHERE campaign_id IN ({_id_list(short)})
+        """)
+        redrawn = con.execute(f"""
+            SELECT campaign_id, count(*) AS n_sampled, count(DISTINCT unit) AS units
+            FROM {SAMPLE_TABLE} WHERE campaign_id IN ({_id_list(short)}) GROUP BY campaign_id
+        """).df().set_index("campaign_id")
+        is_short = strata["campaign_id"].isin(short)
+        strata.loc[is_short, ["n_sampled", "units"]] = (
+            redrawn.reindex(strata.loc[is_short, "campaign_id"]).fillna(0).to_numpy())
+        short = set(strata.loc[is_short & (strata["units"] < min_units), "campaign_id"])
+    if census:
+        # Sin error de muestreo: toda la campaña cuenta como una sola unidad
+        con.execute(f"""
+            INSERT INTO {SAMPLE_TABLE}
+            SELECT {SAMPLE_COLUMNS}, 0 AS unit
+            FROM {SOURCE} WHERE campaign_id IN ({_id_list(census)})
+        """)
+        is_census = strata["campaign_id"].isin(census)
+        strata.loc[is_census, "n_sampled"] = strata.loc[is_census, "n_rows"]
+        strata.loc[is_census, "units"] = 1
+
+    strata["fraction"] = strata["n_sampled"] / strata["n_rows"]
+    strata["weight"] = safe_div(strata["n_rows"], strata["n_sampled"], 0.0)
+    strata["fpc"] = safe_div((1 - strata["fraction"]) * strata["units"], strata["units"] - 1, 0.0)
+    return strata.reset_index(drop=True)
+
+
+def load_sample(con, strata: pd.DataFrame) -> pd.DataFrame:
+    """
+    La muestra como DataFrame (adset_name categórico) con el índice de estrato `h`
+    y el código de unidad `u` (una unidad pertenece siempre a un solo estrato).
+    """
+    sample = con.execute(f"SELECT * FROM {SAMPLE_TABLE}").fetch_arrow_table()
+    sample = sample.set_column(sample.schema.get_field_index("adset_name"), "adset_name",
+                               pc.dictionary_encode(sample.column("adset_name")))
+    sample = sample.to_pandas()
+    sample["h"] = pd.Index(strata["campaign_id"]).get_indexer(sample["campaign_id"])
+    sample["u"] = pd.factorize(sample["unit"].to_numpy() * len(strata)
+                               + sample["h"].to_numpy())[0]
+    return sample
+
+
+def estimate_level(sample: pd.DataFrame, strata: pd.DataFrame, keys,
+                   confidence: float = APPROX_CONFIDENCE) -> pd.DataFrame:
+    """
+    Totales estimados al grano `keys` (lista vacía = global), razones con su
+    intervalo (<razón>_lo / <razón>_hi) e intervalo del ingreso total.
+
+    Todo con bincount sobre celdas (grupo × unidad): e_u se suma por celda, se
+    centra por estrato y la varianza se acumula con el fpc de cada estrato.
+    """
+    keys = list(keys)
+    n_strata = len(strata)
+    weight = strata["weight"].to_numpy(dtype=float)
+    fpc = strata["fpc"].to_numpy(dtype=float)
+    units = np.maximum(strata["units"].to_numpy(dtype=float), 1)
+
+    if not keys:
+        group = np.zeros(len(sample), dtype=np.int64)
+        out = pd.DataFrame(index=[0])
+    else:
+        if len(keys) == 1:
+            group, values = pd.factorize(sample[keys[0]], use_na_sentinel=False)
+            out = pd.DataFrame({keys[0]: values})
+        else:
+            group = (sample.groupby(keys, sort=False, observed=True, dropna=False)
+                           .ngroup().to_numpy())
+            first = np.unique(group, return_index=True)[1]
+            out = sample.iloc[first][keys].reset_index(drop=True)
+    n_groups = len(out)
+
+    # Celda = (grupo, unidad): ahí se suma e_u
+    h = sample["h"].to_numpy()
+    u = sample["u"].to_numpy()
+    n_units = int(u.max()) + 1 if len(u) else 0
+    unit_h = np.zeros(n_units, dtype=np.int64)
+    unit_h[u] = h
+    cell_codes, cell_keys = pd.factorize(group * n_units + u)
+    cell_group = cell_keys // max(n_units, 1)
+    cell_h = unit_h[cell_keys % max(n_units, 1)]
+    n_cells = len(cell_keys)
+    cell_w = weight[cell_h]
+
+    sums = {m: np.bincount(cell_codes, weights=sample[m].to_numpy(dtype=float),
+                           minlength=n_cells) for m in MEASURES}
+    for m, total in MEASURES.items():
+        out[total] = np.bincount(cell_group, weights=cell_w * sums[m], minlength=n_groups)
+    out["n_sampled"] = np.bincount(group, minlength=n_groups)
+    out = add_ratios(out)
+
+    # Grados de libertad por grupo: unidades muestreadas que lo tocan - estratos
+    sampled = fpc[cell_h] > 0
+    cell_strata = np.unique(cell_group[sampled] * n_strata + cell_h[sampled]) // n_strata
+    df_groups = (np.bincount(cell_group[sampled], minlength=n_groups)
+                 - np.bincount(cell_strata, minlength=n_groups))
+    q = t_quantile(confidence, df_groups)
+
+    def variance(e):
+        # Σ_h fpc_h · Σ_u (e_u - ē_h)², con las unidades sin filas del grupo en 0
+        cell = cell_group * n_strata + cell_h
+        s1 = np.bincount(cell, weights=e, minlength=n_groups * n_strata).reshape(n_groups, -1)
+        s2 = np.bincount(cell, weights=e * e, minlength=n_groups * n_strata).reshape(n_groups, -1)
+        return np.clip(((s2 - s1 * s1 / units) * fpc).sum(axis=1), 0, None)
+
+    source = {total: raw for raw, total in MEASURES.items()}
+    for name, (num, den) in RATIO_TERMS.items():
+        ratio = out[name].to_numpy()[cell_group]
+        e = cell_w * (sums[source[num]] - ratio * sums[source[den]])
+        den_total = out[den].to_numpy()
+        half = np.full(n_groups, np.nan)
+        np.divide(q * np.sqrt(variance(e)), den_total, out=half, where=den_total > 0)
+        out[f"{name}_lo"] = out[name] - half
+        out[f"{name}_hi"] = out[name] + half
+    half = q * np.sqrt(variance(cell_w * sums["revenue"]))
+    out["total_revenue_lo"] = out["total_revenue"] - half
+    out["total_revenue_hi"] = out["total_revenue"] + half
+    return out
+
+
+def campaign_quantiles(con, quantiles=(0.5, 0.9)) -> pd.DataFrame:
+    """Cuantiles aproximados por campaña del ROAS y el CPC fila a fila (sobre la muestra)."""
+    qs = list(quantiles)
+    df = con.execute(f"""
+        SELECT campaign_id,
+               approx_quantile(revenue / nullif(budget, 0), {qs}) AS roas,
+               approx_quantile(budget / nullif(clicks, 0), {qs}) AS cpc
+        FROM {SAMPLE_TABLE} GROUP BY campaign_id
+    """).df()
+    out = df[["campaign_id"]].copy()
+    for metric in ("roas", "cpc"):
+        values = np.array([v if v is not None else [np.nan] * len(qs) for v in df[metric]],
+                          dtype=float).reshape(len(df), len(qs))
+        for j, q in enumerate(qs):
+            out[f"{metric}_p{round(q * 100)}"] = values[:, j]
+    return out
+
+
+def distinct_counts(con) -> tuple:
+    """
+    (por campaña, global): n_runs y n_adsets aproximados (approx_count_distinct) en
+    una sola pasada con GROUPING SETS.
+    """
+    try:
+        con.execute("SELECT 1 FROM mart.kpi_run_adset LIMIT 0")
+        source = "mart.kpi_run_adset"
+    except duckdb.CatalogException:
+        source = SOURCE
+    df = con.execute(f"""
+        SELECT campaign_id, grouping(campaign_id) AS is_global,
+               approx_count_distinct(run_ts) AS n_runs,
+               approx_count_distinct(adset_name) AS n_adsets
+        FROM {source} GROUP BY GROUPING SETS ((campaign_id), ())
+    """).df()
+    per_campaign = df[df["is_global"] == 0][["campaign_id", "n_runs", "n_adsets"]]
+    overall = df[df["is_global"] == 1]
+    # Los adsets son por campaña: el total es la suma, no los nombres distintos
+    return per_campaign, {"n_runs": int(overall["n_runs"].sum()),
+                          "n_adsets": int(per_campaign["n_adsets"].sum())}
+
+
+def required_rate(rate: float, rel_error: float, target: float,
+                  max_rate: float = APPROX_MAX_RATE) -> float:
+    """Tasa con la que el error relativo baja a `target` (Var ∝ (1 - f) / f), tope max_rate."""
+    if not rel_error or rel_error <= target or rate >= max_rate:
+        return rate
+    odds = (1 - rate) / rate * (target / rel_error) ** 2
+    return min(max_rate, 1 / (1 + odds))
+
+
+def approx_marts(con, rate: float = APPROX_SAMPLE_RATE, target_error: float = APPROX_TARGET_ERROR,
+                 confidence: float = APPROX_CONFIDENCE, method: str = APPROX_METHOD,
+                 min_units: int = APPROX_MIN_UNITS, max_rate: float = APPROX_MAX_RATE,
+                 seed: int = 42, n_products: int = 10):
+    """
+    Mismo resultado que kpi_engine.compute_kpis (kpi_global, kpi_campaign, kpi_adset,
+    top_products) estimado desde una muestra estratificada por campaña, con
+    <razón>_lo / <razón>_hi al nivel de `confidence` y la tasa efectiva en kpi_global.
+    """
+    sizes = stratum_sizes(con)
+    for _ in range(3 if target_error else 1):
+        strata = draw_sample(con, sizes, rate, method, min_units, seed)
+        sample = load_sample(con, strata)
+        overall = estimate_level(sample, strata, [], confidence)
+        if not target_error:
+            break
+        roas = overall["roas"].iloc[0]
+        rel = (overall["roas_hi"].iloc[0] - roas) / roas if roas else 0.0
+        # Fracción efectiva de las campañas muestreadas (los censos no aportan error)
+        sampled = strata[strata["fraction"] < 1]
+        realized = sampled["n_sampled"].sum() / sampled["n_rows"].sum() if len(sampled) else 1.0
+        needed = required_rate(realized, rel, target_error, max_rate)
+        if needed <= max(rate, realized):
+            break
+        rate = needed
+
+    names = con.execute("SELECT campaign_id, campaign_name FROM snapshot_campaigns").df()
+    products = con.execute("SELECT product_id, product_name FROM snapshot_products").df()
+    ci_cols = [c for name in RATIO_TERMS for c in (f"{name}_lo", f"{name}_hi")]
+
+    counts, overall_counts = distinct_counts(con)
+    campaign = (estimate_level(sample, strata, ["campaign_id"], confidence)
+                .merge(strata[["campaign_id", "fraction"]], on="campaign_id", how="left")
+                .merge(campaign_quantiles(con), on="campaign_id", how="left")
+                .merge(counts, on="campaign_id", how="left")
+                .merge(names, on="campaign_id", how="left")
+                .rename(columns={"fraction": "sample_rate"}))
+    quantile_cols = [c for c in campaign.columns if c.startswith(("roas_p", "cpc_p"))]
+    kpi_campaign = campaign[["campaign_name", *TOTALS, *RATIO_TERMS, *ci_cols,
+                             "n_sampled", "sample_rate", "n_runs", "n_adsets", *quantile_cols]]
+
+    adset = (estimate_level(sample, strata, ["campaign_id", "adset_name"], confidence)
+             .merge(names, on="campaign_id", how="left"))
+    kpi_adset = adset[["adset_name", "campaign_name", *TOTALS, *RATIO_TERMS, *ci_cols,
+                       "n_sampled"]]
+
+    product = (estimate_level(sample, strata, ["product_id"], confidence)
+               .merge(products, on="product_id", how="left"))
+    top_products = top_n(product, n_products, "total_revenue")[
+        ["product_name", "total_revenue", "total_conversions",
+         "total_revenue_lo", "total_revenue_hi"]]
+
+    row = overall.iloc[0]
+    kpi_global = {k: float(row[k]) for k in ["total_budget", "total_revenue", "total_conversions",
+                                             "total_clicks", "total_impressions"]}
+    for name in RATIO_TERMS:
+        kpi_global.update({name: float(row[name]), f"{name}_lo": float(row[f"{name}_lo"]),
+                           f"{name}_hi": float(row[f"{name}_hi"])})
+    kpi_global.update({
+        "rows_total": int(strata["n_rows"].sum()),
+        "rows_sampled": int(strata["n_sampled"].sum()),
+        "sample_rate": float(strata["n_sampled"].sum() / max(strata["n_rows"].sum(), 1)),
+        "census_campaigns": int((strata["fraction"] >= 1).sum()),
+        **overall_counts,
+        "confidence": confidence,
+        "method": method,
+    })
+    con.execute(f"DROP TABLE IF EXISTS {SAMPLE_TABLE}")
+    return kpi_global, kpi_campaign, kpi_adset, top_products
@@ -0,0 +1,179 @@
+# src/utils/budget_optimizer.py
+# Optimizador de presupuesto con rendimientos decrecientes.
+#
+# Cada anuncio tiene una curva de respuesta cóncava revenue(b) = a · b^β (0 < β < 1)
+# que pasa por su punto observado (budget, revenue). La asignación óptima de un
+# presupuesto total iguala el ROAS marginal de todos los anuncios (water-filling):
+#     a · β · b^(β-1) = λ  ->  b(λ) = (β · a / λ)^(1 / (1-β)),  recortado a [min, max]
+# y λ se busca por bisección, vectorizada sobre todos los anuncios a la vez.
+import numpy as np
+import pandas as pd
+
+from .kpi_engine import safe_div
+
+PLAN_COLUMNS = ["ad_id", "campaign_id", "adset_name", "sku",
+                "budget", "revenue", "margin", "cpa", "roas", "ctr"]
+SCENARIO_COLUMNS = ["threshold", "total_budget", "n_ads", "revenue_new", "revenue_optimal",
+                    "margin_new", "roas_new", "delta_revenue", "delta_margin"]
+
+
+def check_elasticity(elasticity) -> float:
+    """β de las curvas a·b^β como float; fuera de (0, 1) no hay rendimientos decrecientes."""
+    try:
+        beta = float(elasticity)
+    except (TypeError, ValueError):
+        beta = float("nan")
+    if not 0 < beta < 1:
+        raise ValueError(f"BUDGET_ELASTICITY debe estar entre 0 y 1 (sin incluirlos); "
+                         f"se recibió {elasticity!r}.")
+    return beta
+
+
+def fit_response_curves(budget, revenue, elasticity: float = 0.6):
+    """Escala a_i de cada curva a·b^β para que pase por (budget_i, revenue_i)."""
+    budget = np.asarray(budget, dtype="float64")
+    revenue = np.asarray(revenue, dtype="float64")
+    scale = np.zeros_like(budget)
+    ok = (budget > 0) & (revenue > 0)
+    scale[ok] = revenue[ok] / budget[ok] ** elasticity
+    return scale
+
+
+def response(scale, budget, elasticity: float = 0.6):
+    """Revenue proyectado por la curva para un presupuesto dado."""
+    return scale * np.power(np.maximum(budget, 0.0), elasticity)
+
+
+def allocate(scale, total_budget: float, lower, upper, elasticity: float = 0.6,
+             iterations: int = 60):
+    """
+    Reparte total_budget maximizando Σ a_i·b_i^β con lower_i <= b_i <= upper_i.
+    Si las cotas hacen el problema infactible, se devuelve la cota más cercana.
+    """
+    elasticity = check_elasticity(elasticity)
+    scale = np.asarray(scale, dtype="float64")
+    lower = np.broadcast_to(np.asarray(lower, dtype="float64"), scale.shape)
+    upper = np.maximum(np.broadcast_to(np.asarray(upper, dtype="float64"), scale.shape), lower)
+    if lower.sum() >= total_budget:
+        return lower.copy()
+    if upper.sum() <= total_budget:
+        return upper.copy()
+
+    exponent = 1.0 / (1.0 - elasticity)
+    active = scale > 0
+
+    def spend(log_lam):
+        b = lower.copy()
+        b[active] = np.clip(
+            np.exp(exponent * (np.log(elasticity * scale[active]) - log_lam)),
+            lower[active], upper[active])
+        return b
+
+    # λ es el ROAS marginal común; se acota en escala logarítmica
+    lo, hi = -50.0, 50.0
+    for _ in range(iterations):
+        mid = (lo + hi) / 2
+        if spend(mid).sum() > total_budget:
+            lo = mid
+        else:
+            hi = mid
+    b = spend(hi)
+
+    # El resto (si lo hay) va a los anuncios sin curva que aún admiten presupuesto
+    leftover = total_budget - b.sum()
+    room = np.where(active, 0.0, upper - b)
+    if leftover > 0 and room.sum() > 0:
+        if np.isinf(room).any():
+            # Sin techo: reparto uniforme entre los que no tienen cota superior
+            room = np.isinf(room).astype("float64")
+            b += room * leftover / room.sum()
+        else:
+            b += room * min(1.0, leftover / room.sum())
+    return b
+
+
+def build_budget_plan(ads: pd.DataFrame, total_budget: float, elasticity: float = 0.6,
+                      min_mult: float = 0.0, max_mult: float = 3.0) -> pd.DataFrame:
+    """
+    Plan de presupuesto por anuncio con las mismas columnas que mart.snap_budget_plan.
+
+    Cada anuncio puede bajar hasta min_mult × su presupuesto actual y subir hasta
+    max_mult × (o, si hoy no gasta, hasta la media de presupuesto por anuncio).
+    Clicks, conversiones y revenue se proyectan con la misma curva (CVR y AOV constantes).
+    """
+    budget = ads["budget"].to_numpy(dtype="float64")
+    revenue = ads["revenue"].to_numpy(dtype="float64")
+    scale = fit_response_curves(budget, revenue, elasticity)
+
+    reference = np.where(budget > 0, budget, budget.mean() if len(budget) else 0.0)
+    new_budget = allocate(scale, total_budget, min_mult * budget, max_mult * reference,
+                          elasticity)
+    growth = np.where(budget > 0, safe_div(new_budget, budget) ** elasticity, 0.0)
+
+    plan = ads[PLAN_COLUMNS].copy()
+    plan["new_budget"] = new_budget
+    plan["delta_budget"] = plan["new_budget"] - plan["budget"]
+    plan["delta_budget_pct"] = safe_div(plan["delta_budget"], plan["budget"], np.nan)
+    plan["clicks_new"] = ads["clicks"].to_numpy(dtype="float64") * growth
+    plan["conversions_new"] = ads["conversions"].to_numpy(dtype="float64") * growth
+    plan["revenue_new"] = response(scale, new_budget, elasticity)
+    plan["margin_new"] = plan["revenue_new"] - plan["new_budget"]
+    plan["delta_revenue"] = plan["revenue_new"] - plan["revenue"]
+    plan["delta_margin"] = plan["margin_new"] - plan["margin"]
+    return plan.sort_values("new_budget", ascending=False).reset_index(drop=True)
+
+
+def sweep_pareto_scenarios(ads: pd.DataFrame, thresholds, total_budgets,
+                           elasticity: float = 0.6) -> pd.DataFrame:
+    """
+    Evalúa de una vez la grilla umbral Pareto × presupuesto total.
+
+    Para cada umbral t se queda con los anuncios que explican el t% del revenue
+    (al menos el primero) y reparte el presupuesto B en proporción a su revenue.
+    Con las curvas a·b^β el revenue proyectado del plan es cerrado:
+        revenue(t, B) = B^β · C_k / S_k^β,   S_k = Σ_{i<=k} R_i,  C_k = Σ_{i<=k} a_i·R_i^β
+    así que basta un único orden por revenue y dos sumas acumuladas para toda la grilla.
+    Incluye el revenue del plan óptimo sin cotas como referencia por presupuesto.
+    Sin anuncios no hay frontera: se devuelve un DataFrame vacío con las columnas.
+    """
+    elasticity = check_elasticity(elasticity)
+    if ads.empty:
+        return pd.DataFrame(columns=SCENARIO_COLUMNS)
+    budget = ads["budget"].to_numpy(dtype="float64")
+    revenue = ads["revenue"].to_numpy(dtype="float64")
+    scale = fit_response_curves(budget, revenue, elasticity)
+
+    order = np.argsort(-revenue, kind="stable")
+    rev_sorted = np.maximum(revenue[order], 0.0)
+    cum_rev = np.cumsum(rev_sorted)
+    cum_curve = np.cumsum(scale[order] * rev_sorted ** elasticity)
+    cum_share = cum_rev / cum_rev[-1] if len(cum_rev) and cum_rev[-1] > 0 else np.zeros_like(cum_rev)
+
+    thresholds = np.asarray(thresholds, dtype="float64")
+    total_budgets = np.asarray(total_budgets, dtype="float64")
+    k = np.maximum(np.searchsorted(cum_share, thresholds, side="right"), 1)
+    s_k = cum_rev[k - 1]
+    c_k = cum_curve[k - 1]
+
+    # Grilla (umbral × presupuesto) en una sola operación con broadcasting
+    t_grid, b_grid = np.meshgrid(thresholds, total_budgets, indexing="ij")
+    revenue_new = (np.power(b_grid, elasticity) * safe_div(c_k, np.power(s_k, elasticity))[:, None])
+
+    # Óptimo sin cotas: b_i ∝ a_i^(1/(1-β))  ->  revenue = B^β · (Σ a_i^(1/(1-β)))^(1-β)
+    optimal = (np.power(total_budgets, elasticity)
+               * np.power(np.power(scale, 1.0 / (1.0 - elasticity)).sum(), 1.0 - elasticity))
+
+    current_revenue = revenue.sum()
+    current_margin = current_revenue - budget.sum()
+    scenarios = pd.DataFrame({
+        "threshold": t_grid.ravel(),
+        "total_budget": b_grid.ravel(),
+        "n_ads": np.repeat(k, len(total_budgets)),
+        "revenue_new": revenue_new.ravel(),
+        "revenue_optimal": np.tile(optimal, len(thresholds)),
+    })
+    scenarios["margin_new"] = scenarios["revenue_new"] - scenarios["total_budget"]
+    scenarios["roas_new"] = safe_div(scenarios["revenue_new"], scenarios["total_budget"])
+    scenarios["delta_revenue"] = scenarios["revenue_new"] - current_revenue
+    scenarios["delta_margin"] = scenarios["margin_new"] - current_margin
+    return scenarios[SCENARIO_COLUMNS]
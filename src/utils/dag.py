@@ -0,0 +1,251 @@
+# src/utils/dag.py
+# Orquestador mínimo del pipeline: los pasos se declaran como un DAG con entradas y
+# salidas explícitas, las ramas independientes corren en paralelo y un paso se omite
+# si la huella (fingerprint) de sus entradas no cambió desde su última ejecución OK.
+import os
+import sys
+import glob
+import json
+import time
+import hashlib
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from .extract import count_rows, table_stats
+from .incremental import watermark_column
+
+STATE_PATH = os.path.join("out", ".pipeline_state.json")
+LOG_DIR = os.path.join("out", "logs")
+
+
+def load_state(path: str = STATE_PATH) -> dict:
+    if not os.path.exists(path):
+        return {"steps": {}, "files": {}}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_state(state: dict, path: str = STATE_PATH):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def file_digest(path: str, cache: dict) -> str:
+    """
+    sha256 del contenido de un archivo. El hash se cachea por (tamaño, mtime) para
+    que una re-ejecución sin cambios no vuelva a leer los Parquet completos.
+    """
+    st = os.stat(path)
+    cached = cache.get(path)
+    if cached and cached[0] == st.st_size and cached[1] == st.st_mtime_ns:
+        return cached[2]
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    cache[path] = [st.st_size, st.st_mtime_ns, h.hexdigest()]
+    return cache[path][2]
+
+
+def remote_column(table_name: str) -> str:
+    """Columna cuyo máximo delata filas nuevas: la marca de agua o created_at."""
+    return watermark_column(table_name) or "created_at"
+
+
+def remote_fingerprints(tables, max_workers: int = 8) -> dict:
+    """
+    {tabla: [nº de filas, máximo de remote_column]} en Supabase, una petición por
+    tabla y en paralelo; None si falla. El máximo cambia también con un borrado más
+    una inserción que dejan el conteo igual. Si la tabla no tiene esa columna queda
+    solo el conteo.
+    """
+    def _probe(table_name):
+        try:
+            return list(table_stats(table_name, remote_column(table_name)))
+        except Exception:
+            try:
+                return [count_rows(table_name), None]
+            except Exception:
+                return None
+
+    tables = sorted(set(tables))
+    if not tables:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(tables))) as pool:
+        return dict(zip(tables, pool.map(_probe, tables)))
+
+
+def step_fingerprint(step: dict, dep_fingerprints: dict, remote: dict, cache: dict):
+    """
+    Huella de un paso: su comando y código fuente, el contenido de sus archivos de
+    entrada, el estado remoto (conteo y máximo de cada tabla) y las huellas de sus
+    dependencias. Con `max_age` (segundos) la huella cambia además en cada ventana de
+    ese largo: las ediciones en el sitio, que no mueven ni el conteo ni el máximo, se
+    recogen al menos una vez por ventana. None si alguna entrada no se puede
+    determinar (el paso se ejecuta siempre).
+    """
+    parts = {"cmd": step["cmd"], "deps": {d: dep_fingerprints.get(d) for d in step.get("deps", [])}}
+    if step.get("source"):
+        parts["source"] = file_digest(step["source"], cache)
+    files = {}
+    for pattern in step.get("inputs", []):
+        for path in sorted(glob.glob(pattern)):
+            files[path] = file_digest(path, cache)
+    parts["inputs"] = files
+    parts["remote"] = {t: remote.get(t) for t in step.get("remote", [])}
+    if step.get("max_age"):
+        parts["window"] = int(time.time() // step["max_age"])
+    if None in parts["remote"].values() or None in parts["deps"].values():
+        return None
+    payload = json.dumps(parts, sort_keys=True).encode()
+    return hashlib.sha256(payload).hexdigest()
+
+
+class WarehouseLock:
+    """
+    Escritores sobre el warehouse, de a uno (utils/warehouse también lo garantiza
+    entre procesos, pero así el DAG no deja subprocesos esperando el candado). Los
+    lectores leen la última versión publicada y no esperan a nadie.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._writer = False
+
+    def acquire(self, mode):
+        if mode != "write":
+            return
+        with self._cond:
+            self._cond.wait_for(lambda: not self._writer)
+            self._writer = True
+
+    def release(self, mode):
+        if mode != "write":
+            return
+        with self._cond:
+            self._writer = False
+            self._cond.notify_all()
+
+
+def run_step(name: str, step: dict, lock: WarehouseLock) -> tuple:
+    """Ejecuta el paso en un subproceso; la salida va a out/logs/<paso>.log."""
+    os.makedirs(LOG_DIR, exist_ok=True)
+    log_path = os.path.join(LOG_DIR, f"{name}.log")
+    mode = step.get("warehouse")
+    lock.acquire(mode)
+    t0 = time.perf_counter()
+    try:
+        with open(log_path, "w", encoding="utf-8") as log:
+            proc = subprocess.run([sys.executable] + step["cmd"], stdout=log,
+                                  stderr=subprocess.STDOUT)
+    finally:
+        lock.release(mode)
+    elapsed = time.perf_counter() - t0
+    missing = [p for p in step.get("outputs", []) if not glob.glob(p)]
+    ok = proc.returncode == 0 and not missing
+    return ok, elapsed, log_path, missing
+
+
+def topological_order(steps: dict) -> list:
+    order, seen = [], set()
+
+    def visit(name, path=()):
+        if name in path:
+            raise ValueError(f"Ciclo en el DAG: {' -> '.join(path + (name,))}")
+        if name in seen:
+            return
+        for dep in steps[name].get("deps", []):
+            visit(dep, path + (name,))
+        seen.add(name)
+        order.append(name)
+
+    for name in steps:
+        visit(name)
+    return order
+
+
+def run_dag(steps: dict, jobs: int = 4, force: bool = False, selected=None,
+            dry_run: bool = False, state_path: str = STATE_PATH) -> dict:
+    """
+    Ejecuta el DAG. Un paso arranca cuando todas sus dependencias terminaron; si su
+    huella coincide con la de la última ejecución OK y sus salidas existen, se omite.
+    Devuelve {paso: "ok" | "skipped" | "failed" | "blocked" | "pending"}.
+    """
+    state = load_state(state_path)
+    cache = state.setdefault("files", {})
+    previous = state.setdefault("steps", {})
+    selected = set(selected or steps)
+    order = [n for n in topological_order(steps) if n in selected]
+
+    remote = {}
+    fingerprints = {n: previous.get(n, {}).get("fingerprint") for n in steps}
+    status = {n: "pending" for n in order}
+    lock = WarehouseLock()
+    running = {}
+
+    def ready(name):
+        return all(status.get(d, "ok") in ("ok", "skipped") for d in steps[name].get("deps", []))
+
+    def blocked(name):
+        return any(status.get(d) in ("failed", "blocked") for d in steps[name].get("deps", []))
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        while True:
+            for name in order:
+                if status[name] != "pending":
+                    continue
+                if blocked(name):
+                    status[name] = "blocked"
+                    print(f"⛔ {name}: dependencia fallida, no se ejecuta.")
+                    continue
+                if not ready(name):
+                    continue
+                step = steps[name]
+                outputs_ok = all(glob.glob(p) for p in step.get("outputs", []))
+                # El estado remoto se consulta cuando el paso está listo (solo los
+                # pasos seleccionados y no bloqueados); sirve también de huella tras --force
+                tables = [t for t in step.get("remote", []) if t not in remote]
+                if tables:
+                    remote.update(remote_fingerprints(tables))
+                fp = step_fingerprint(step, fingerprints, remote, cache)
+                if not force and fp is not None and outputs_ok \
+                        and previous.get(name, {}).get("fingerprint") == fp:
+                    status[name] = "skipped"
+                    print(f"➖ {name}: entradas sin cambios, se omite.")
+                    continue
+                if dry_run:
+                    status[name] = "skipped"
+                    print(f"📝 {name}: se ejecutaría.")
+                    continue
+                status[name] = "running"
+                print(f"🚀 {name}: lanzado.")
+                running[pool.submit(run_step, name, step, lock)] = (name, fp)
+
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name, fp = running.pop(future)
+                ok, elapsed, log_path, missing = future.result()
+                if ok:
+                    # Sin huella conocida se guarda una única: la próxima vez vuelve
+                    # a correr y sus dependientes ven la dependencia como cambiada
+                    fingerprints[name] = fp or hashlib.sha256(str(time.time()).encode()).hexdigest()
+                    previous[name] = {"fingerprint": fingerprints[name],
+                                      "finished_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                                      "duration_s": round(elapsed, 3)}
+                    status[name] = "ok"
+                    print(f"✅ {name}: completado en {elapsed:.2f}s.")
+                else:
+                    status[name] = "failed"
+                    previous.pop(name, None)
+                    detail = f" (faltan salidas: {missing})" if missing else ""
+                    print(f"🔥 {name}: falló{detail}. Ver {log_path}")
+            save_state(state, state_path)
+
+    save_state(state, state_path)
+    return status
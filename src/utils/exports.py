@@ -0,0 +1,164 @@
+# src/utils/exports.py
+# Capa única de exportación de marts: Parquet y CSV salen directo de DuckDB (el
+# redondeo del CSV se hace en SQL), varios archivos a la vez en un pool de hilos y
+# sin reescribir los que no cambiaron.
+#
+#   export_all(con, [
+#       *export_specs("mart.snap_ads_kpis", "out/snap_ads_kpis", round_digits=2),
+#       {"source": df, "path": "out/kpi_global.csv"},
+#   ])
+#
+# Cada export guarda su huella (filas + hash de todas las filas + esquema + opciones)
+# en out/.exports_manifest.json. Si la huella coincide y el archivo existe, no se
+# toca: Looker / Sheets solo ven cambios reales (mtime y contenido).
+import os
+import json
+import shutil
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+EXPORT_MANIFEST = os.path.join("out", ".exports_manifest.json")
+EXPORT_WORKERS = int(os.getenv("EXPORT_WORKERS", "4"))
+PARQUET_COMPRESSION = os.getenv("EXPORT_PARQUET_COMPRESSION", "zstd")
+
+NUMERIC_TYPES = ("DOUBLE", "FLOAT", "DECIMAL", "REAL")
+
+_manifest_lock = threading.Lock()
+
+
+def export_specs(source, stem: str, formats=("parquet", "csv"), **options) -> list:
+    """Un export por formato para la misma fuente: stem.parquet, stem.csv, ..."""
+    return [{"source": source, "path": f"{stem}.{fmt}", "format": fmt, **options}
+            for fmt in formats]
+
+
+def read_manifest(path: str = EXPORT_MANIFEST) -> dict:
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def _write_manifest(manifest: dict, path: str = EXPORT_MANIFEST):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def _select_list(cur, relation: str, fmt: str, round_digits) -> str:
+    """Columnas del SELECT; en CSV los números no enteros se redondean en SQL."""
+    if fmt != "csv" or round_digits is None:
+        return "*"
+    columns = []
+    for name, dtype, *_ in cur.execute(f"DESCRIBE SELECT * FROM {relation}").fetchall():
+        quoted = f'"{name}"'
+        if dtype.upper().startswith(NUMERIC_TYPES):
+            columns.append(f"round({quoted}::DOUBLE, {int(round_digits)}) AS {quoted}")
+        else:
+            columns.append(quoted)
+    return ", ".join(columns)
+
+
+def _fingerprint(cur, relation: str, spec: dict) -> tuple:
+    """
+    (filas, huella) de una relación: hash de cada fila sumado (no depende del orden),
+    esquema y opciones del export. Una sola pasada en DuckDB, sin escribir nada.
+    """
+    n_rows, row_hash = cur.execute(
+        f"SELECT count(*), coalesce(sum(hash(t)), 0)::VARCHAR FROM {relation} AS t").fetchone()
+    schema = cur.execute(f"DESCRIBE {relation}").fetchall()
+    options = {k: v for k, v in spec.items() if k not in ("source", "path")}
+    digest = hashlib.sha256(json.dumps(
+        [row_hash, [(c[0], c[1]) for c in schema], options], sort_keys=True, default=str
+    ).encode()).hexdigest()
+    return n_rows, digest
+
+
+def _copy_options(spec: dict) -> str:
+    fmt = spec["format"]
+    if fmt == "csv":
+        return "FORMAT CSV, HEADER"
+    options = [f"FORMAT PARQUET, COMPRESSION {spec.get('compression', PARQUET_COMPRESSION)}"]
+    if spec.get("row_group_size"):
+        options.append(f"ROW_GROUP_SIZE {int(spec['row_group_size'])}")
+    if spec.get("partition_by"):
+        options.append(f"PARTITION_BY ({', '.join(spec['partition_by'])})")
+    return ", ".join(options)
+
+
+def _export_one(con, spec: dict, manifest: dict, force: bool) -> str:
+    spec = dict(spec)
+    path = spec["path"]
+    spec.setdefault("format", os.path.splitext(path)[1].lstrip(".") or "parquet")
+    if spec["format"] not in ("csv", "parquet"):
+        raise ValueError(f"Formato de export no soportado: {spec['format']}")
+
+    # Cada hilo usa su propio cursor; los DataFrames/Arrow se registran en él
+    cur = con.cursor()
+    try:
+        cur.execute("SET enable_progress_bar = false")
+        source = spec["source"]
+        if isinstance(source, str):
+            relation = source if " " not in source.strip() else f"({source})"
+        else:
+            cur.register("export_source", source)
+            relation = "export_source"
+        query = (f"SELECT {_select_list(cur, relation, spec['format'], spec.get('round_digits'))} "
+                 f"FROM {relation}")
+        if spec.get("order_by"):
+            query += f" ORDER BY {', '.join(spec['order_by'])}"
+
+        # La consulta se evalúa una sola vez: la huella y el COPY leen el resultado
+        cur.execute(f"CREATE TEMP TABLE export_data AS {query}")
+        n_rows, digest = _fingerprint(cur, "export_data", spec)
+        previous = manifest.get(path)
+        if not force and previous and previous.get("fingerprint") == digest \
+                and os.path.exists(path):
+            return "unchanged"
+
+        # Se escribe a un temporal y se reemplaza de golpe: nadie lee un archivo a medias
+        tmp = path + ".tmp"
+        if os.path.isdir(tmp):
+            shutil.rmtree(tmp)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        cur.execute(f"COPY export_data TO '{tmp}' ({_copy_options(spec)})")
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        os.replace(tmp, path)
+    finally:
+        cur.execute("DROP TABLE IF EXISTS export_data")
+        cur.close()
+
+    with _manifest_lock:
+        manifest[path] = {"fingerprint": digest, "rows": n_rows, "format": spec["format"]}
+    return "written"
+
+
+def export_all(con, specs, max_workers: int = None, force: bool = False,
+               manifest_path: str = EXPORT_MANIFEST) -> dict:
+    """
+    Ejecuta los exports en paralelo (un cursor de `con` por hilo). Cada spec admite:
+      source        tabla/vista, consulta SQL, DataFrame o tabla Arrow
+      path          archivo destino (o carpeta si hay partition_by)
+      format        "parquet" | "csv" (por defecto, la extensión de path)
+      round_digits  decimales del CSV (None = sin redondeo)
+      order_by      columnas para ordenar el resultado
+      compression / row_group_size / partition_by   opciones de Parquet
+    Devuelve {path: "written" | "unchanged"}; `force` reescribe aunque no haya cambios.
+    """
+    manifest = read_manifest(manifest_path)
+    max_workers = max_workers or EXPORT_WORKERS
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {spec["path"]: pool.submit(_export_one, con, spec, manifest, force)
+                   for spec in specs}
+        status = {path: fut.result() for path, fut in futures.items()}
+    written = {path for path, s in status.items() if s == "written"}
+    if written:
+        # Se relee antes de guardar para no pisar entradas de otros scripts
+        merged = read_manifest(manifest_path)
+        merged.update({path: manifest[path] for path in written})
+        _write_manifest(merged, manifest_path)
+    return status
@@ -0,0 +1,197 @@
+# src/utils/extract.py
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pandas as pd
+
+from .supa_client import get_client
+from .schema_registry import apply_dtypes
+
+# Tamaño de página y concurrencia configurables desde el .env
+PAGE_SIZE = int(os.getenv("EXTRACT_PAGE_SIZE", "1000"))
+MAX_WORKERS = int(os.getenv("EXTRACT_MAX_WORKERS", "8"))
+MAX_RETRIES = int(os.getenv("EXTRACT_MAX_RETRIES", "3"))
+
+# Orden estable por tabla (PK o clave natural). Sin un orden fijo, PostgREST
+# puede devolver filas repetidas o saltarse filas entre páginas.
+ORDER_KEYS = {
+    "products": ["product_id"],
+    "suppliers": ["supplier_id"],
+    "campaigns": ["campaign_id"],
+    "adsets": ["adset_id"],
+    "adset_product": ["adset_id", "product_id"],
+    "sales": ["sale_id"],
+    "adset_simulation": ["run_ts", "campaign_id", "adset_name", "product_id"],
+    "ad_simulation": ["run_ts", "ad_id"],
+    "mv_kpi_global": ["grain"],
+    "mv_kpi_campaign": ["campaign_id"],
+    "mv_kpi_adset": ["campaign_id", "adset_name"],
+    "mv_kpi_product": ["product_id"],
+}
+
+
+def _with_retries(fn, what: str):
+    """Ejecuta fn() reintentando con backoff exponencial."""
+    for attempt in range(1, MAX_RETRIES + 1):
+        try:
+            return fn()
+        except Exception as e:
+            if attempt == MAX_RETRIES:
+                raise
+            wait = 0.5 * 2 ** (attempt - 1)
+            print(f"⚠️ {what} falló ({e}). Reintento {attempt}/{MAX_RETRIES - 1} en {wait:.1f}s...")
+            time.sleep(wait)
+
+
+def _apply_since(query, since):
+    """Filtra filas con columna >= valor (since = (columna, valor)) para extracción incremental."""
+    if since is not None:
+        col, value = since
+        query = query.gte(col, value)
+    return query
+
+
+def count_rows(table_name: str, since=None) -> int:
+    """Número de filas de la tabla (HEAD con count=exact, sin descargar datos)."""
+    response = _with_retries(
+        lambda: _apply_since(
+            get_client().from_(table_name).select("*", count="exact", head=True), since
+        ).execute(),
+        f"Conteo de '{table_name}'",
+    )
+    return response.count or 0
+
+
+def table_stats(table_name: str, column: str) -> tuple:
+    """
+    (nº de filas, valor máximo de `column`) en una sola petición: count=exact junto
+    con la fila más reciente según `column`.
+    """
+    response = _with_retries(
+        lambda: get_client().from_(table_name).select(column, count="exact")
+                            .order(column, desc=True, nullsfirst=False)
+                            .limit(1).execute(),
+        f"Estadísticas de '{table_name}'",
+    )
+    top = response.data[0][column] if response.data else None
+    return response.count or 0, top
+
+
+def fetch_page(table_name: str, start: int, end: int, since=None) -> pd.DataFrame:
+    """
+    Descarga las filas [start, end] (inclusive) de una tabla como DataFrame.
+
+    Si PostgREST devuelve menos filas de las pedidas (su max-rows es menor que
+    EXTRACT_PAGE_SIZE) se pide el resto del rango; si una respuesta llega vacía antes
+    de completarlo, la tabla cambió durante la extracción y se lanza RuntimeError.
+    """
+    def _run(first):
+        query = _apply_since(get_client().from_(table_name).select("*"), since)
+        for col in ORDER_KEYS.get(table_name, []):
+            query = query.order(col)
+        return query.range(first, end).execute()
+
+    rows, first = [], start
+    while first <= end:
+        data = _with_retries(lambda: _run(first),
+                             f"Página {first}-{end} de '{table_name}'").data
+        if not data:
+            raise RuntimeError(f"Página {start}-{end} de '{table_name}' incompleta: "
+                               f"llegaron {len(rows)} de {end - start + 1} filas.")
+        rows.extend(data)
+        first += len(data)
+    # Se convierte la página en cuanto llega (con los tipos guardados del registro, sin
+    # bajar conteos: cada página decidiría distinto); la lista de dicts JSON se libera aquí
+    return apply_dtypes(table_name, pd.DataFrame(rows), downcast=False)
+
+
+def fetch_tables(tables, limit: int = None, page_size: int = None,
+                 max_workers: int = None, on_page=None, since: dict = None):
+    """
+    Extrae varias tablas a la vez, paginando por rangos sobre un pool de hilos acotado.
+
+    Primero se pide el conteo de cada tabla y luego se reparten todas las páginas de
+    todas las tablas en el mismo pool. Si se pasa `on_page(table, page_no, df)`, cada
+    página se entrega en cuanto llega (sin acumularse) y se devuelve {tabla: nº filas};
+    si no, se devuelve {tabla: DataFrame} con las páginas concatenadas en orden.
+    Las tablas que fallan quedan como None (al fallar una página se cancelan las
+    páginas pendientes de esa tabla). El nº de filas es el recibido, no el conteo.
+
+    `since` = {tabla: (columna, valor)} limita la extracción a las filas con
+    columna >= valor (modo incremental por marca de agua).
+    """
+    if get_client() is None:
+        print("🔥 No hay conexión a Supabase. Abortando la extracción.")
+        return {t: None for t in tables}
+
+    since = since or {}
+    page_size = page_size or PAGE_SIZE
+    max_workers = max_workers or MAX_WORKERS
+    pages = {t: {} for t in tables}
+    received = {t: 0 for t in tables}
+    failed = set()
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        counts = {}
+        count_futures = {pool.submit(count_rows, t, since.get(t)): t for t in tables}
+        for fut in as_completed(count_futures):
+            t = count_futures[fut]
+            try:
+                counts[t] = min(fut.result(), limit) if limit else fut.result()
+                print(f"🚀 '{t}': {counts[t]} filas en {-(-counts[t] // page_size)} páginas.")
+            except Exception as e:
+                print(f"🔥 Error al contar la tabla '{t}': {e}")
+                failed.add(t)
+
+        page_futures = {}
+        by_table = {t: [] for t in counts}
+        for t, n in counts.items():
+            for page_no, start in enumerate(range(0, n, page_size)):
+                end = min(start + page_size, n) - 1
+                fut = pool.submit(fetch_page, t, start, end, since.get(t))
+                page_futures[fut] = (t, page_no)
+                by_table[t].append(fut)
+
+        for fut in as_completed(page_futures):
+            t, page_no = page_futures.pop(fut)
+            if t in failed:
+                continue
+            try:
+                df = fut.result()
+            except Exception as e:
+                print(f"🔥 Error al consultar la tabla '{t}' (página {page_no}): {e}")
+                failed.add(t)
+                # El resto de la tabla ya no sirve: no se descargan sus páginas pendientes
+                n_cancelled = sum(f.cancel() for f in by_table[t])
+                if n_cancelled:
+                    print(f"⏹️ '{t}': {n_cancelled} páginas pendientes canceladas.")
+                continue
+            received[t] += len(df)
+            if on_page is not None:
+                on_page(t, page_no, df)
+            else:
+                pages[t][page_no] = df
+
+    result = {}
+    for t in tables:
+        if t in failed:
+            result[t] = None
+            continue
+        if received[t] != counts.get(t, 0):
+            print(f"⚠️ '{t}': se esperaban {counts.get(t, 0)} filas y llegaron {received[t]}.")
+        if on_page is not None:
+            result[t] = received[t]
+            print(f"✅ Tabla '{t}' extraída exitosamente ({result[t]} filas).")
+        else:
+            chunks = [pages[t][i] for i in sorted(pages[t])]
+            result[t] = pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame()
+            print(f"✅ Tabla '{t}' cargada exitosamente ({len(result[t])} filas).")
+    return result
+
+
+def fetch_table_as_df(table_name: str, limit: int = None, **kwargs):
+    """
+    Lee una tabla completa de Supabase (paginada) y la convierte a DataFrame.
+    """
+    return fetch_tables([table_name], limit=limit, **kwargs)[table_name]
@@ -0,0 +1,392 @@
+# src/utils/forecasting.py
+# Pronóstico de demanda por SKU para todo el catálogo a la vez. DuckDB arma la matriz
+# SKU × período (ventas por día/semana/mes, o conversiones por corrida de
+# adset_simulation) y los modelos se ajustan con operaciones de arreglos sobre todas
+# las series juntas, sin un modelo por SKU en un bucle de Python:
+#   - Holt (nivel + tendencia aditiva; con β = 0 es suavizado exponencial simple):
+#     grilla α × β evaluada en paralelo, cada serie se queda con la de menor error
+#     a un paso
+#   - naive estacional: y[t + h] = y[t + h - m]
+# Por serie gana el modelo con menor RMSE a un paso; los intervalos usan la varianza
+# a h pasos de cada modelo (ETS(A,A,N) y random walk estacional).
+#
+# mart.demand_forecast_state guarda el estado de cada serie (nivel, tendencia,
+# parámetros, errores y la última temporada). Cuando llegan períodos nuevos se
+# actualiza el estado solo con esos períodos y los parámetros vigentes; la grilla se
+# vuelve a ajustar cada `refit_every` períodos, con --full o para series nuevas.
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+ALPHAS = (0.05, 0.1, 0.2, 0.3, 0.5, 0.8)
+BETAS = (0.0, 0.05, 0.1, 0.2)
+
+PERIODS = {
+    # período -> (frecuencia de pandas alineada con date_trunc, temporada por defecto)
+    "day": ("D", 7),
+    "week": ("W-MON", 52),
+    "month": ("MS", 12),
+    # corridas de adset_simulation: cada run_ts es un período
+    "run": (None, 7),
+}
+
+SOURCES = ("sales", "simulation")
+MODELS = ("holt", "seasonal_naive")
+
+
+def ensure_forecast_tables(con):
+    con.execute("CREATE SCHEMA IF NOT EXISTS mart")
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS mart.demand_forecast_state (
+            source        VARCHAR,
+            period        VARCHAR,
+            season        INTEGER,
+            product_id    BIGINT,
+            last_period   VARCHAR,
+            n_obs         INTEGER,
+            level         DOUBLE,
+            trend         DOUBLE,
+            alpha         DOUBLE,
+            beta          DOUBLE,
+            holt_sse      DOUBLE,
+            holt_n        INTEGER,
+            seasonal_sse  DOUBLE,
+            seasonal_n    INTEGER,
+            season_tail   DOUBLE[],
+            since_refit   INTEGER,
+            fitted_at     TIMESTAMP
+        )
+    """)
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS mart.snap_demand_forecast (
+            source        VARCHAR,
+            product_id    BIGINT,
+            horizon       INTEGER,
+            period_start  DATE,
+            model         VARCHAR,
+            forecast      DOUBLE,
+            lower         DOUBLE,
+            upper         DOUBLE,
+            interval_level DOUBLE,
+            last_period   VARCHAR,
+            forecast_at   TIMESTAMP
+        )
+    """)
+
+
+def _period_labels(con, source: str, period: str, since=None):
+    """Períodos completos (ordenados) posteriores a `since`; el período en curso no entra."""
+    if source == "simulation":
+        runs = con.execute(
+            "SELECT DISTINCT run_ts::VARCHAR FROM snapshot_adset_simulation "
+            "WHERE ? IS NULL OR run_ts::VARCHAR > ? ORDER BY 1", [since, since]).fetchall()
+        return [r[0] for r in runs]
+    first, current = con.execute(f"""
+        SELECT date_trunc('{period}', min(created_at))::DATE::VARCHAR,
+               date_trunc('{period}', max(created_at))::DATE::VARCHAR
+        FROM snapshot_sales
+    """).fetchone()
+    if first is None:
+        return []
+    freq = PERIODS[period][0]
+    labels = pd.date_range(first, current, freq=freq, inclusive="left")
+    labels = [d.strftime("%Y-%m-%d") for d in labels]
+    return [d for d in labels if since is None or d > since]
+
+
+def demand_matrix(con, source: str = "sales", period: str = "week", since=None,
+                  product_ids=None):
+    """
+    (product_ids, labels, Y): Y es float64 n × T con la demanda de cada producto del
+    catálogo en cada período (0 si no hubo). `since` limita a los períodos posteriores
+    y `product_ids` a un subconjunto de productos.
+    """
+    labels = _period_labels(con, source, period, since)
+    if product_ids is None:
+        product_ids = con.execute(
+            "SELECT product_id FROM snapshot_products ORDER BY product_id").fetchnumpy()["product_id"]
+    product_ids = np.asarray(product_ids, dtype="int64")
+    Y = np.zeros((len(product_ids), len(labels)))
+    if not labels or not len(product_ids):
+        return product_ids, labels, Y
+
+    if source == "simulation":
+        long = con.execute("""
+            SELECT product_id, run_ts::VARCHAR AS label, sum(conversions)::DOUBLE AS y
+            FROM snapshot_adset_simulation
+            WHERE run_ts::VARCHAR BETWEEN ? AND ? GROUP BY 1, 2
+        """, [labels[0], labels[-1]]).fetchnumpy()
+        cols = np.searchsorted(np.array(labels), np.asarray(long["label"], dtype=str))
+    else:
+        # El filtro va sobre created_at (no sobre date_trunc) para no truncar cada venta
+        # fuera del rango; el fin es el inicio del período en curso
+        end = pd.date_range(labels[-1], periods=2, freq=PERIODS[period][0])[1]
+        long = con.execute(f"""
+            SELECT product_id, date_trunc('{period}', created_at)::DATE AS label,
+                   sum(qty)::DOUBLE AS y
+            FROM snapshot_sales
+            WHERE created_at >= ?::DATE AND created_at < ?::DATE
+            GROUP BY 1, 2
+        """, [labels[0], end.strftime("%Y-%m-%d")]).fetchnumpy()
+        cols = np.searchsorted(np.array(labels, dtype="datetime64[D]"),
+                               np.asarray(long["label"]).astype("datetime64[D]"))
+    rows = np.searchsorted(product_ids, long["product_id"].astype("int64"))
+    # Ventas de productos que ya no están en el catálogo: se descartan
+    rows_ok = rows < len(product_ids)
+    rows_ok[rows_ok] &= product_ids[rows[rows_ok]] == long["product_id"][rows_ok]
+    Y[rows[rows_ok], cols[rows_ok]] = long["y"][rows_ok]
+    return product_ids, labels, Y
+
+
+def fit_holt(Y: np.ndarray, alphas=ALPHAS, betas=BETAS) -> dict:
+    """
+    Ajusta Holt a las n series de Y (n × T) para toda la grilla α × β a la vez
+    (estado n × G) y se queda, por serie, con la combinación de menor SSE a un paso.
+    """
+    n, T = Y.shape
+    a, b = np.meshgrid(np.asarray(alphas, float), np.asarray(betas, float), indexing="ij")
+    a, b = a.ravel(), b.ravel()
+    G = len(a)
+
+    level = np.repeat(Y[:, :1], G, axis=1) if T else np.zeros((n, G))
+    trend = np.repeat(Y[:, 1:2] - Y[:, :1], G, axis=1) if T > 1 else np.zeros((n, G))
+    sse = np.zeros((n, G))
+    for t in range(1, T):
+        y = Y[:, t:t + 1]
+        forecast = level + trend
+        err = y - forecast
+        sse += err * err
+        new_level = forecast + a * err
+        trend = trend + a * b * err
+        level = new_level
+
+    best = np.argmin(sse, axis=1)
+    rows = np.arange(n)
+    return {
+        "level": level[rows, best], "trend": trend[rows, best],
+        "alpha": a[best], "beta": b[best],
+        "holt_sse": sse[rows, best], "holt_n": np.full(n, max(T - 1, 0)),
+    }
+
+
+def update_holt(state: dict, Y: np.ndarray) -> dict:
+    """Avanza el estado Holt con los períodos nuevos de Y usando los α y β vigentes."""
+    level, trend = state["level"].copy(), state["trend"].copy()
+    a, b = state["alpha"], state["beta"]
+    sse = state["holt_sse"].copy()
+    for t in range(Y.shape[1]):
+        forecast = level + trend
+        err = Y[:, t] - forecast
+        sse += err * err
+        level = forecast + a * err
+        trend = trend + a * b * err
+    return {**state, "level": level, "trend": trend, "holt_sse": sse,
+            "holt_n": state["holt_n"] + Y.shape[1]}
+
+
+def seasonal_errors(Y: np.ndarray, season: int, tail=None):
+    """
+    (sse, n, tail) del naive estacional sobre Y. `tail` son los últimos `season`
+    valores previos a Y (incremental); sin tail solo cuentan los períodos con una
+    temporada completa antes. Devuelve la nueva cola (NaN donde aún no hay datos).
+    """
+    n, T = Y.shape
+    history = Y if tail is None else np.hstack([tail, Y])
+    offset = 0 if tail is None else season
+    idx = offset - season + np.arange(T)
+    prev = history[:, np.maximum(idx, 0)]
+    valid = (idx >= 0) & ~np.isnan(prev)
+    err = np.where(valid, Y - np.nan_to_num(prev), 0.0)
+    counted = valid.sum(axis=1)
+    if history.shape[1] >= season:
+        new_tail = history[:, -season:]
+    else:
+        new_tail = np.hstack([np.full((n, season - history.shape[1]), np.nan), history])
+    return (err * err).sum(axis=1), counted, new_tail
+
+
+def forecast_paths(state: dict, horizon: int, interval: float = 0.9):
+    """
+    Pronósticos 1..horizon de cada serie con el modelo ganador y su intervalo.
+    Devuelve (model, forecast, lower, upper) con forecast/lower/upper n × horizon.
+    """
+    h = np.arange(1, horizon + 1, dtype=float)
+    z = NormalDist().inv_cdf(0.5 + interval / 2)
+    tail = state["season_tail"]
+    season = tail.shape[1]
+
+    holt_var = np.divide(state["holt_sse"], state["holt_n"],
+                         out=np.zeros_like(state["holt_sse"]), where=state["holt_n"] > 0)
+    seas_var = np.divide(state["seasonal_sse"], state["seasonal_n"],
+                         out=np.full_like(state["seasonal_sse"], np.inf),
+                         where=state["seasonal_n"] > 0)
+    use_seasonal = (state["seasonal_n"] > 0) & ~np.isnan(tail).any(axis=1) & (seas_var < holt_var)
+
+    # Holt: nivel + h·tendencia; varianza a h pasos de ETS(A,A,N)
+    a, b = state["alpha"][:, None], state["beta"][:, None]
+    holt = state["level"][:, None] + h * state["trend"][:, None]
+    holt_sd = np.sqrt(holt_var[:, None] * (1 + (h - 1) * (a ** 2 + a ** 2 * b * h
+                                                          + (a * b) ** 2 * h * (2 * h - 1) / 6)))
+    # Naive estacional: repite la última temporada; la varianza crece por temporada
+    seas = np.nan_to_num(tail[:, (h.astype(int) - 1) % season]) if season else holt
+    seas_sd = np.sqrt(np.where(np.isfinite(seas_var), seas_var, 0)[:, None]
+                      * ((h - 1) // max(season, 1) + 1))
+
+    pick = use_seasonal[:, None]
+    forecast = np.where(pick, seas, holt)
+    sd = np.where(pick, seas_sd, holt_sd)
+    # La demanda no es negativa
+    lower = np.maximum(forecast - z * sd, 0.0)
+    upper = np.maximum(forecast + z * sd, 0.0)
+    forecast = np.maximum(forecast, 0.0)
+    model = np.where(use_seasonal, MODELS[1], MODELS[0])
+    return model, forecast, lower, upper
+
+
+def _load_state(con, source: str, period: str, season: int):
+    tbl = con.execute("""
+        SELECT * FROM mart.demand_forecast_state
+        WHERE source = ? AND period = ? AND season = ? ORDER BY product_id
+    """, [source, period, season]).fetch_arrow_table()
+    if tbl.num_rows == 0:
+        return None
+    state = {c: tbl.column(c).to_numpy() for c in
+             ("product_id", "n_obs", "level", "trend", "alpha", "beta", "holt_sse",
+              "holt_n", "seasonal_sse", "seasonal_n", "since_refit")}
+    flat = pc.list_flatten(tbl.column("season_tail")).to_numpy(zero_copy_only=False)
+    state["season_tail"] = flat.astype(float).reshape(tbl.num_rows, season)
+    state["last_period"] = tbl.column("last_period")[0].as_py()
+    return state
+
+
+def _fit_full(Y: np.ndarray, product_ids, season: int) -> dict:
+    state = fit_holt(Y)
+    sse, counted, tail = seasonal_errors(Y, season)
+    state.update(product_id=product_ids, n_obs=np.full(len(product_ids), Y.shape[1]),
+                 seasonal_sse=sse, seasonal_n=counted, season_tail=tail,
+                 since_refit=np.zeros(len(product_ids), dtype=int))
+    return state
+
+
+def _subset(state: dict, mask) -> dict:
+    return {k: (v[mask] if isinstance(v, np.ndarray) else v) for k, v in state.items()}
+
+
+def _concat(a: dict, b: dict) -> dict:
+    out = {k: np.concatenate([a[k], b[k]]) for k in a if isinstance(a[k], np.ndarray)}
+    order = np.argsort(out["product_id"], kind="stable")
+    return {k: v[order] for k, v in out.items()}
+
+
+def _save_state(con, state: dict, source: str, period: str, season: int, last_period):
+    n = len(state["product_id"])
+    tail = pa.FixedSizeListArray.from_arrays(
+        pa.array(state["season_tail"].ravel(), pa.float64()), season).cast(pa.list_(pa.float64()))
+    table = pa.table({
+        "source": pa.array([source] * n), "period": pa.array([period] * n),
+        "season": pa.array(np.full(n, season, dtype="int32")),
+        "product_id": state["product_id"].astype("int64"),
+        "last_period": pa.array([last_period] * n, pa.string()),
+        "n_obs": state["n_obs"].astype("int32"),
+        "level": state["level"], "trend": state["trend"],
+        "alpha": state["alpha"], "beta": state["beta"],
+        "holt_sse": state["holt_sse"], "holt_n": state["holt_n"].astype("int32"),
+        "seasonal_sse": state["seasonal_sse"], "seasonal_n": state["seasonal_n"].astype("int32"),
+        "season_tail": tail, "since_refit": state["since_refit"].astype("int32"),
+    })
+    con.register("forecast_state_arrow", table)
+    con.execute("DELETE FROM mart.demand_forecast_state WHERE source = ?", [source])
+    con.execute("""
+        INSERT INTO mart.demand_forecast_state
+        SELECT *, now()::TIMESTAMP AS fitted_at FROM forecast_state_arrow
+    """)
+    con.unregister("forecast_state_arrow")
+
+
+def _future_periods(source: str, period: str, last_period, horizon: int):
+    if source == "simulation" or last_period is None:
+        return [None] * horizon
+    freq = PERIODS[period][0]
+    return list(pd.date_range(last_period, periods=horizon + 1, freq=freq)[1:].date)
+
+
+def forecast_demand(con, source: str = "sales", period: str = "week", horizon: int = 12,
+                    season: int = None, interval: float = 0.9, full: bool = False,
+                    refit_every: int = 8) -> dict:
+    """
+    Actualiza el estado de las series y reescribe mart.snap_demand_forecast del
+    `source` (una fila por producto y paso del horizonte). Devuelve un resumen.
+    """
+    if source not in SOURCES:
+        raise ValueError(f"Fuente de demanda desconocida: {source}")
+    if period not in PERIODS:
+        raise ValueError(f"Período desconocido: {period}")
+    if (source == "simulation") != (period == "run"):
+        period = "run" if source == "simulation" else "week"
+    season = season or PERIODS[period][1]
+    ensure_forecast_tables(con)
+
+    previous = None if full else _load_state(con, source, period, season)
+    due = previous is not None and int(previous["since_refit"].max(initial=0)) >= refit_every
+    if previous is None or due:
+        product_ids, labels, Y = demand_matrix(con, source, period)
+        state = _fit_full(Y, product_ids, season)
+        mode = "full" if previous is None else "refit"
+        last_period = labels[-1] if labels else None
+        n_new_periods = len(labels)
+    else:
+        # Solo los períodos nuevos de las series conocidas; las series nuevas se
+        # ajustan con toda su historia
+        product_ids, labels, Y = demand_matrix(con, source, period, since=previous["last_period"])
+        known = np.isin(product_ids, previous["product_id"])
+        old = _subset(previous, np.isin(previous["product_id"], product_ids))
+        Y_known = Y[known]
+        state = update_holt(old, Y_known)
+        sse, counted, tail = seasonal_errors(Y_known, season, old["season_tail"])
+        state.update(seasonal_sse=old["seasonal_sse"] + sse,
+                     seasonal_n=old["seasonal_n"] + counted, season_tail=tail,
+                     n_obs=old["n_obs"] + len(labels),
+                     since_refit=old["since_refit"] + len(labels))
+        if (~known).any():
+            ids_new, all_labels, Y_new = demand_matrix(con, source, period,
+                                                       product_ids=product_ids[~known])
+            state = _concat(state, _fit_full(Y_new, ids_new, season))
+        mode = "incremental"
+        last_period = labels[-1] if labels else previous["last_period"]
+        n_new_periods = len(labels)
+
+    model, forecast, lower, upper = forecast_paths(state, horizon, interval)
+
+    n = len(state["product_id"])
+    periods = _future_periods(source, period, last_period, horizon)
+    rows = pa.table({
+        "source": pa.array([source] * (n * horizon)),
+        "product_id": np.repeat(state["product_id"].astype("int64"), horizon),
+        "horizon": np.tile(np.arange(1, horizon + 1, dtype="int32"), n),
+        "period_start": pa.array(periods * n, pa.date32()),
+        "model": np.repeat(model, horizon),
+        "forecast": forecast.ravel(), "lower": lower.ravel(), "upper": upper.ravel(),
+        "interval_level": np.full(n * horizon, interval),
+        "last_period": pa.array([last_period] * (n * horizon), pa.string()),
+    })
+    con.register("forecast_arrow", rows)
+    con.execute("BEGIN TRANSACTION")
+    try:
+        _save_state(con, state, source, period, season, last_period)
+        con.execute("DELETE FROM mart.snap_demand_forecast WHERE source = ?", [source])
+        con.execute("""
+            INSERT INTO mart.snap_demand_forecast
+            SELECT *, now()::TIMESTAMP AS forecast_at FROM forecast_arrow
+        """)
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+    finally:
+        con.unregister("forecast_arrow")
+
+    return {"mode": mode, "n_series": n, "n_new_periods": n_new_periods,
+            "last_period": last_period, "n_seasonal": int((model == MODELS[1]).sum())}
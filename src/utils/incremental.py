@@ -0,0 +1,136 @@
+# src/utils/incremental.py
+import os
+
+import duckdb
+import pandas as pd
+import pyarrow as pa
+
+from .extract import ORDER_KEYS
+from .warehouse import connect_warehouse, current_path
+
+# Marca de agua por tabla. Solo las tablas append-only se extraen en modo
+# incremental: una fila ya extraída no vuelve a cambiar, así que alcanza con pedir
+# las posteriores a la marca.
+#   - sales: cada venta se inserta una vez y no se edita (created_at).
+#   - adset_simulation / ad_simulation: una corrida se carga entera con su run_ts
+#     (único por invocación); las corridas nuevas quedan por encima de la marca.
+# products, campaigns, suppliers, adsets y adset_product se editan en el sitio
+# (precio, costo, nombre, presupuesto, asignaciones) y no tienen updated_at: un filtro
+# por created_at nunca vería esos cambios, así que se extraen siempre completas
+# (son tablas chicas frente a ventas y simulaciones).
+WATERMARK_COLUMNS = {
+    "sales": "created_at",
+    "adset_simulation": "run_ts",
+    "ad_simulation": "run_ts",
+}
+
+
+def watermark_column(table_name: str):
+    """Columna de marca de agua, o None si la tabla se extrae siempre completa."""
+    return WATERMARK_COLUMNS.get(table_name)
+
+
+def ensure_watermark_table(con):
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS etl_watermarks (
+            table_name       VARCHAR PRIMARY KEY,
+            watermark_column VARCHAR,
+            high_water       VARCHAR,
+            rows_merged      BIGINT,
+            updated_at       TIMESTAMP
+        )
+    """)
+
+
+def read_watermarks(warehouse_path: str) -> dict:
+    """
+    Devuelve {tabla: (columna, high_water)} o {} si aún no hay warehouse. Solo las
+    tablas append-only de WATERMARK_COLUMNS (y con la misma columna): una marca vieja
+    de otra tabla u otra columna se ignora y la tabla se extrae completa.
+    """
+    if not os.path.exists(current_path(warehouse_path)):
+        return {}
+    con = connect_warehouse(warehouse_path, read_only=True)
+    try:
+        rows = con.execute(
+            "SELECT table_name, watermark_column, high_water FROM etl_watermarks"
+        ).fetchall()
+    except duckdb.CatalogException:
+        rows = []
+    finally:
+        con.close()
+    return {t: (col, hw) for t, col, hw in rows
+            if hw is not None and col == watermark_column(t)}
+
+
+def high_water_of(df, table_name: str, previous=None):
+    """Máximo de la columna de marca de agua en df (o el anterior si df está vacío)."""
+    col = watermark_column(table_name)
+    if df is None or df.empty or col is None or col not in df.columns:
+        return previous
+    values = df[col]
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        values = values.astype(str)
+    value = values.max()
+    # Mismo formato ISO que devuelve PostgREST (se reutiliza en el filtro gte)
+    return value.isoformat() if hasattr(value, "isoformat") else str(value)
+
+
+def _table_exists(con, table_name: str) -> bool:
+    return con.execute(
+        "SELECT count(*) FROM information_schema.tables WHERE table_name = ?",
+        [table_name],
+    ).fetchone()[0] > 0
+
+
+def apply_snapshot(con, name: str, df, mode: str = "full", high_water=None):
+    """
+    Aplica un lote extraído al snapshot `snapshot_<name>`.
+
+    - mode="full": reemplaza el snapshot completo.
+    - mode="incremental": upsert por clave primaria (borra las filas con la misma
+      clave e inserta las nuevas). Si el snapshot aún no existe, se crea. Una tabla
+      que no es append-only (WATERMARK_COLUMNS) o sin clave en ORDER_KEYS no admite
+      delta (ValueError): el snapshot nunca se reemplaza por un delta.
+
+    `df` puede ser un DataFrame/tabla Arrow o el nombre de una tabla ya cargada en
+    DuckDB (transporte directo desde Postgres). La marca de agua se actualiza en la
+    misma transacción que los datos.
+    """
+    table_name = f"snapshot_{name}"
+    keys = ORDER_KEYS.get(name)
+    if mode == "incremental" and not keys:
+        raise ValueError(f"'{name}' no tiene clave en ORDER_KEYS: solo admite carga completa.")
+    if mode == "incremental" and name not in WATERMARK_COLUMNS:
+        raise ValueError(f"'{name}' no es append-only: solo admite carga completa.")
+    ensure_watermark_table(con)
+    if isinstance(df, str):
+        source = df
+        rows = con.execute(f"SELECT count(*) FROM {source}").fetchone()[0]
+    else:
+        # Vía Arrow: las columnas category llegan a DuckDB como VARCHAR (no como ENUM,
+        # que rechazaría valores nuevos en los siguientes upserts)
+        if isinstance(df, pd.DataFrame):
+            df = pa.Table.from_pandas(df, preserve_index=False)
+        source, rows = "delta_df", df.num_rows
+        con.register(source, df)
+    con.execute("BEGIN TRANSACTION")
+    try:
+        if mode == "incremental" and _table_exists(con, table_name):
+            on = " AND ".join(f"t.{k} = d.{k}" for k in keys)
+            con.execute(f"DELETE FROM {table_name} AS t USING {source} AS d WHERE {on}")
+            con.execute(f"INSERT INTO {table_name} BY NAME SELECT * FROM {source}")
+        else:
+            con.execute(f"CREATE OR REPLACE TABLE {table_name} AS SELECT * FROM {source}")
+        if high_water is not None:
+            con.execute(
+                "INSERT OR REPLACE INTO etl_watermarks VALUES (?, ?, ?, ?, now())",
+                [name, watermark_column(name), high_water, rows],
+            )
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+    finally:
+        if source == "delta_df":
+            con.unregister(source)
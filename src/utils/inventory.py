@@ -0,0 +1,293 @@
+# src/utils/inventory.py
+# Proyección de inventario (campañas -> demanda -> ventas -> inventario) para todo el
+# catálogo a la vez: el stock es una matriz NumPy SKU × día y cada día se avanza con
+# operaciones vectorizadas sobre todos los SKU (un bucle de `horizon` pasos, no uno
+# por producto).
+#
+# Demanda diaria por SKU = conversiones medias por corrida de adset_simulation (cada
+# corrida se toma como un día de campaña), escalada por el crecimiento de conversiones
+# que proyecta el plan de presupuesto de step11 para ese sku (si existe).
+# Política (s, Q) por SKU con los datos del proveedor:
+#   punto de pedido  s = demanda · lead time + z · σ · √lead time
+#   lote             Q = EOQ (order_cost, unit_cost · holding_rate), al menos el MOQ y
+#                        redondeado al múltiplo de empaque del proveedor
+# No hay stock real en el esquema: el stock inicial son `start_cover_days` días de
+# demanda. 00_schema.sql tampoco tiene products.supplier_id ni los datos de compra del
+# proveedor: cada columna que falte toma su valor por defecto (lead time, MOQ 1,
+# empaque 1, sin costo de pedido).
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_LEAD_TIME = 7
+
+
+def _has_table(con, schema: str, table: str) -> bool:
+    return con.execute(
+        "SELECT count(*) FROM duckdb_tables() WHERE schema_name = ? AND table_name = ?",
+        [schema, table]).fetchone()[0] > 0
+
+
+def _columns(con, schema: str, table: str) -> set:
+    return {r[0] for r in con.execute(
+        "SELECT column_name FROM duckdb_columns() WHERE schema_name = ? AND table_name = ?",
+        [schema, table]).fetchall()}
+
+
+def load_sku_inputs(con, use_plan: bool = True, default_lead_time: int = DEFAULT_LEAD_TIME,
+                    simulation: str = "snapshot_adset_simulation",
+                    products: str = "snapshot_products",
+                    suppliers: str = "snapshot_suppliers") -> pd.DataFrame:
+    """
+    Una fila por producto con demanda diaria (media y desvío entre corridas) y los
+    parámetros del proveedor. Sin proveedor (o sin la columna): lead time por defecto,
+    MOQ y empaque 1, costo de pedido 0.
+    """
+    product_cols = _columns(con, "main", products)
+    supplier_cols = _columns(con, "main", suppliers)
+    has_plan = (use_plan and _has_table(con, "mart", "snap_budget_plan")
+                and _has_table(con, "mart", "snap_ads_kpis"))
+
+    # Solo se une al proveedor si ambas tablas tienen supplier_id
+    joined = "supplier_id" in product_cols and "supplier_id" in supplier_cols
+
+    def supplier(col):
+        return f"s.{col}" if joined and col in supplier_cols else "NULL"
+
+    supplier_join = (f"LEFT JOIN {suppliers} AS s ON s.supplier_id = p.supplier_id"
+                     if joined else "")
+    supplier_id = "p.supplier_id" if "supplier_id" in product_cols else "NULL"
+    unit_cost = "p.unit_cost" if "unit_cost" in product_cols else "NULL"
+    # Crecimiento de conversiones por sku según el último plan de step11
+    plan_cte = """,
+        plan AS (
+            SELECT b.sku::VARCHAR AS sku,
+                   sum(b.conversions_new) / nullif(sum(a.conversions), 0) AS growth
+            FROM mart.snap_budget_plan AS b
+            JOIN mart.snap_ads_kpis AS a ON a.run_ts = b.run_ts AND a.ad_id = b.ad_id
+            WHERE b.run_ts = (SELECT max(run_ts) FROM mart.snap_budget_plan)
+            GROUP BY 1
+        )""" if has_plan else ""
+    plan_join = "LEFT JOIN plan AS pl ON pl.sku = p.sku::VARCHAR" if has_plan else ""
+    growth = "coalesce(pl.growth, 1.0)" if has_plan else "1.0"
+
+    return con.execute(f"""
+        WITH runs AS (
+            SELECT greatest(count(DISTINCT run_ts), 1) AS n FROM {simulation}
+        ),
+        per_run AS (
+            SELECT product_id, run_ts, sum(conversions)::DOUBLE AS c
+            FROM {simulation} GROUP BY product_id, run_ts
+        ),
+        demand AS (
+            -- Las corridas sin conversiones del producto cuentan como 0
+            SELECT product_id, sum(c) / any_value(n) AS mean,
+                   sqrt(greatest(sum(c * c) / any_value(n) - pow(sum(c) / any_value(n), 2), 0)) AS std
+            FROM per_run, runs GROUP BY product_id
+        ){plan_cte}
+        SELECT p.product_id, p.sku::VARCHAR AS sku, p.product_name::VARCHAR AS product_name,
+               {supplier_id}::BIGINT AS supplier_id,
+               coalesce({unit_cost}, 0)::DOUBLE AS unit_cost,
+               coalesce({supplier("lead_time_days")}, {int(default_lead_time)})::INTEGER AS lead_time_days,
+               greatest(coalesce({supplier("moq")}, 1), 1)::DOUBLE AS moq,
+               greatest(coalesce({supplier("pack_multiple")}, 1), 1)::DOUBLE AS pack_multiple,
+               coalesce({supplier("order_cost")}, 0)::DOUBLE AS order_cost,
+               coalesce(d.mean, 0) * {growth} AS daily_demand,
+               coalesce(d.std, 0) * {growth} AS demand_std
+        FROM {products} AS p
+        {supplier_join}
+        LEFT JOIN demand AS d ON d.product_id = p.product_id
+        {plan_join}
+        ORDER BY p.product_id
+    """).fetch_df()
+
+
+def reorder_policy(inputs: pd.DataFrame, service_level: float = 0.95,
+                   holding_rate: float = 0.25, cover_days: float = 30.0) -> pd.DataFrame:
+    """
+    Punto de pedido, stock de seguridad y lote por SKU (vectorizado). `holding_rate` es
+    el costo anual de mantener una unidad como fracción de su costo; si no hay costo de
+    pedido o de mantención, el lote cubre `cover_days` días de demanda.
+    """
+    demand = inputs["daily_demand"].to_numpy(dtype="float64")
+    std = inputs["demand_std"].to_numpy(dtype="float64")
+    lead = np.maximum(inputs["lead_time_days"].to_numpy(dtype="float64"), 1.0)
+    moq = inputs["moq"].to_numpy(dtype="float64")
+    pack = inputs["pack_multiple"].to_numpy(dtype="float64")
+    holding = inputs["unit_cost"].to_numpy(dtype="float64") * holding_rate
+    order_cost = inputs["order_cost"].to_numpy(dtype="float64")
+
+    z = NormalDist().inv_cdf(service_level)
+    safety = z * std * np.sqrt(lead)
+    eoq = np.sqrt(np.divide(2 * demand * 365 * order_cost, holding,
+                            out=np.zeros_like(demand), where=holding > 0))
+    qty = np.where(eoq > 0, eoq, demand * cover_days)
+    qty = np.ceil(np.maximum(qty, moq) / pack) * pack
+    # Sin demanda no se pide nada
+    qty = np.where(demand > 0, qty, 0.0)
+
+    policy = inputs.copy()
+    policy["safety_stock"] = safety
+    policy["reorder_point"] = demand * lead + safety
+    policy["order_qty"] = qty
+    return policy
+
+
+def project_stock(demand, start_stock, reorder_point, order_qty, lead_time, horizon: int):
+    """
+    Simula la política (s, Q) para n SKU durante `horizon` días.
+
+    `demand` es (n,) (constante) o (n, horizon). Cada día: llegan los pedidos, se
+    atiende la demanda (lo que falta se pierde), y si la posición (stock + en tránsito)
+    quedó en o bajo el punto de pedido se piden los lotes necesarios para superarlo,
+    que llegan `lead_time` días después. Los pedidos en tránsito viven en un buffer
+    circular (max lead + 1) × n, así la memoria no depende del horizonte.
+
+    Devuelve (levels, stats): levels es la matriz float32 n × horizon con el stock al
+    cierre de cada día; stats son vectores por SKU (primer día sin stock, primer pedido,
+    número de pedidos, unidades perdidas, demanda total). Los días son 0-based; -1 = nunca.
+    """
+    start_stock = np.asarray(start_stock, dtype="float64")
+    n = len(start_stock)
+    demand = np.asarray(demand, dtype="float64")
+    if demand.ndim == 1:
+        demand = np.broadcast_to(demand[:, None], (n, horizon))
+    reorder_point = np.asarray(reorder_point, dtype="float64")
+    order_qty = np.asarray(order_qty, dtype="float64")
+    lead = np.maximum(np.asarray(lead_time, dtype="int64"), 1)
+    slots = int(lead.max()) + 1 if n else 1
+
+    # Día × SKU por dentro para que cada paso lea y escriba memoria contigua
+    by_day = np.empty((horizon, n), dtype="float32")
+    stock = start_stock.copy()
+    on_order = np.zeros(n)
+    pipeline = np.zeros((slots, n))
+    lost = np.zeros(n)
+    first_stockout = np.full(n, -1, dtype="int32")
+    first_order = np.full(n, -1, dtype="int32")
+    n_orders = np.zeros(n, dtype="int32")
+    can_order = order_qty > 0
+
+    for t in range(horizon):
+        slot = t % slots
+        arriving = pipeline[slot]
+        stock += arriving
+        on_order -= arriving
+        pipeline[slot] = 0.0
+
+        d = demand[:, t]
+        served = np.minimum(stock, d)
+        short = served < d
+        lost += d - served
+        stock -= served
+        first_stockout[short & (first_stockout < 0)] = t
+
+        position = stock + on_order
+        need = np.flatnonzero(can_order & (position <= reorder_point))
+        if need.size:
+            lots = np.floor((reorder_point[need] - position[need]) / order_qty[need]) + 1
+            qty = lots * order_qty[need]
+            # Un pedido por SKU y día: los índices de `need` no se repiten
+            pipeline[(t + lead[need]) % slots, need] += qty
+            on_order[need] += qty
+            n_orders[need] += 1
+            first_order[need[first_order[need] < 0]] = t
+        by_day[t] = stock
+
+    stats = {
+        "first_stockout_day": first_stockout,
+        "first_order_day": first_order,
+        "n_orders": n_orders,
+        "lost_units": lost,
+        "total_demand": demand.sum(axis=1),
+    }
+    return by_day.T, stats
+
+
+def _day_to_date(start, days):
+    dates = pd.Timestamp(start) + pd.to_timedelta(np.where(days >= 0, days, 0), unit="D")
+    return pd.Series(dates).where(days >= 0)
+
+
+def project_inventory(inputs: pd.DataFrame, horizon: int = 365, start_date=None,
+                      start_cover_days: float = 30.0, service_level: float = 0.95,
+                      holding_rate: float = 0.25, cover_days: float = 30.0):
+    """
+    Proyección completa: política por SKU + simulación. Devuelve (summary, levels) con
+    una fila por SKU en summary (columnas de mart.snap_inventory_projection) y la
+    matriz de stock diario en levels (mismo orden de filas).
+    """
+    start_date = pd.Timestamp(start_date or pd.Timestamp.today()).normalize()
+    policy = reorder_policy(inputs, service_level, holding_rate, cover_days)
+    demand = policy["daily_demand"].to_numpy(dtype="float64")
+    start_stock = demand * start_cover_days
+
+    levels, stats = project_stock(demand, start_stock,
+                                  policy["reorder_point"].to_numpy(dtype="float64"),
+                                  policy["order_qty"].to_numpy(dtype="float64"),
+                                  policy["lead_time_days"].to_numpy(), horizon)
+
+    summary = policy[["product_id", "sku", "product_name", "supplier_id", "lead_time_days",
+                      "daily_demand", "demand_std", "safety_stock", "reorder_point",
+                      "order_qty"]].copy()
+    summary["start_stock"] = start_stock
+    summary["first_reorder_date"] = _day_to_date(start_date, stats["first_order_day"]).to_numpy()
+    summary["stockout_date"] = _day_to_date(start_date, stats["first_stockout_day"]).to_numpy()
+    summary["n_orders"] = stats["n_orders"]
+    if horizon:
+        summary["min_stock"] = levels.min(axis=1)
+        summary["avg_stock"] = levels.mean(axis=1, dtype="float64")
+        summary["end_stock"] = levels[:, -1]
+    else:
+        summary["min_stock"] = summary["avg_stock"] = summary["end_stock"] = start_stock
+    summary["lost_units"] = stats["lost_units"]
+    total = stats["total_demand"]
+    summary["fill_rate"] = np.where(total > 0, 1 - np.divide(
+        stats["lost_units"], total, out=np.zeros_like(total), where=total > 0), 1.0)
+    summary["start_date"] = start_date
+    summary["horizon_days"] = horizon
+    return summary, levels
+
+
+def daily_levels_table(summary: pd.DataFrame, levels: np.ndarray):
+    """Formato largo (product_id, date, stock) de la matriz de stock, como tabla Arrow."""
+    import pyarrow as pa
+
+    n, horizon = levels.shape
+    start = pd.Timestamp(summary["start_date"].iloc[0]) if n else pd.Timestamp.today()
+    dates = pd.date_range(start, periods=horizon, freq="D").to_numpy(dtype="datetime64[D]")
+    return pa.table({
+        "product_id": np.repeat(summary["product_id"].to_numpy(), horizon),
+        "date": np.tile(dates, n),
+        "stock": levels.ravel(),
+    })
+
+
+def write_projection(con, summary: pd.DataFrame, table: str = "mart.snap_inventory_projection"):
+    """Reemplaza la proyección vigente (una fila por SKU) con marca de tiempo de la corrida."""
+    con.execute("CREATE SCHEMA IF NOT EXISTS mart")
+    con.register("inventory_projection_df", summary)
+    con.execute(f"""
+        CREATE OR REPLACE TABLE {table} AS
+        SELECT * REPLACE (start_date::DATE AS start_date,
+                          first_reorder_date::DATE AS first_reorder_date,
+                          stockout_date::DATE AS stockout_date),
+               now()::TIMESTAMP AS projected_at
+        FROM inventory_projection_df
+    """)
+    con.unregister("inventory_projection_df")
+
+
+def summarize(summary: pd.DataFrame) -> dict:
+    horizon = int(summary["horizon_days"].iloc[0]) if len(summary) else 0
+    at_risk = summary["stockout_date"].notna()
+    return {
+        "n_skus": len(summary),
+        "n_with_demand": int((summary["daily_demand"] > 0).sum()),
+        "n_stockouts": int(at_risk.sum()),
+        "n_orders": int(summary["n_orders"].sum()),
+        "lost_units": float(summary["lost_units"].sum()),
+        "fill_rate": float(1 - summary["lost_units"].sum()
+                           / max(summary["daily_demand"].sum() * horizon, 1e-9)),
+    }
@@ -0,0 +1,171 @@
+# src/utils/kpi_engine.py
+# Motor único de KPIs para 20_build_kpis, 30_build_mart y step11_ads_snapshots.
+# Todas las granularidades salen de una sola agregación al grano más fino
+# (campaña × adset × producto); los niveles superiores se acumulan en cascada
+# desde ese grano, sin volver a recorrer las filas crudas. Sobre el warehouse,
+# grouping_sets_sql hace lo mismo dentro de DuckDB (GROUPING SETS + ratios) y
+# kpis_from_grains solo reparte las filas agregadas por nivel.
+import numpy as np
+import pandas as pd
+
+# Columna cruda -> total agregado
+MEASURES = {
+    "budget": "total_budget",
+    "clicks": "total_clicks",
+    "impressions": "total_impressions",
+    "conversions": "total_conversions",
+    "revenue": "total_revenue",
+    "margin": "total_margin",
+}
+TOTALS = list(MEASURES.values())
+# Razón -> (numerador, denominador)
+RATIO_TERMS = {
+    "cpa": ("total_budget", "total_conversions"),
+    "roas": ("total_revenue", "total_budget"),
+    "cpc": ("total_budget", "total_clicks"),
+    "ctr": ("total_clicks", "total_impressions"),
+}
+RATIOS = list(RATIO_TERMS)
+# GROUPING(campaña, adset, producto) -> nivel (bit a 1 = columna agregada)
+GRAIN_IDS = {1: "adset", 3: "campaign", 6: "product", 7: "global"}
+
+
+def safe_div(num, den, fill=0.0):
+    """División vectorizada: devuelve `fill` donde el denominador es 0 o nulo."""
+    num = np.asarray(num, dtype="float64")
+    den = np.asarray(den, dtype="float64")
+    out = np.full(np.broadcast(num, den).shape, fill, dtype="float64")
+    np.divide(num, den, out=out, where=(den != 0) & ~np.isnan(den))
+    return out
+
+
+def add_ratios(df: pd.DataFrame, fill=0.0) -> pd.DataFrame:
+    """Añade CPA, ROAS, CPC y CTR a un DataFrame con columnas total_*."""
+    for name, (num, den) in RATIO_TERMS.items():
+        df[name] = safe_div(df[num], df[den], fill)
+    return df
+
+
+def aggregate_fine(df: pd.DataFrame, keys, measures: dict = None) -> pd.DataFrame:
+    """
+    Única pasada sobre las filas crudas: suma las métricas al grano `keys`.
+    `measures` permite mapear nombres de columna distintos (p. ej. simulated_impressions).
+    """
+    measures = measures or MEASURES
+    cols = {src: dst for src, dst in measures.items() if src in df.columns}
+    typed = df[list(keys) + list(cols)].astype({c: "float64" for c in cols})
+    fine = (typed.groupby(list(keys), sort=False, dropna=False, observed=True)
+                 .sum()
+                 .rename(columns=cols)
+                 .reset_index())
+    for col in TOTALS:
+        if col not in fine.columns:
+            fine[col] = 0.0
+    return fine
+
+
+def top_n(df: pd.DataFrame, n: int, by: str) -> pd.DataFrame:
+    """Top N por selección parcial (nlargest), sin ordenar todo el DataFrame."""
+    return df.nlargest(n, by).reset_index(drop=True)
+
+
+def compute_kpis(fine: pd.DataFrame, campaign_key: str, adset_key: str,
+                 product_key: str, n_products: int = 10):
+    """
+    Calcula los KPIs globales, por campaña, por adset y el top N de productos a
+    partir del grano fino (salida de aggregate_fine o de una agregación en SQL).
+
+    Devuelve (kpi_global: dict, kpi_campaign, kpi_adset, top_products).
+    """
+    kpi_adset = (fine.groupby([adset_key, campaign_key], sort=False, dropna=False)[TOTALS]
+                     .sum().reset_index())
+    kpi_campaign = (kpi_adset.groupby(campaign_key, sort=False, dropna=False)[TOTALS]
+                             .sum().reset_index())
+    products = (fine.groupby(product_key, sort=False, dropna=False)
+                    [["total_revenue", "total_conversions"]].sum().reset_index())
+    top_products = top_n(products, n_products, "total_revenue")
+
+    totals = kpi_campaign[TOTALS].sum()
+    kpi_global = {k: totals[k] for k in ["total_budget", "total_revenue", "total_conversions",
+                                         "total_clicks", "total_impressions"]}
+    kpi_global.update(add_ratios(totals.to_frame().T)[RATIOS].iloc[0].to_dict())
+
+    return kpi_global, add_ratios(kpi_campaign), add_ratios(kpi_adset), top_products
+
+
+def grouping_sets_sql(source: str, campaign_key: str, adset_key: str,
+                      product_key: str, n_products: int = 10) -> str:
+    """
+    SQL de DuckDB que calcula los niveles adset, campaña, producto (top N por ingresos)
+    y global en una sola pasada con GROUPING SETS, con CPA/ROAS/CPC/CTR ya calculados
+    (0 si el denominador es 0, como add_ratios).
+
+    `source` es una tabla o subconsulta con las columnas crudas de MEASURES y las tres
+    claves. Devuelve una fila por grupo con la columna `grain`; ver kpis_from_grains.
+    """
+    keys = f"{campaign_key}, {adset_key}, {product_key}"
+    sums = ",\n            ".join(f"coalesce(sum({src}), 0)::DOUBLE AS {dst}"
+                                 for src, dst in MEASURES.items())
+    ratios = ",\n        ".join(f"coalesce({num} / nullif({den}, 0), 0) AS {name}"
+                                  for name, (num, den) in RATIO_TERMS.items())
+    grain = " ".join(f"WHEN {i} THEN '{name}'" for i, name in GRAIN_IDS.items())
+    product_id = next(i for i, name in GRAIN_IDS.items() if name == "product")
+    return f"""
+    WITH grains AS (
+        SELECT
+            GROUPING({keys}) AS grain_id,
+            {keys},
+            {sums}
+        FROM {source}
+        GROUP BY GROUPING SETS (
+            ({campaign_key}, {adset_key}),
+            ({campaign_key}),
+            ({product_key}),
+            ()
+        )
+    )
+    SELECT
+        CASE grain_id {grain} END AS grain,
+        {keys},
+        {', '.join(TOTALS)},
+        {ratios}
+    FROM grains
+    QUALIFY grain_id <> {product_id}
+        OR row_number() OVER (PARTITION BY grain_id ORDER BY total_revenue DESC) <= {n_products}
+    """
+
+
+def kpis_from_grains(grains: pd.DataFrame, campaign_key: str, adset_key: str,
+                     product_key: str):
+    """
+    Misma salida que compute_kpis, a partir del resultado de grouping_sets_sql: solo
+    separa las filas por nivel (los totales y ratios ya vienen de DuckDB).
+    """
+    by_grain = {g: df.reset_index(drop=True) for g, df in grains.groupby("grain")}
+    empty = grains.iloc[0:0]
+
+    kpi_adset = by_grain.get("adset", empty)[[adset_key, campaign_key, *TOTALS, *RATIOS]]
+    kpi_campaign = by_grain.get("campaign", empty)[[campaign_key, *TOTALS, *RATIOS]]
+    top_products = (by_grain.get("product", empty)
+                    [[product_key, "total_revenue", "total_conversions"]]
+                    .sort_values("total_revenue", ascending=False)
+                    .reset_index(drop=True))
+
+    global_row = by_grain.get("global", empty)
+    kpi_global = {k: (global_row[k].iloc[0] if len(global_row) else 0.0)
+                  for k in ["total_budget", "total_revenue", "total_conversions",
+                            "total_clicks", "total_impressions", *RATIOS]}
+    return kpi_global, kpi_campaign.reset_index(drop=True), \
+        kpi_adset.reset_index(drop=True), top_products
+
+
+def ad_kpis(ads: pd.DataFrame) -> pd.DataFrame:
+    """KPIs por anuncio (grano ad_id) para step11; ratios sin denominador quedan en NaN."""
+    ads["ctr"] = safe_div(ads["clicks"], ads["impresions"], 0.0)
+    ads["revenue"] = ads["conversions"] * ads["aov"]
+    ads["cpa"] = safe_div(ads["budget"], ads["conversions"], np.nan)
+    ads["roas"] = safe_div(ads["revenue"], ads["budget"], np.nan)
+    # margen “bruto” vs inversión
+    ads["margin"] = ads["revenue"] - ads["budget"]
+    ads["margin_pct"] = safe_div(ads["margin"], ads["revenue"], np.nan)
+    return ads
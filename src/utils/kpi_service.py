@@ -0,0 +1,369 @@
+# src/utils/kpi_service.py
+# Servicio HTTP (asyncio, solo biblioteca estándar) de KPIs sobre warehouse.duckdb:
+#
+#   GET /kpi/<global|campaign|adset|product|budget_plan>?run_ts=all|latest|<run>
+#       &format=json|arrow&limit=N
+#   GET /health
+#
+# Las consultas van a un pool de conexiones DuckDB de solo lectura (en hilos, sin
+# bloquear el event loop) y las respuestas ya serializadas se guardan en un LRU cuya
+# clave incluye la clave de corrida: última run_ts + huella de los marts. La clave se
+# recalcula solo cuando se publica una versión nueva del warehouse (utils/warehouse),
+# así un acierto de caché no toca DuckDB.
+#
+# El pool lee la versión publicada, que el pipeline nunca reescribe: las consultas no
+# esperan a los pasos que escriben. Al publicarse una versión nueva, las consultas
+# nuevas van a ella y la conexión anterior se cierra cuando termina la última que la
+# usaba; clave de corrida y respuesta salen siempre de la misma versión.
+import io
+import json
+import time
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from urllib.parse import urlsplit, parse_qsl
+
+import duckdb
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from .warehouse import WAREHOUSE_PATH, current_path, read_current, version_signature
+
+RATIOS_SQL = """
+    coalesce(total_budget / nullif(total_conversions, 0), 0) AS cpa,
+    coalesce(total_revenue / nullif(total_budget, 0), 0) AS roas,
+    coalesce(total_budget / nullif(total_clicks, 0), 0) AS cpc,
+    coalesce(total_margin / nullif(total_revenue, 0) * 100, 0) AS margin_pct
+"""
+TOTALS_SQL = """
+    sum(total_budget) AS total_budget, sum(total_clicks) AS total_clicks,
+    sum(total_conversions) AS total_conversions, sum(total_revenue) AS total_revenue,
+    sum(total_margin) AS total_margin
+"""
+
+# Nivel de la simulación -> (columnas clave, orden por defecto)
+SIM_ENDPOINTS = {
+    "campaign": (["campaign_id", "campaign_name"], "total_margin DESC"),
+    "adset": (["campaign_id", "adset_name", "campaign_name"], "total_margin DESC"),
+    "product": (["product_id", "product_name"], "total_revenue DESC"),
+}
+ENDPOINTS = ("global", *SIM_ENDPOINTS, "budget_plan")
+
+# Tablas cuya huella entra en la clave de corrida
+FINGERPRINT_TABLES = ["mart.kpi_cum_campaign", "mart.kpi_cum_adset", "mart.kpi_cum_product",
+                      "mart.snap_budget_plan"]
+
+CONTENT_TYPES = {"json": "application/json", "arrow": "application/vnd.apache.arrow.stream"}
+
+
+def kpi_query(endpoint: str, run_ts: str = "all", limit: int = None):
+    """(SQL, parámetros) del endpoint. run_ts: all (histórico), latest o una corrida."""
+    params = []
+    if endpoint == "budget_plan":
+        run_filter = "(SELECT max(run_ts) FROM mart.snap_budget_plan)"
+        if run_ts not in ("all", "latest"):
+            run_filter, params = "?", [run_ts]
+        sql = f"""
+            SELECT * FROM mart.snap_budget_plan
+            {"" if run_ts == "all" else f"WHERE run_ts = {run_filter}"}
+            ORDER BY run_ts, new_budget DESC
+        """
+    else:
+        level = "campaign" if endpoint == "global" else endpoint
+        if run_ts == "all":
+            source = f"mart.kpi_cum_{level}"
+        elif run_ts == "latest":
+            source = (f"(SELECT * FROM mart.kpi_run_{level} "
+                      f"WHERE run_ts = (SELECT max(run_ts) FROM mart.kpi_run_{level}))")
+        else:
+            source, params = f"(SELECT * FROM mart.kpi_run_{level} WHERE run_ts = ?)", [run_ts]
+        if endpoint == "global":
+            sql = f"SELECT *, {RATIOS_SQL} FROM (SELECT {TOTALS_SQL} FROM {source})"
+        else:
+            keys, order = SIM_ENDPOINTS[endpoint]
+            sql = f"""
+                SELECT {", ".join(keys)}, {TOTALS_SQL}
+                FROM {source} GROUP BY ALL
+            """
+            sql = f"SELECT *, {RATIOS_SQL} FROM ({sql}) ORDER BY {order}, {keys[0]}"
+    if limit is not None:
+        sql = f"SELECT * FROM ({sql}) LIMIT {int(limit)}"
+    return sql, params
+
+
+class WarehousePool:
+    """
+    Pool de cursores de solo lectura por versión publicada del warehouse. Las
+    conexiones de versiones anteriores se cierran en cuanto quedan sin consultas.
+    """
+
+    def __init__(self, path: str, size: int = 4):
+        self.path = path
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(size)
+        self._versions = {}  # archivo -> {"con", "idle", "in_use"}
+        self._latest = None
+
+    @contextmanager
+    def cursor(self, file: str = None):
+        file = file or current_path(self.path)
+        self._slots.acquire()
+        try:
+            with self._lock:
+                entry = self._versions.get(file)
+                if entry is None:
+                    entry = {"con": duckdb.connect(file, read_only=True), "idle": [],
+                             "in_use": 0}
+                    self._versions[file] = entry
+                self._latest = file
+                cur = entry["idle"].pop() if entry["idle"] else entry["con"].cursor()
+                entry["in_use"] += 1
+            try:
+                yield cur
+            finally:
+                with self._lock:
+                    entry["idle"].append(cur)
+                    entry["in_use"] -= 1
+                    self._retire()
+        finally:
+            self._slots.release()
+
+    def _retire(self):
+        for file, entry in list(self._versions.items()):
+            if file != self._latest and entry["in_use"] == 0:
+                self._close(self._versions.pop(file))
+
+    @staticmethod
+    def _close(entry):
+        for cur in entry["idle"]:
+            cur.close()
+        entry["con"].close()
+
+    def open_versions(self) -> list:
+        with self._lock:
+            return list(self._versions)
+
+    def close(self):
+        with self._lock:
+            for entry in self._versions.values():
+                self._close(entry)
+            self._versions = {}
+
+
+class ResultCache:
+    """LRU de respuestas serializadas: clave -> (cuerpo, content-type, cabeceras)."""
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._items = OrderedDict()
+        self.hits = self.misses = 0
+
+    def get(self, key):
+        item = self._items.get(key)
+        if item is None:
+            self.misses += 1
+            return None
+        self._items.move_to_end(key)
+        self.hits += 1
+        return item
+
+    def put(self, key, value):
+        self._items[key] = value
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_entries:
+            self._items.popitem(last=False)
+
+    def clear(self):
+        self._items.clear()
+
+    def __len__(self):
+        return len(self._items)
+
+
+def _without_nan(table: pa.Table) -> pa.Table:
+    """NaN -> null en columnas float (JSON no admite NaN)."""
+    for i, field in enumerate(table.schema):
+        if pa.types.is_floating(field.type):
+            col = table.column(i)
+            table = table.set_column(i, field.name, pc.if_else(pc.is_nan(col), None, col))
+    return table
+
+
+def encode(table: pa.Table, fmt: str) -> bytes:
+    if fmt == "arrow":
+        sink = io.BytesIO()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue()
+    return json.dumps(_without_nan(table).to_pylist(), default=str).encode()
+
+
+class KpiService:
+    def __init__(self, warehouse_path: str = WAREHOUSE_PATH, pool_size: int = 4,
+                 cache_size: int = 256):
+        self.warehouse_path = warehouse_path
+        self.pool = WarehousePool(warehouse_path, pool_size)
+        self.cache = ResultCache(cache_size)
+        self._signature = None
+        self._run = {"run_key": None, "latest_run_ts": None, "version": None, "file": None}
+        self._run_lock = asyncio.Lock()
+        self._inflight = {}
+
+    # --- clave de corrida -------------------------------------------------------
+    def _read_run_key(self, file: str) -> dict:
+        with self.pool.cursor(file) as cur:
+            existing = {f"{s}.{t}" for s, t in cur.execute(
+                "SELECT schema_name, table_name FROM duckdb_tables()").fetchall()}
+            parts = []
+            for table in FINGERPRINT_TABLES:
+                if table in existing:
+                    parts.append(cur.execute(
+                        f"SELECT count(*), coalesce(sum(hash(t)), 0)::VARCHAR FROM {table} AS t"
+                    ).fetchone())
+                else:
+                    parts.append(None)
+            latest = None
+            if "mart.kpi_run_campaign" in existing:
+                latest = cur.execute(
+                    "SELECT max(run_ts)::VARCHAR FROM mart.kpi_run_campaign").fetchone()[0]
+        run_key = hashlib.sha256(json.dumps([latest, parts]).encode()).hexdigest()[:16]
+        return {"run_key": run_key, "latest_run_ts": latest}
+
+    async def run_key(self) -> dict:
+        """Info de la corrida vigente. Solo consulta DuckDB si se publicó otra versión."""
+        signature = version_signature(self.warehouse_path)
+        if signature == self._signature:
+            return self._run
+        async with self._run_lock:
+            if signature == self._signature:
+                return self._run
+            manifest = read_current(self.warehouse_path)
+            file = current_path(self.warehouse_path)
+            run = await asyncio.to_thread(self._read_run_key, file)
+            run.update(version=manifest["version"] if manifest else 0, file=file)
+            if run["run_key"] != self._run["run_key"]:
+                # Llegó una corrida nueva (o cambiaron los marts): se invalida todo
+                self.cache.clear()
+            self._run, self._signature = run, signature
+            return run
+
+    # --- consultas --------------------------------------------------------------
+    def _render(self, file: str, endpoint: str, run_ts: str, limit, fmt: str) -> bytes:
+        sql, params = kpi_query(endpoint, run_ts, limit)
+        with self.pool.cursor(file) as cur:
+            table = cur.execute(sql, params).fetch_arrow_table()
+        return encode(table, fmt)
+
+    async def kpis(self, endpoint: str, run_ts: str = None, limit=None, fmt: str = "json"):
+        """(cuerpo, cabeceras extra) del endpoint, desde la caché si la corrida no cambió."""
+        run_ts = run_ts or ("latest" if endpoint == "budget_plan" else "all")
+        run = await self.run_key()
+        key = (endpoint, run_ts, limit, fmt, run["run_key"])
+        headers = {"ETag": f'"{run["run_key"]}"', "X-KPI-Run": str(run["latest_run_ts"]),
+                   "X-KPI-Version": str(run["version"])}
+        body = self.cache.get(key)
+        if body is not None:
+            return body, {**headers, "X-KPI-Cache": "hit"}
+        # Varias peticiones iguales a la vez comparten una sola consulta
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(asyncio.to_thread(self._render, run["file"], endpoint,
+                                                           run_ts, limit, fmt))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        body = await task
+        self.cache.put(key, body)
+        return body, {**headers, "X-KPI-Cache": "miss"}
+
+    # --- HTTP -------------------------------------------------------------------
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                try:
+                    method, target, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    await self._respond(writer, 400, {"error": "petición inválida"})
+                    break
+                keep_alive = (headers.get("connection", "").lower() != "close"
+                              and version == "HTTP/1.1")
+                await self._dispatch(writer, method, target, headers, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _dispatch(self, writer, method, target, headers, keep_alive):
+        t0 = time.perf_counter()
+        url = urlsplit(target)
+        query = dict(parse_qsl(url.query))
+        parts = [p for p in url.path.split("/") if p]
+        if method != "GET":
+            return await self._respond(writer, 405, {"error": "solo GET"}, keep_alive=keep_alive)
+        if parts == ["health"]:
+            run = await self.run_key()
+            return await self._respond(writer, 200, {
+                **run, "open_versions": len(self.pool.open_versions()),
+                "cache_entries": len(self.cache),
+                "cache_hits": self.cache.hits, "cache_misses": self.cache.misses,
+            }, keep_alive=keep_alive)
+        if len(parts) != 2 or parts[0] != "kpi" or parts[1] not in ENDPOINTS:
+            return await self._respond(writer, 404, {"error": "no encontrado",
+                                                     "endpoints": list(ENDPOINTS)},
+                                       keep_alive=keep_alive)
+        fmt = query.get("format", "json")
+        if fmt not in CONTENT_TYPES:
+            return await self._respond(writer, 400, {"error": f"formato no soportado: {fmt}"},
+                                       keep_alive=keep_alive)
+        try:
+            limit = int(query["limit"]) if "limit" in query else None
+        except ValueError:
+            return await self._respond(writer, 400, {"error": "limit debe ser entero"},
+                                       keep_alive=keep_alive)
+        if limit is not None and limit < 0:
+            return await self._respond(writer, 400, {"error": "limit no puede ser negativo"},
+                                       keep_alive=keep_alive)
+        try:
+            body, extra = await self.kpis(parts[1], query.get("run_ts"), limit, fmt)
+        except duckdb.Error as e:
+            return await self._respond(writer, 500, {"error": str(e)}, keep_alive=keep_alive)
+        extra["Server-Timing"] = f"kpi;dur={(time.perf_counter() - t0) * 1000:.2f}"
+        if headers.get("if-none-match") == extra["ETag"]:
+            return await self._respond(writer, 304, b"", extra, keep_alive=keep_alive)
+        await self._respond(writer, 200, body, extra, CONTENT_TYPES[fmt], keep_alive)
+
+    @staticmethod
+    async def _respond(writer, status, body, headers=None, content_type="application/json",
+                       keep_alive=False):
+        reasons = {200: "OK", 304: "Not Modified", 400: "Bad Request", 404: "Not Found",
+                   405: "Method Not Allowed", 500: "Internal Server Error"}
+        if not isinstance(body, bytes):
+            body = json.dumps(body, default=str).encode()
+        lines = [f"HTTP/1.1 {status} {reasons.get(status, '')}",
+                 f"Content-Type: {content_type}",
+                 f"Content-Length: {len(body)}",
+                 f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+        lines += [f"{k}: {v}" for k, v in (headers or {}).items()]
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+        await writer.drain()
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 8765):
+        server = await asyncio.start_server(self.handle, host, port)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.pool.close()
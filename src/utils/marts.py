@@ -0,0 +1,203 @@
+# src/utils/marts.py
+# Marts particionados por corrida (run_ts). Cada corrida nueva solo escribe su
+# partición y actualiza de forma incremental:
+#   - mart.kpi_run_<nivel>: totales por corrida y nivel (campaña / adset / producto)
+#   - mart.kpi_cum_<nivel>: sumas acumuladas por nivel (histórico completo)
+# Las tendencias y deltas entre corridas salen de vistas con funciones de ventana
+# sobre mart.kpi_run_<nivel>, sin volver a leer la simulación cruda.
+
+# Medidas acumulables (las razones se calculan siempre a partir de ellas)
+AGG_MEASURES = ["budget", "clicks", "conversions", "revenue", "margin"]
+
+# Niveles de agregación de la simulación por adset: nombre -> (clave, atributos)
+SIM_LEVELS = {
+    "campaign": (["campaign_id"], ["campaign_name"]),
+    "adset": (["campaign_id", "adset_name"], ["campaign_name"]),
+    "product": (["product_id"], ["product_name"]),
+}
+
+# Niveles de los KPIs por anuncio (step11), sobre las particiones de mart.snap_ads_kpis
+ADS_LEVELS = {
+    "ads_campaign": (["campaign_id"], []),
+    "ads_adset": (["campaign_id", "adset_name"], []),
+}
+ADS_SOURCE = """
+    SELECT run_ts, campaign_id, adset_name, budget, clicks, conversions, revenue, margin
+    FROM mart.snap_ads_kpis
+"""
+
+# Fuente de la simulación con los nombres de las dimensiones
+SIM_SOURCE = """
+    SELECT sim.run_ts, sim.campaign_id, c.campaign_name, sim.adset_name,
+           sim.product_id, p.product_name,
+           sim.budget, sim.clicks, sim.conversions, sim.revenue, sim.margin
+    FROM snapshot_adset_simulation AS sim
+    LEFT JOIN snapshot_campaigns AS c ON sim.campaign_id = c.campaign_id
+    LEFT JOIN snapshot_products AS p ON sim.product_id = p.product_id
+"""
+
+
+def _columns(con, table: str) -> list:
+    schema, _, name = table.rpartition(".")
+    return [r[0] for r in con.execute(
+        "SELECT column_name FROM information_schema.columns "
+        "WHERE table_schema = ? AND table_name = ? ORDER BY ordinal_position",
+        [schema or "main", name]).fetchall()]
+
+
+def write_run_partition(con, table: str, source: str, run_ts):
+    """
+    Reemplaza la partición `run_ts` de `table` con las filas de `source` (tabla, vista
+    o DataFrame registrado). Crea la tabla si no existe, añade columnas nuevas y
+    convierte una tabla antigua sin run_ts (CREATE OR REPLACE de otras versiones).
+    """
+    existing = _columns(con, table)
+    if existing and "run_ts" not in existing:
+        con.execute(f"DROP TABLE {table}")
+        existing = []
+    # Las columnas category de pandas llegan como ENUM: se guardan como VARCHAR
+    described = [(name, "VARCHAR" if dtype.startswith("ENUM") else dtype)
+                 for name, dtype, *_ in con.execute(f"DESCRIBE SELECT * FROM {source}").fetchall()]
+    select = ", ".join(f'"{name}"::{dtype} AS "{name}"' for name, dtype in described)
+    if not existing:
+        con.execute(f"CREATE TABLE {table} AS SELECT {select} FROM {source} LIMIT 0")
+    else:
+        for name, dtype in described:
+            if name not in existing:
+                con.execute(f'ALTER TABLE {table} ADD COLUMN "{name}" {dtype}')
+    con.execute(f"DELETE FROM {table} WHERE run_ts = ?", [run_ts])
+    con.execute(f"INSERT INTO {table} BY NAME SELECT {select} FROM {source}")
+
+
+def _sums() -> str:
+    return ", ".join(f"sum({m})::DOUBLE AS total_{m}" for m in AGG_MEASURES)
+
+
+def _rebuild_level(con, name: str, source: str, keys, attrs):
+    cols = ", ".join(keys + attrs)
+    con.execute(f"""
+        CREATE OR REPLACE TABLE mart.kpi_run_{name} AS
+        SELECT run_ts, {cols}, {_sums()}, count(*) AS n_rows
+        FROM ({source}) GROUP BY run_ts, {cols}
+    """)
+    con.execute(f"""
+        CREATE OR REPLACE TABLE mart.kpi_cum_{name} (
+            {', '.join(f'{k} {t}' for k, t in _key_types(con, name, keys + attrs))},
+            {', '.join(f'total_{m} DOUBLE' for m in AGG_MEASURES)},
+            n_rows BIGINT, n_runs BIGINT, first_run_ts VARCHAR, last_run_ts VARCHAR,
+            PRIMARY KEY ({', '.join(keys)})
+        )
+    """)
+    con.execute(f"""
+        INSERT INTO mart.kpi_cum_{name}
+        SELECT {cols}, {', '.join(f'sum(total_{m})' for m in AGG_MEASURES)},
+               sum(n_rows), count(*), min(run_ts), max(run_ts)
+        FROM mart.kpi_run_{name} GROUP BY {cols}
+    """)
+
+
+def _key_types(con, name: str, columns):
+    types = {row[0]: row[1] for row in con.execute(f"DESCRIBE mart.kpi_run_{name}").fetchall()}
+    return [(c, types[c]) for c in columns]
+
+
+def _update_level(con, name: str, source: str, keys, attrs, runs):
+    """
+    Sustituye las particiones `runs` de mart.kpi_run_<nivel> y ajusta las sumas
+    acumuladas con la diferencia (nuevo - anterior), así una corrida re-procesada
+    no se cuenta dos veces. La primera / última corrida de cada clave tocada se
+    recalcula desde las particiones (una corrida puede perder claves al re-procesarse).
+    """
+    cols = ", ".join(keys + attrs)
+    placeholders = ", ".join("?" for _ in runs)
+    con.execute(f"""
+        CREATE OR REPLACE TEMP TABLE new_part AS
+        SELECT run_ts, {cols}, {_sums()}, count(*) AS n_rows
+        FROM ({source}) WHERE run_ts IN ({placeholders}) GROUP BY run_ts, {cols}
+    """, list(runs))
+
+    # delta por clave: partición nueva (+) menos partición anterior (-)
+    signed = f"""
+        SELECT {cols}, {', '.join(f'total_{m}' for m in AGG_MEASURES)}, n_rows, 1 AS n_runs, run_ts
+        FROM new_part
+        UNION ALL
+        SELECT {cols}, {', '.join(f'-total_{m}' for m in AGG_MEASURES)}, -n_rows, -1, NULL
+        FROM mart.kpi_run_{name} WHERE run_ts IN ({placeholders})
+    """
+    updates = ", ".join([f"total_{m} = kpi_cum_{name}.total_{m} + excluded.total_{m}"
+                         for m in AGG_MEASURES]
+                        + [f"{a} = coalesce(excluded.{a}, kpi_cum_{name}.{a})" for a in attrs]
+                        + [f"n_rows = kpi_cum_{name}.n_rows + excluded.n_rows",
+                           f"n_runs = kpi_cum_{name}.n_runs + excluded.n_runs"])
+    con.execute(f"""
+        CREATE OR REPLACE TEMP TABLE touched_keys AS
+        SELECT DISTINCT {', '.join(keys)} FROM ({signed})
+    """, list(runs))
+    con.execute(f"""
+        INSERT INTO mart.kpi_cum_{name}
+        SELECT {', '.join(keys)}, {', '.join(f'max({a})' for a in attrs) + ',' if attrs else ''}
+               {', '.join(f'sum(total_{m})' for m in AGG_MEASURES)},
+               sum(n_rows), sum(n_runs), min(run_ts), max(run_ts)
+        FROM ({signed}) GROUP BY {', '.join(keys)}
+        ON CONFLICT ({', '.join(keys)}) DO UPDATE SET {updates}
+    """, list(runs))
+    con.execute(f"DELETE FROM mart.kpi_cum_{name} WHERE n_runs <= 0")
+
+    con.execute(f"DELETE FROM mart.kpi_run_{name} WHERE run_ts IN ({placeholders})", list(runs))
+    con.execute(f"INSERT INTO mart.kpi_run_{name} BY NAME SELECT * FROM new_part")
+    match = " AND ".join(f"c.{k} = r.{k}" for k in keys)
+    con.execute(f"""
+        UPDATE mart.kpi_cum_{name} AS c
+        SET first_run_ts = r.first_run_ts, last_run_ts = r.last_run_ts
+        FROM (
+            SELECT {', '.join(keys)}, min(run_ts) AS first_run_ts, max(run_ts) AS last_run_ts
+            FROM mart.kpi_run_{name}
+            WHERE ({', '.join(keys)}) IN (SELECT ({', '.join(keys)}) FROM touched_keys)
+            GROUP BY {', '.join(keys)}
+        ) AS r
+        WHERE {match}
+    """)
+    con.execute("DROP TABLE new_part")
+    con.execute("DROP TABLE touched_keys")
+
+
+def trend_view_sql(name: str, keys) -> str:
+    """Vista de tendencias: deltas entre corridas, media móvil y acumulados por ventana."""
+    part = ", ".join(keys)
+    return f"""
+        CREATE OR REPLACE VIEW mart.v_kpi_{name}_trend AS
+        SELECT r.*,
+               total_revenue / nullif(total_budget, 0)      AS roas,
+               total_budget / nullif(total_conversions, 0)  AS cpa,
+               total_margin / nullif(total_revenue, 0)      AS margin_pct,
+               total_revenue - lag(total_revenue) OVER w    AS delta_revenue,
+               total_margin - lag(total_margin) OVER w      AS delta_margin,
+               total_revenue / nullif(lag(total_revenue) OVER w, 0) - 1 AS revenue_growth,
+               avg(total_margin) OVER (w ROWS BETWEEN 2 PRECEDING AND CURRENT ROW) AS margin_ma3,
+               sum(total_revenue) OVER (w ROWS UNBOUNDED PRECEDING) AS running_revenue,
+               sum(total_margin) OVER (w ROWS UNBOUNDED PRECEDING)  AS running_margin,
+               row_number() OVER w AS run_number
+        FROM mart.kpi_run_{name} AS r
+        WINDOW w AS (PARTITION BY {part} ORDER BY run_ts)
+    """
+
+
+def update_run_aggregates(con, source: str, levels: dict, runs=None):
+    """
+    Mantiene mart.kpi_run_<nivel>, mart.kpi_cum_<nivel> y mart.v_kpi_<nivel>_trend.
+    Con `runs` solo se procesan esas corridas; sin `runs` (o si las tablas aún no
+    existen) se reconstruye todo desde `source`. Todo en una transacción.
+    """
+    con.execute("CREATE SCHEMA IF NOT EXISTS mart")
+    con.execute("BEGIN TRANSACTION")
+    try:
+        for name, (keys, attrs) in levels.items():
+            if runs is None or not _columns(con, f"mart.kpi_cum_{name}"):
+                _rebuild_level(con, name, source, keys, attrs)
+            elif runs:
+                _update_level(con, name, source, keys, attrs, sorted(runs))
+            con.execute(trend_view_sql(name, keys))
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
@@ -0,0 +1,188 @@
+# src/utils/montecarlo.py
+# Simulación Monte Carlo de adset_simulation por lotes: cada lote es un arreglo
+# (corridas × adsets × productos) generado de una vez con NumPy, sin bucles por fila.
+import io
+from datetime import datetime, timezone
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
+
+# Columnas en el mismo orden que public.adset_simulation (00_schema.sql)
+SIM_COLUMNS = ["run_ts", "campaign_id", "adset_name", "product_id", "sku", "budget",
+               "cpc", "cvr", "aov", "clicks", "conversions", "revenue", "margin",
+               "created_at"]
+
+
+def load_dimensions(con) -> dict:
+    """
+    Lee campañas, adsets y productos de los snapshots del warehouse y los deja como
+    arreglos: un eje de adsets (con su campaña y parámetros medios) y uno de productos.
+    Las campañas sin adsets se simulan con un adset único.
+    """
+    adsets = con.execute("""
+        WITH a AS (
+            SELECT
+                c.campaign_id,
+                coalesce(a.adset_name, c.campaign_name || ' - default') AS adset_name,
+                coalesce(a.budget_weight, 1)::DOUBLE AS w,
+                c.budget::DOUBLE AS campaign_budget,
+                coalesce(a.cpc, c.cpc)::DOUBLE AS cpc,
+                coalesce(a.cvr, c.cvr)::DOUBLE AS cvr
+            FROM snapshot_campaigns AS c
+            LEFT JOIN snapshot_adsets AS a ON a.campaign_id = c.campaign_id
+        )
+        SELECT campaign_id, adset_name, cpc, cvr,
+               campaign_budget * w / sum(w) OVER (PARTITION BY campaign_id) AS budget
+        FROM a
+        ORDER BY campaign_id, adset_name
+    """).fetch_arrow_table()
+    products = con.execute("""
+        SELECT product_id, sku, sale_price::DOUBLE AS sale_price, unit_cost::DOUBLE AS unit_cost
+        FROM snapshot_products
+        ORDER BY product_id
+    """).fetch_arrow_table()
+
+    dims = {name: adsets[name].to_numpy(zero_copy_only=False) for name in adsets.column_names}
+    dims.update({name: products[name].to_numpy(zero_copy_only=False)
+                 for name in products.column_names})
+    # Mezcla de presupuesto uniforme entre productos (se puede sobrescribir)
+    dims["product_weight"] = np.full(len(dims["product_id"]), 1.0 / len(dims["product_id"]))
+    return dims
+
+
+def simulate_batch(rng, dims: dict, run_ts, cpc_sigma=0.15, cvr_concentration=200.0,
+                   aov_sigma=0.10, clicks_dist="poisson", nb_dispersion=10.0,
+                   created_at=None) -> pa.Table:
+    """
+    Genera todas las filas de len(run_ts) corridas en una sola pasada vectorizada.
+
+    - cpc ~ lognormal centrada en el CPC del adset/campaña (cpc_sigma)
+    - clicks ~ Poisson(budget / cpc) o binomial negativa (clicks_dist="negbin")
+    - cvr ~ Beta con media la CVR del adset/campaña (cvr_concentration)
+    - conversions ~ Binomial(clicks, cvr)
+    - aov ~ lognormal centrada en el precio de venta del producto (aov_sigma)
+    - margin = revenue × (1 - costo/precio) - budget
+    """
+    n_runs, n_adsets, n_products = len(run_ts), len(dims["adset_name"]), len(dims["product_id"])
+    shape = (n_runs, n_adsets, n_products)
+
+    budget = np.broadcast_to(dims["budget"][None, :, None] * dims["product_weight"][None, None, :],
+                             shape)
+    cpc = dims["cpc"][None, :, None] * rng.lognormal(-cpc_sigma ** 2 / 2, cpc_sigma, shape)
+    lam = budget / cpc
+    if clicks_dist == "negbin":
+        # Gamma-Poisson: misma media, varianza lam + lam² / nb_dispersion
+        lam = rng.gamma(nb_dispersion, lam / nb_dispersion)
+    elif clicks_dist != "poisson":
+        raise ValueError(f"Distribución de clicks no soportada: {clicks_dist}")
+    clicks = rng.poisson(lam)
+
+    mean_cvr = np.clip(dims["cvr"], 1e-6, 1 - 1e-6)[None, :, None]
+    cvr = rng.beta(cvr_concentration * mean_cvr, cvr_concentration * (1 - mean_cvr),
+                   shape)
+    conversions = rng.binomial(clicks, cvr)
+
+    price = dims["sale_price"][None, None, :]
+    aov = price * rng.lognormal(-aov_sigma ** 2 / 2, aov_sigma, shape)
+    revenue = conversions * aov
+    cost_ratio = np.divide(dims["unit_cost"], dims["sale_price"],
+                           out=np.zeros(n_products), where=dims["sale_price"] > 0)
+    margin = revenue * (1 - cost_ratio)[None, None, :] - budget
+
+    # Índices de cada fila al aplanar en orden (corrida, adset, producto)
+    n = n_runs * n_adsets * n_products
+    run_idx = np.repeat(np.arange(n_runs, dtype=np.int32), n_adsets * n_products)
+    adset_idx = np.tile(np.repeat(np.arange(n_adsets, dtype=np.int32), n_products), n_runs)
+    product_idx = np.tile(np.arange(n_products, dtype=np.int32), n_runs * n_adsets)
+
+    created_at = created_at or datetime.now(timezone.utc)
+    return pa.table({
+        "run_ts": pa.DictionaryArray.from_arrays(run_idx, pa.array(run_ts)),
+        "campaign_id": pa.array(dims["campaign_id"][adset_idx].astype(np.int64)),
+        "adset_name": pa.DictionaryArray.from_arrays(adset_idx, pa.array(dims["adset_name"])),
+        "product_id": pa.array(dims["product_id"][product_idx].astype(np.int64)),
+        "sku": pa.DictionaryArray.from_arrays(product_idx, pa.array(dims["sku"])),
+        "budget": pa.array(budget.reshape(n)),
+        "cpc": pa.array(cpc.reshape(n)),
+        "cvr": pa.array(cvr.reshape(n)),
+        "aov": pa.array(aov.reshape(n)),
+        "clicks": pa.array(clicks.reshape(n)),
+        "conversions": pa.array(conversions.reshape(n)),
+        "revenue": pa.array(revenue.reshape(n)),
+        "margin": pa.array(margin.reshape(n)),
+        "created_at": pa.array(np.full(n, np.datetime64(created_at.replace(tzinfo=None), "us")),
+                               pa.timestamp("us", tz="UTC")),
+    })
+
+
+def simulate_runs(dims: dict, n_runs: int, seed=None, batch_runs: int = 100,
+                  start_ts: datetime = None, **params):
+    """
+    Generador de lotes Arrow con `batch_runs` corridas cada uno. Con la misma semilla
+    y el mismo batch_runs el resultado es reproducible.
+
+    run_ts = "<inicio con microsegundos>#<nº de corrida>": todas las corridas de una
+    invocación comparten el instante en que empezó (nunca uno futuro, que adelantaría
+    la marca de agua) y el sufijo de ancho fijo las distingue y las ordena como texto.
+    """
+    rng = np.random.default_rng(seed)
+    created_at = datetime.now(timezone.utc)
+    base = (start_ts or created_at).strftime("%Y-%m-%dT%H:%M:%S.%f")
+    width = max(6, len(str(n_runs - 1)))
+    for first in range(0, n_runs, batch_runs):
+        last = min(first + batch_runs, n_runs)
+        run_ts = [f"{base}#{i:0{width}d}" for i in range(first, last)]
+        yield simulate_batch(rng, dims, run_ts, created_at=created_at, **params)
+
+
+# -----------------------
+# Escritores masivos
+# -----------------------
+
+
+def write_duckdb(con, table_name: str, batches) -> int:
+    """Inserta los lotes en DuckDB (crea la tabla con el primer lote si no existe)."""
+    rows = 0
+    for batch in batches:
+        con.register("sim_batch", batch)
+        con.execute(f"CREATE TABLE IF NOT EXISTS {table_name} AS SELECT * FROM sim_batch LIMIT 0")
+        con.execute(f"INSERT INTO {table_name} BY NAME SELECT * FROM sim_batch")
+        con.unregister("sim_batch")
+        rows += batch.num_rows
+    return rows
+
+
+def write_parquet(path: str, batches, compression: str = "zstd") -> int:
+    """Escribe los lotes en un único Parquet, un row group por lote."""
+    rows = 0
+    writer = None
+    try:
+        for batch in batches:
+            if writer is None:
+                writer = pq.ParquetWriter(path, batch.schema, compression=compression)
+            writer.write_table(batch)
+            rows += batch.num_rows
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+
+def write_postgres(conn, batches, table_name: str = "public.adset_simulation") -> int:
+    """Carga los lotes en Postgres con COPY FROM STDIN (CSV), un COPY por lote."""
+    rows = 0
+    with conn.cursor() as cur:
+        for batch in batches:
+            buf = io.BytesIO()
+            pacsv.write_csv(batch.select(SIM_COLUMNS), buf)
+            buf.seek(0)
+            cur.copy_expert(
+                f"COPY {table_name} ({', '.join(SIM_COLUMNS)}) FROM STDIN WITH (FORMAT csv, HEADER true)",
+                buf,
+            )
+            rows += batch.num_rows
+    conn.commit()
+    return rows
+
@@ -0,0 +1,269 @@
+# src/utils/perf.py
+# Instrumentación por etapa: tiempo de pared y CPU, filas de entrada/salida, bytes
+# leídos/escritos, pico de RSS y (opcional) pico de tracemalloc.
+#
+#   with stage("fetch", rows_in=n) as m:
+#       ...
+#       m["rows_out"] = len(df)
+#
+# Cada etapa se agrega como una línea a out/pipeline_metrics.jsonl; los scripts nunca
+# abren el warehouse para guardar métricas (un paso de solo lectura no publica una
+# versión nueva por unas filas de métricas). El volcado a mart.pipeline_stage_metrics /
+# mart.pipeline_runs lo hace run_pipeline al final de cada corrida, o a pedido:
+#
+#   python -m src.pipeline.run_pipeline --load-metrics
+#
+# PIPELINE_PROFILE=1      -> cProfile por etapa en out/profiles/<run_id>/*.prof
+# PIPELINE_TRACEMALLOC=1  -> pico de memoria Python por etapa (tracemalloc, más lento)
+import os
+import sys
+import json
+import time
+import uuid
+import cProfile
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+import duckdb
+
+from .warehouse import WAREHOUSE_PATH, connect_warehouse, current_path
+
+METRICS_PATH = os.path.join("out", "pipeline_metrics.jsonl")
+PROFILE_DIR = os.path.join("out", "profiles")
+PROFILE = os.getenv("PIPELINE_PROFILE", "") not in ("", "0")
+TRACEMALLOC = os.getenv("PIPELINE_TRACEMALLOC", "") not in ("", "0")
+
+RUN_ID = os.getenv("PIPELINE_RUN_ID") or datetime.now().strftime("%Y%m%dT%H%M%S-") + uuid.uuid4().hex[:6]
+SCRIPT = os.path.splitext(os.path.basename(sys.argv[0] or "interactive"))[0]
+
+_profiling = False
+
+
+def _io_counters() -> tuple:
+    """(bytes leídos, bytes escritos) del proceso según /proc/self/io; (None, None) fuera de Linux."""
+    try:
+        with open("/proc/self/io") as f:
+            values = dict(line.split(":") for line in f.read().splitlines())
+        return int(values["rchar"]), int(values["wchar"])
+    except (OSError, KeyError, ValueError):
+        return None, None
+
+
+def reset_peak_rss() -> bool:
+    """Reinicia el pico de RSS (VmHWM) del proceso; False si el kernel no lo permite."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb() -> float:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss: KB en Linux, bytes en macOS; es el pico de todo el proceso. resource
+    # no existe en Windows: ahí el pico queda en 0 (sin dato)
+    try:
+        import resource
+    except ImportError:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _diff(end, start):
+    return None if end is None or start is None else end - start
+
+
+@contextmanager
+def stage(name: str, rows_in=None):
+    """
+    Mide una etapa. El dict que se entrega admite rows_in / rows_out (y cualquier otra
+    clave extra, que se guarda en `extra`). Si la etapa lanza una excepción se registra
+    con status="error" y la excepción se propaga.
+    """
+    global _profiling
+    metrics = {"rows_in": rows_in, "rows_out": None}
+    started_at = datetime.now()
+    read0, written0 = _io_counters()
+    reset_peak_rss()
+    if TRACEMALLOC:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+
+    profiler = None
+    if PROFILE and not _profiling:
+        # cProfile no admite perfiles anidados: solo la etapa más externa
+        profiler, _profiling = cProfile.Profile(), True
+        profiler.enable()
+
+    status, error = "ok", None
+    wall0, cpu0 = time.perf_counter(), time.process_time()
+    try:
+        yield metrics
+    except BaseException as e:
+        status, error = "error", f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        wall, cpu = time.perf_counter() - wall0, time.process_time() - cpu0
+        profile_path = None
+        if profiler is not None:
+            profiler.disable()
+            _profiling = False
+            profile_dir = os.path.join(PROFILE_DIR, RUN_ID)
+            os.makedirs(profile_dir, exist_ok=True)
+            profile_path = os.path.join(profile_dir, f"{SCRIPT}.{name}.prof")
+            profiler.dump_stats(profile_path)
+        read1, written1 = _io_counters()
+        extra = {k: v for k, v in metrics.items() if k not in ("rows_in", "rows_out")}
+        record = {
+            "run_id": RUN_ID,
+            "script": SCRIPT,
+            "stage": name,
+            "started_at": started_at.isoformat(timespec="milliseconds"),
+            "finished_at": datetime.now().isoformat(timespec="milliseconds"),
+            "wall_s": round(wall, 4),
+            "cpu_s": round(cpu, 4),
+            "rows_in": metrics["rows_in"],
+            "rows_out": metrics["rows_out"],
+            "bytes_read": _diff(read1, read0),
+            "bytes_written": _diff(written1, written0),
+            "peak_rss_mb": round(peak_rss_mb(), 1),
+            "peak_tracemalloc_mb": (round(tracemalloc.get_traced_memory()[1] / 2**20, 1)
+                                    if TRACEMALLOC else None),
+            "status": status,
+            "error": error,
+            "profile_path": profile_path,
+            "extra": json.dumps(extra, default=str) if extra else None,
+        }
+        _append_jsonl([record])
+
+
+def _append_jsonl(records, path: str = METRICS_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write("".join(json.dumps(r) + "\n" for r in records))
+
+
+def read_jsonl(run_id: str = None, path: str = METRICS_PATH) -> list:
+    """Registros de una corrida (o de todas si run_id es None) desde el JSON-lines."""
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    return [r for r in rows if run_id is None or r.get("run_id") == run_id]
+
+
+def ensure_metrics_tables(con):
+    con.execute("CREATE SCHEMA IF NOT EXISTS mart")
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS mart.pipeline_stage_metrics (
+            run_id              VARCHAR,
+            script              VARCHAR,
+            stage               VARCHAR,
+            started_at          TIMESTAMP,
+            finished_at         TIMESTAMP,
+            wall_s              DOUBLE,
+            cpu_s               DOUBLE,
+            rows_in             BIGINT,
+            rows_out            BIGINT,
+            bytes_read          BIGINT,
+            bytes_written       BIGINT,
+            peak_rss_mb         DOUBLE,
+            peak_tracemalloc_mb DOUBLE,
+            status              VARCHAR,
+            error               VARCHAR,
+            profile_path        VARCHAR,
+            extra               VARCHAR
+        )
+    """)
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS mart.pipeline_runs (
+            run_id        VARCHAR PRIMARY KEY,
+            started_at    TIMESTAMP,
+            finished_at   TIMESTAMP,
+            wall_s        DOUBLE,
+            cpu_s         DOUBLE,
+            n_scripts     INTEGER,
+            n_stages      INTEGER,
+            n_errors      INTEGER,
+            peak_rss_mb   DOUBLE,
+            bytes_read    BIGINT,
+            bytes_written BIGINT,
+            status        VARCHAR
+        )
+    """)
+
+
+def write_metrics(con, records):
+    """Inserta los registros de etapa y recalcula el resumen de sus corridas."""
+    if not records:
+        return
+    ensure_metrics_tables(con)
+    columns = ["run_id", "script", "stage", "started_at", "finished_at", "wall_s", "cpu_s",
+               "rows_in", "rows_out", "bytes_read", "bytes_written", "peak_rss_mb",
+               "peak_tracemalloc_mb", "status", "error", "profile_path", "extra"]
+    con.executemany(
+        f"INSERT INTO mart.pipeline_stage_metrics ({', '.join(columns)}) "
+        f"VALUES ({', '.join('?' for _ in columns)})",
+        [[r.get(c) for c in columns] for r in records],
+    )
+    run_ids = sorted({r["run_id"] for r in records})
+    con.execute(f"""
+        INSERT OR REPLACE INTO mart.pipeline_runs
+        SELECT run_id,
+               min(started_at), max(finished_at),
+               date_diff('millisecond', min(started_at), max(finished_at)) / 1000.0,
+               sum(cpu_s),
+               count(DISTINCT script), count(*),
+               count(*) FILTER (WHERE status <> 'ok'),
+               max(peak_rss_mb), sum(bytes_read), sum(bytes_written),
+               CASE WHEN count(*) FILTER (WHERE status <> 'ok') > 0 THEN 'error' ELSE 'ok' END
+        FROM mart.pipeline_stage_metrics
+        WHERE run_id IN ({', '.join('?' for _ in run_ids)})
+        GROUP BY run_id
+    """, run_ids)
+
+
+def _loaded_scripts(warehouse_path: str) -> set:
+    """{(run_id, script)} ya cargados, leídos de la versión publicada (sin escribir)."""
+    if not os.path.exists(current_path(warehouse_path)):
+        return set()
+    con = connect_warehouse(warehouse_path, read_only=True)
+    try:
+        return set(con.execute(
+            "SELECT DISTINCT run_id, script FROM mart.pipeline_stage_metrics").fetchall())
+    except duckdb.CatalogException:
+        return set()
+    finally:
+        con.close()
+
+
+def load_metrics(warehouse_path: str = WAREHOUSE_PATH, run_id: str = None,
+                 path: str = METRICS_PATH) -> int:
+    """
+    Carga al warehouse las etapas del JSONL (de una corrida, o de todas) que aún no
+    están, en una sola escritura; cada ejecución de un script se carga una vez
+    (clave run_id + script). Si no falta nada no abre el warehouse para escribir.
+    Devuelve el nº de etapas cargadas.
+    """
+    loaded = _loaded_scripts(warehouse_path)
+    records = [r for r in read_jsonl(run_id, path) if (r["run_id"], r["script"]) not in loaded]
+    if not records:
+        return 0
+    con = connect_warehouse(warehouse_path)
+    try:
+        write_metrics(con, records)
+    except BaseException:
+        con.abort()
+        raise
+    con.close()
+    return len(records)
@@ -0,0 +1,125 @@
+# src/utils/pg_transport.py
+# Transporte de extracción directo Postgres -> DuckDB, sin pasar por PostgREST/JSON
+# ni por pandas. Dos métodos:
+#   - "scanner": extensión postgres de DuckDB (ATTACH ... TYPE postgres)
+#   - "copy":    COPY (SELECT ...) TO STDOUT en CSV a un archivo temporal, que DuckDB
+#                lee con los tipos declarados en information_schema
+import os
+import tempfile
+
+import duckdb
+
+from .extract import ORDER_KEYS
+from .supa_client import db_url, get_conn
+from .schema_registry import duckdb_casts
+
+TRANSPORT_METHOD = os.getenv("PG_TRANSPORT_METHOD", "copy")
+
+# information_schema.data_type -> tipo DuckDB
+PG_TO_DUCKDB = {
+    "bigint": "BIGINT",
+    "integer": "INTEGER",
+    "smallint": "SMALLINT",
+    "numeric": "DOUBLE",
+    "double precision": "DOUBLE",
+    "real": "FLOAT",
+    "boolean": "BOOLEAN",
+    "date": "DATE",
+    "timestamp with time zone": "TIMESTAMPTZ",
+    "timestamp without time zone": "TIMESTAMP",
+}
+
+
+def _sql_string(value: str) -> str:
+    """Literal de texto SQL (comillas simples duplicadas), p. ej. un DSN con password='…'."""
+    return "'" + value.replace("'", "''") + "'"
+
+
+def _select_sql(table_name: str, since=None, schema: str = "public", prefix: str = "",
+                placeholder: str = "?"):
+    """SELECT con filtro incremental opcional; devuelve (sql, params)."""
+    sql = f"SELECT * FROM {prefix}{schema}.{table_name}"
+    params = []
+    if since is not None:
+        col, value = since
+        sql += f" WHERE {col} >= {placeholder}"
+        params.append(value)
+    keys = ORDER_KEYS.get(table_name)
+    if keys:
+        sql += f" ORDER BY {', '.join(keys)}"
+    return sql, params
+
+
+def _column_types(cur, table_name: str, schema: str = "public") -> dict:
+    cur.execute("""
+        select column_name, data_type
+        from information_schema.columns
+        where table_schema = %s and table_name = %s
+        order by ordinal_position
+    """, (schema, table_name))
+    return {name: PG_TO_DUCKDB.get(dtype, "VARCHAR") for name, dtype in cur.fetchall()}
+
+
+def _copy_to_csv(table_name: str, since, path: str, schema: str = "public") -> dict:
+    """Vuelca la consulta a CSV con COPY TO STDOUT (streaming a disco). Devuelve los tipos."""
+    sql, params = _select_sql(table_name, since, schema=schema, placeholder="%s")
+    with get_conn() as conn, conn.cursor() as cur:
+        types = _column_types(cur, table_name, schema)
+        query = cur.mogrify(sql, params).decode()
+        with open(path, "w", encoding="utf-8") as f:
+            cur.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER true)", f)
+    return types
+
+
+def _relation_sql(con, table_name: str, since, method: str, tmp_dir: str,
+                  schema: str = "public"):
+    """Expresión SELECT (y sus parámetros) que DuckDB puede consumir directamente."""
+    if method == "scanner":
+        con.execute("INSTALL postgres; LOAD postgres;")
+        attached = con.execute(
+            "SELECT count(*) FROM duckdb_databases() WHERE database_name = 'pg'").fetchone()[0]
+        if not attached:
+            con.execute(f"ATTACH {_sql_string(db_url())} AS pg (TYPE postgres, READ_ONLY)")
+        sql, params = _select_sql(table_name, since, schema=schema, prefix="pg.")
+        columns = [r[0] for r in con.execute(f"DESCRIBE {sql}", params).fetchall()]
+        return f"SELECT {duckdb_casts(table_name, columns)} FROM ({sql})", params
+    if method == "copy":
+        path = os.path.join(tmp_dir, f"{table_name}.csv")
+        types = _copy_to_csv(table_name, since, path, schema)
+        columns = ", ".join(f"'{c}': '{t}'" for c, t in types.items())
+        # Se lee con los tipos de Postgres y se castea a los tipos compactos del registro
+        return (f"SELECT {duckdb_casts(table_name, list(types))} "
+                f"FROM read_csv('{path}', header = true, columns = {{{columns}}})"), []
+    raise ValueError(f"Método de transporte no soportado: {method}")
+
+
+def export_to_parquet(table_name: str, path: str, since=None, method: str = None,
+                      compression: str = "zstd", schema: str = "public") -> int:
+    """Extrae una tabla de Postgres a un Parquet sin pasar por pandas. Devuelve filas."""
+    method = method or TRANSPORT_METHOD
+    con = duckdb.connect()
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            sql, params = _relation_sql(con, table_name, since, method, tmp_dir, schema)
+            tmp = path + ".tmp"
+            con.execute(f"COPY ({sql}) TO '{tmp}' (FORMAT PARQUET, COMPRESSION {compression})",
+                        params)
+            os.replace(tmp, path)
+        return con.execute(f"SELECT count(*) FROM read_parquet('{path}')").fetchone()[0]
+    finally:
+        con.close()
+
+
+def load_into_duckdb(con, table_name: str, dest_table: str, since=None,
+                     method: str = None, temporary: bool = False,
+                     schema: str = "public") -> int:
+    """
+    Carga una tabla de Postgres directamente en `dest_table` del warehouse (la crea
+    o reemplaza), sin DataFrame intermedio. Devuelve el número de filas.
+    """
+    method = method or TRANSPORT_METHOD
+    kind = "TEMP TABLE" if temporary else "TABLE"
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        sql, params = _relation_sql(con, table_name, since, method, tmp_dir, schema)
+        con.execute(f"CREATE OR REPLACE {kind} {dest_table} AS {sql}", params)
+    return con.execute(f"SELECT count(*) FROM {dest_table}").fetchone()[0]
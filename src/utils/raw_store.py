@@ -0,0 +1,121 @@
+# src/utils/raw_store.py
+import os
+import json
+import shutil
+import threading
+
+import duckdb
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from .extract import ORDER_KEYS
+from .schema_registry import categorical_columns
+
+# Capa cruda: un Parquet por tabla (out/raw/<tabla>.parquet) + un manifiesto
+RAW_DIR = os.path.join("out", "raw")
+MANIFEST_NAME = "_manifest.json"
+COMPRESSION = os.getenv("RAW_COMPRESSION", "zstd")
+ROW_GROUP_SIZE = int(os.getenv("RAW_ROW_GROUP_SIZE", "122880"))
+
+
+def raw_path(table_name: str, raw_dir: str = RAW_DIR) -> str:
+    return os.path.join(raw_dir, f"{table_name}.parquet")
+
+
+class RawStoreWriter:
+    """
+    Sumidero para fetch_tables(on_page=...): cada página se escribe a disco en cuanto
+    llega (staging/<tabla>/part-NNNNN.parquet). Al cerrar, DuckDB compacta las partes
+    de cada tabla en un único Parquet ordenado por su clave, con compresión y
+    estadísticas por row group, y unifica tipos entre páginas (p. ej. BIGINT/DOUBLE).
+    """
+
+    def __init__(self, raw_dir: str = RAW_DIR):
+        self.raw_dir = raw_dir
+        self.staging_dir = os.path.join(raw_dir, "_staging")
+        self.rows = {}
+        self._lock = threading.Lock()
+        shutil.rmtree(self.staging_dir, ignore_errors=True)
+        os.makedirs(self.staging_dir, exist_ok=True)
+
+    def __call__(self, table_name: str, page_no: int, df):
+        if df.empty:
+            return
+        part_dir = os.path.join(self.staging_dir, table_name)
+        os.makedirs(part_dir, exist_ok=True)
+        batch = pa.Table.from_pandas(df, preserve_index=False)
+        pq.write_table(batch, os.path.join(part_dir, f"part-{page_no:05d}.parquet"))
+        with self._lock:
+            self.rows[table_name] = self.rows.get(table_name, 0) + len(df)
+
+    def finalize(self, tables) -> dict:
+        """Compacta las partes en out/raw/<tabla>.parquet. Devuelve {tabla: ruta o None}."""
+        con = duckdb.connect()
+        paths = {}
+        for table_name in tables:
+            part_dir = os.path.join(self.staging_dir, table_name)
+            target = raw_path(table_name, self.raw_dir)
+            if not os.path.isdir(part_dir):
+                # Tabla vacía o sin cambios: no se deja un Parquet viejo por error
+                if os.path.exists(target):
+                    os.remove(target)
+                paths[table_name] = None
+                continue
+            keys = ORDER_KEYS.get(table_name, [])
+            order_by = f"ORDER BY {', '.join(keys)}" if keys else ""
+            tmp = target + ".tmp"
+            con.execute(f"""
+                COPY (
+                    SELECT * FROM read_parquet('{part_dir}/*.parquet', union_by_name = true)
+                    {order_by}
+                ) TO '{tmp}' (FORMAT PARQUET, COMPRESSION {COMPRESSION},
+                             ROW_GROUP_SIZE {ROW_GROUP_SIZE})
+            """)
+            os.replace(tmp, target)
+            paths[table_name] = target
+        con.close()
+        shutil.rmtree(self.staging_dir, ignore_errors=True)
+        return paths
+
+
+def write_manifest(manifest: dict, raw_dir: str = RAW_DIR):
+    with open(os.path.join(raw_dir, MANIFEST_NAME), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+
+def read_manifest(raw_dir: str = RAW_DIR) -> dict:
+    path = os.path.join(raw_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def read_table(table_name: str, columns=None, filters=None, raw_dir: str = RAW_DIR):
+    """
+    Lee una tabla cruda como Arrow (memory-mapped), solo con las columnas pedidas.
+    Devuelve None si la tabla no existe en la capa cruda.
+    """
+    path = raw_path(table_name, raw_dir)
+    if not os.path.exists(path):
+        return None
+    # El texto de baja cardinalidad se lee como dictionary directamente del Parquet
+    names = pq.read_schema(path).names
+    dictionary = [c for c in categorical_columns(table_name)
+                  if c in names and (columns is None or c in columns)]
+    return pq.read_table(path, columns=columns, filters=filters, memory_map=True,
+                         read_dictionary=dictionary or None)
+
+
+def scan_sql(table_name: str, raw_dir: str = RAW_DIR) -> str:
+    """Expresión FROM para que DuckDB lea el Parquet directamente (sin pasar por pandas)."""
+    return f"read_parquet('{raw_path(table_name, raw_dir)}')"
+
+
+def column_max(table_name: str, column: str, raw_dir: str = RAW_DIR):
+    """Máximo de una columna de la tabla cruda como texto (None si no hay datos)."""
+    path = raw_path(table_name, raw_dir)
+    if not os.path.exists(path) or column not in pq.read_schema(path).names:
+        return None
+    value = duckdb.sql(f"SELECT max({column})::VARCHAR FROM read_parquet('{path}')").fetchone()[0]
+    return value
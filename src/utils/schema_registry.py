@@ -0,0 +1,209 @@
+# src/utils/schema_registry.py
+# Registro de tipos por tabla, derivado de src/sql/00_schema.sql. Se aplica una sola
+# vez, al extraer (REST, COPY desde Postgres y capa cruda), así los consumidores
+# reciben tipos compactos y limpios y no repiten pd.to_numeric(...).fillna(0):
+#   - texto de baja cardinalidad (nombres, sku, run_ts) -> dictionary / category
+#   - ids (bigint / bigserial) -> int64, como en Postgres
+#   - conteos numeric (clicks, conversions, impresions) -> float64 al guardar; en
+#     memoria int32 solo si la columna es entera y cabe (check_downcast), si no float64
+#   - tasas (cpc, cvr, aov) -> float32; importes -> float64
+#   - timestamptz -> timestamp[us, UTC]
+# Las tablas que no están en el esquema (p. ej. suppliers) pasan sin cambios.
+import os
+import re
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+SCHEMA_SQL = os.path.join(os.path.dirname(__file__), "..", "sql", "00_schema.sql")
+
+CATEGORICAL = {"campaign_name", "adset_name", "sku", "product_name", "run_ts"}
+# Conteos guardados como numeric: la simulación puede dejar fracciones
+COUNTS = {"clicks", "conversions", "impresions"}
+COUNT_DTYPE = pa.int32()
+RATES = {"cpc", "cvr", "aov"}
+
+_CONSTRAINTS = ("primary", "foreign", "unique", "check", "constraint")
+
+# tipo Arrow -> tipo DuckDB (para los CAST del transporte directo)
+_ARROW_TO_DUCKDB = {
+    pa.int16(): "SMALLINT",
+    pa.int32(): "INTEGER",
+    pa.int64(): "BIGINT",
+    pa.float32(): "FLOAT",
+    pa.float64(): "DOUBLE",
+    pa.bool_(): "BOOLEAN",
+    pa.date32(): "DATE",
+    pa.string(): "VARCHAR",
+    pa.timestamp("us"): "TIMESTAMP",
+    pa.timestamp("us", tz="UTC"): "TIMESTAMPTZ",
+}
+
+
+def parse_schema(sql: str) -> dict:
+    """{tabla: [(columna, tipo_pg, not_null, default)]} de los CREATE TABLE del script."""
+    tables = {}
+    pattern = re.compile(
+        r"create\s+table\s+(?:if\s+not\s+exists\s+)?(?:\w+\.)?(\w+)\s*\((.*?)\n\);",
+        re.IGNORECASE | re.DOTALL)
+    for name, body in pattern.findall(sql):
+        columns = []
+        for line in body.splitlines():
+            line = line.split("--")[0].strip().rstrip(",")
+            if not line or line.lower().startswith(_CONSTRAINTS):
+                continue
+            col, rest = line.split(None, 1)
+            pg_type = re.split(r"\s+(?:not\s+null|null|default|primary|references|unique|check)\b",
+                               rest, maxsplit=1, flags=re.IGNORECASE)[0].strip().lower()
+            default = re.search(r"default\s+([^\s,]+)", rest, re.IGNORECASE)
+            columns.append((col, pg_type, "not null" in rest.lower(),
+                            default.group(1) if default else None))
+        tables[name] = columns
+    return tables
+
+
+def arrow_type(column: str, pg_type: str) -> pa.DataType:
+    base = pg_type.split("(")[0].strip()
+    if base in ("text", "varchar", "character varying", "uuid", "char"):
+        return pa.dictionary(pa.int32(), pa.string()) if column in CATEGORICAL else pa.string()
+    if base in ("bigint", "bigserial", "int8"):
+        return pa.int64()
+    if base in ("integer", "int", "int4", "serial"):
+        return pa.int32()
+    if base in ("smallint", "int2"):
+        return pa.int16()
+    if base in ("numeric", "decimal", "double precision", "float8", "real", "float4"):
+        if column in RATES or base in ("real", "float4"):
+            return pa.float32()
+        return pa.float64()
+    if base == "boolean":
+        return pa.bool_()
+    if base == "date":
+        return pa.date32()
+    if base in ("timestamptz", "timestamp with time zone"):
+        return pa.timestamp("us", tz="UTC")
+    if base.startswith("timestamp"):
+        return pa.timestamp("us")
+    return pa.string()
+
+
+def compact_type(column: str, dtype: pa.DataType):
+    """Entero al que se puede bajar la columna en memoria (conteos numeric), o None."""
+    return COUNT_DTYPE if column in COUNTS and pa.types.is_floating(dtype) else None
+
+
+def check_downcast(values, dtype: pa.DataType) -> bool:
+    """
+    True si todos los valores no nulos son enteros y caben en el entero `dtype`: solo
+    entonces se baja la columna (si no, una fracción o un desborde se perderían).
+    """
+    values = np.asarray(values, dtype="float64")
+    values = values[~np.isnan(values)]
+    if not len(values):
+        return True
+    info = np.iinfo(dtype.to_pandas_dtype())
+    return bool(values.min() >= info.min and values.max() <= info.max
+                and np.array_equal(values, np.floor(values)))
+
+
+@lru_cache(maxsize=None)
+def registry() -> dict:
+    """{tabla: {columna: (tipo Arrow, relleno de nulos o None)}} desde 00_schema.sql."""
+    with open(SCHEMA_SQL, encoding="utf-8") as f:
+        parsed = parse_schema(f.read())
+    result = {}
+    for table, columns in parsed.items():
+        result[table] = {}
+        for col, pg_type, not_null, default in columns:
+            dtype = arrow_type(col, pg_type)
+            # Las columnas numéricas NOT NULL DEFAULT n se rellenan con n (antes: fillna(0))
+            fill = None
+            if not_null and default is not None and re.fullmatch(r"-?\d+(\.\d+)?", default):
+                fill = float(default)
+            result[table][col] = (dtype, fill)
+    return result
+
+
+def arrow_schema(table_name: str, columns=None):
+    """Esquema Arrow de la tabla (solo `columns` si se pasa); None si no está registrada."""
+    spec = registry().get(table_name)
+    if spec is None:
+        return None
+    names = [c for c in (columns or spec) if c in spec]
+    return pa.schema([(c, spec[c][0]) for c in names])
+
+
+def categorical_columns(table_name: str) -> list:
+    spec = registry().get(table_name, {})
+    return [c for c, (dtype, _) in spec.items() if pa.types.is_dictionary(dtype)]
+
+
+def duckdb_casts(table_name: str, columns) -> str:
+    """Lista SELECT con CAST al tipo del registro (el texto queda VARCHAR en DuckDB)."""
+    spec = registry().get(table_name, {})
+    items = []
+    for c in columns:
+        if c not in spec:
+            items.append(f'"{c}"')
+            continue
+        dtype = spec[c][0]
+        dtype = dtype.value_type if pa.types.is_dictionary(dtype) else dtype
+        items.append(f'CAST("{c}" AS {_ARROW_TO_DUCKDB.get(dtype, "VARCHAR")}) AS "{c}"')
+    return ", ".join(items)
+
+
+def apply_dtypes(table_name: str, df: pd.DataFrame, downcast: bool = True) -> pd.DataFrame:
+    """
+    Convierte un DataFrame recién extraído (JSON de PostgREST) a los tipos del registro:
+    una sola pasada de to_numeric / to_datetime / category por columna.
+
+    downcast=True baja además los conteos a int32 cuando check_downcast lo permite
+    (frames en memoria); False deja el tipo guardado (capa cruda y snapshots).
+    """
+    spec = registry().get(table_name)
+    if spec is None or df.empty:
+        return df
+    for col in df.columns.intersection(list(spec)):
+        dtype, fill = spec[col]
+        if pa.types.is_dictionary(dtype):
+            df[col] = df[col].astype("category")
+        elif pa.types.is_timestamp(dtype):
+            df[col] = pd.to_datetime(df[col], utc=dtype.tz is not None, format="ISO8601")
+        elif pa.types.is_integer(dtype) or pa.types.is_floating(dtype):
+            values = pd.to_numeric(df[col], errors="coerce")
+            if fill is not None:
+                values = values.fillna(fill)
+            compact = compact_type(col, dtype) if downcast else None
+            if compact is not None and check_downcast(values, compact):
+                dtype = compact
+            if pa.types.is_integer(dtype):
+                # Con nulos se mantiene el entero con NA de pandas
+                values = values.astype(dtype.to_pandas_dtype() if not values.isna().any()
+                                       else f"Int{dtype.bit_width}")
+            else:
+                values = values.astype(dtype.to_pandas_dtype())
+            df[col] = values
+        elif pa.types.is_boolean(dtype):
+            df[col] = df[col].astype("boolean")
+    return df
+
+
+def to_pandas(table_name: str, table: pa.Table) -> pd.DataFrame:
+    """
+    Arrow -> pandas con el registro aplicado (texto de baja cardinalidad como category)
+    y los conteos en int32 cuando check_downcast lo permite.
+    """
+    schema = arrow_schema(table_name, table.column_names)
+    if schema is not None:
+        for field in schema:
+            i = table.schema.get_field_index(field.name)
+            dtype = field.type
+            compact = compact_type(field.name, dtype)
+            if compact is not None and table.column(i).null_count == 0 and check_downcast(
+                    table.column(i).to_numpy(), compact):
+                dtype = compact
+            if table.schema.field(i).type != dtype:
+                table = table.set_column(i, field.name, table.column(i).cast(dtype))
+    return table.to_pandas()
@@ -0,0 +1,167 @@
+# src/utils/segmentation.py
+# Segmentación de productos en DuckDB (sin pandas ni copiar/pegar en un chat):
+#
+#                      margen >= umbral     margen < umbral
+#   volumen >= umbral     Estrella             Volumen
+#   volumen <  umbral     Nicho                Durmiente
+#
+# Los umbrales son cuantiles (por defecto la mediana) del volumen y del margen entre
+# los productos con ventas; un producto sin ventas es siempre "Durmiente".
+#
+# mart.snap_product_segments guarda las métricas acumuladas por producto y la última
+# venta procesada (last_sale_id). En cada corrida solo se suman las ventas nuevas
+# (sale_id > último procesado) y solo se re-segmentan los productos que cambiaron:
+# con ventas nuevas, nuevos en el catálogo o con otro margen. Si los umbrales se
+# mueven, se re-segmenta todo el catálogo (un UPDATE vectorizado).
+SEGMENTS = ("Estrella", "Nicho", "Volumen", "Durmiente")
+
+SEGMENT_CASE = """
+    CASE
+        WHEN sales_volume = 0 THEN 'Durmiente'
+        WHEN sales_volume >= {volume} AND profit_margin_pct >= {margin} THEN 'Estrella'
+        WHEN profit_margin_pct >= {margin} THEN 'Nicho'
+        WHEN sales_volume >= {volume} THEN 'Volumen'
+        ELSE 'Durmiente'
+    END
+"""
+
+
+def ensure_segment_tables(con):
+    con.execute("CREATE SCHEMA IF NOT EXISTS mart")
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS mart.snap_product_segments (
+            product_id        BIGINT,
+            sku               VARCHAR,
+            product_name      VARCHAR,
+            sales_frequency   BIGINT,
+            sales_volume      BIGINT,
+            total_revenue     DOUBLE,
+            profit_margin_pct DOUBLE,
+            segment           VARCHAR,
+            last_sale_id      BIGINT,
+            segmented_at      TIMESTAMP
+        )
+    """)
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS mart.product_segment_runs (
+            segmented_at      TIMESTAMP,
+            mode              VARCHAR,
+            volume_threshold  DOUBLE,
+            margin_threshold  DOUBLE,
+            n_products        BIGINT,
+            n_changed         BIGINT,
+            n_resegmented     BIGINT
+        )
+    """)
+
+
+def _previous_thresholds(con):
+    return con.execute("""
+        SELECT volume_threshold, margin_threshold FROM mart.product_segment_runs
+        ORDER BY segmented_at DESC LIMIT 1
+    """).fetchone()
+
+
+def segment_products(con, full: bool = False, quantile: float = 0.5,
+                     tolerance: float = 0.0, sales: str = "snapshot_sales",
+                     products: str = "snapshot_products") -> dict:
+    """
+    Actualiza mart.snap_product_segments a partir de los snapshots de ventas y
+    productos. `full` recalcula todo desde cero (p. ej. si se corrigieron ventas
+    antiguas). `tolerance` = variación relativa de los umbrales que se ignora antes de
+    re-segmentar todo el catálogo. Devuelve un resumen de la corrida.
+    """
+    ensure_segment_tables(con)
+    con.execute("BEGIN TRANSACTION")
+    try:
+        if full:
+            con.execute("TRUNCATE mart.snap_product_segments")
+        last_sale_id = con.execute(
+            "SELECT coalesce(max(last_sale_id), 0) FROM mart.snap_product_segments").fetchone()[0]
+
+        # Ventas nuevas agregadas por producto
+        con.execute(f"""
+            CREATE OR REPLACE TEMP TABLE sales_delta AS
+            SELECT product_id, count(*) AS n, sum(qty) AS qty,
+                   sum(qty * unit_price) AS revenue, max(sale_id) AS last_sale_id
+            FROM {sales} WHERE sale_id > ? GROUP BY product_id
+        """, [last_sale_id])
+
+        # Productos que cambian: ventas nuevas, nuevos en el catálogo o margen distinto
+        con.execute(f"""
+            CREATE OR REPLACE TEMP TABLE changed_products AS
+            SELECT p.product_id, p.sku, p.product_name,
+                   coalesce(s.sales_frequency, 0) + coalesce(d.n, 0)       AS sales_frequency,
+                   coalesce(s.sales_volume, 0) + coalesce(d.qty, 0)        AS sales_volume,
+                   coalesce(s.total_revenue, 0) + coalesce(d.revenue, 0)   AS total_revenue,
+                   coalesce((p.sale_price - p.unit_cost) / nullif(p.sale_price, 0) * 100, 0)
+                                                                           AS profit_margin_pct,
+                   greatest(s.last_sale_id, d.last_sale_id)                AS last_sale_id
+            FROM {products} AS p
+            LEFT JOIN mart.snap_product_segments AS s ON s.product_id = p.product_id
+            LEFT JOIN sales_delta AS d ON d.product_id = p.product_id
+            WHERE d.product_id IS NOT NULL
+               OR s.product_id IS NULL
+               OR s.profit_margin_pct IS DISTINCT FROM
+                  coalesce((p.sale_price - p.unit_cost) / nullif(p.sale_price, 0) * 100, 0)
+               OR s.sku IS DISTINCT FROM p.sku
+               OR s.product_name IS DISTINCT FROM p.product_name
+        """)
+        n_changed = con.execute("SELECT count(*) FROM changed_products").fetchone()[0]
+        # Sin índice de PK: borrar + insertar en bloque es mucho más rápido que un
+        # upsert fila a fila sobre el ART de DuckDB con un catálogo de millones de SKU
+        con.execute("""
+            DELETE FROM mart.snap_product_segments
+            WHERE product_id IN (SELECT product_id FROM changed_products)
+        """)
+        con.execute("""
+            INSERT INTO mart.snap_product_segments
+            SELECT product_id, sku, product_name, sales_frequency, sales_volume,
+                   total_revenue, profit_margin_pct, NULL, last_sale_id, NULL
+            FROM changed_products
+        """)
+        # Productos que ya no están en el catálogo
+        con.execute(f"""
+            DELETE FROM mart.snap_product_segments AS s
+            WHERE NOT EXISTS (SELECT 1 FROM {products} AS p WHERE p.product_id = s.product_id)
+        """)
+
+        # Umbrales: cuantiles entre los productos con ventas
+        volume, margin = con.execute(f"""
+            SELECT coalesce(quantile_cont(sales_volume, {quantile}), 0),
+                   coalesce(quantile_cont(profit_margin_pct, {quantile}), 0)
+            FROM mart.snap_product_segments WHERE sales_volume > 0
+        """).fetchone()
+        previous = None if full else _previous_thresholds(con)
+        moved = previous is None or any(
+            abs(new - old) > tolerance * max(abs(old), 1e-9)
+            for new, old in zip((volume, margin), previous))
+        # Si los umbrales no se movieron, alcanza con los productos que cambiaron (con
+        # los umbrales vigentes, para que todo el catálogo use los mismos)
+        where = ""
+        if not moved:
+            volume, margin = previous
+            where = "WHERE segment IS NULL"
+        con.execute(f"""
+            UPDATE mart.snap_product_segments
+            SET segment = {SEGMENT_CASE.format(volume=volume, margin=margin)},
+                segmented_at = now()::TIMESTAMP
+            {where}
+        """)
+
+        # now() es fijo dentro de la transacción: marca las filas de esta corrida
+        n_products, n_resegmented = con.execute("""
+            SELECT count(*), count(*) FILTER (WHERE segmented_at = now()::TIMESTAMP)
+            FROM mart.snap_product_segments
+        """).fetchone()
+        mode = "full" if full else ("resegment_all" if moved else "incremental")
+        con.execute("INSERT INTO mart.product_segment_runs VALUES (now()::TIMESTAMP, ?, ?, ?, ?, ?, ?)",
+                    [mode, volume, margin, n_products, n_changed, n_resegmented])
+        con.execute("DROP TABLE sales_delta")
+        con.execute("DROP TABLE changed_products")
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+    return {"mode": mode, "volume_threshold": volume, "margin_threshold": margin,
+            "n_products": n_products, "n_changed": n_changed, "n_resegmented": n_resegmented}
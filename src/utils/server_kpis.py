@@ -0,0 +1,66 @@
+# src/utils/server_kpis.py
+# KPIs ya agregados en Postgres (vistas materializadas public.mv_kpi_* de 00_schema.sql).
+# Se descargan unas pocas filas por grano en lugar de toda adset_simulation, así que
+# la transferencia y la CPU del cliente no crecen con el número de corridas.
+import pandas as pd
+
+from .extract import fetch_tables
+from .supa_client import get_cursor
+from .kpi_engine import TOTALS, RATIOS, add_ratios, top_n
+
+# grano -> vista materializada
+KPI_VIEWS = {
+    "global": "mv_kpi_global",
+    "campaign": "mv_kpi_campaign",
+    "adset": "mv_kpi_adset",
+    "product": "mv_kpi_product",
+}
+
+
+def refresh_kpi_views(conn=None):
+    """REFRESH CONCURRENTLY de las vistas (public.refresh_kpi_views())."""
+    if conn is None:
+        with get_cursor() as cur:
+            cur.execute("select public.refresh_kpi_views()")
+        return
+    with conn.cursor() as cur:
+        cur.execute("select public.refresh_kpi_views()")
+    conn.commit()
+
+
+def _query_views(views):
+    frames = {}
+    with get_cursor() as cur:
+        for view in views:
+            cur.execute(f"select * from public.{view}")
+            frames[view] = pd.DataFrame(cur.fetchall(), columns=[d[0] for d in cur.description])
+    return frames
+
+
+def fetch_kpi_views(transport: str = "rest") -> dict:
+    """
+    {grano: DataFrame} con las filas de cada vista (por la API REST o por una conexión
+    directa a Postgres). Las columnas total_* llegan como float64; None si una vista falla.
+    """
+    views = list(KPI_VIEWS.values())
+    frames = fetch_tables(views) if transport == "rest" else _query_views(views)
+    result = {}
+    for grain, view in KPI_VIEWS.items():
+        df = frames.get(view)
+        if df is not None:
+            df = df.astype({c: "float64" for c in TOTALS if c in df.columns})
+        result[grain] = df
+    return result
+
+
+def kpis_from_views(views: dict, n_products: int = 10):
+    """Misma salida que kpi_engine.compute_kpis, a partir de las vistas ya agregadas."""
+    totals = views["global"][TOTALS].iloc[0]
+    kpi_global = {k: totals[k] for k in ["total_budget", "total_revenue", "total_conversions",
+                                         "total_clicks", "total_impressions"]}
+    kpi_global.update(add_ratios(totals.to_frame().T)[RATIOS].iloc[0].to_dict())
+
+    kpi_campaign = add_ratios(views["campaign"][["campaign_id"] + TOTALS].copy())
+    kpi_adset = add_ratios(views["adset"][["adset_name", "campaign_id"] + TOTALS].copy())
+    products = views["product"][["product_id", "total_revenue", "total_conversions"]]
+    return kpi_global, kpi_campaign, kpi_adset, top_n(products, n_products, "total_revenue")
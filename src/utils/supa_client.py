@@ -1,18 +1,135 @@
+# src/utils/supa_client.py
 import os
+import time
+import threading
+from contextlib import contextmanager
 from dotenv import load_dotenv
-from supabase import create_client, Client
 
 # Esta línea busca el archivo .env en tu carpeta
 load_dotenv()
 
-# Estas líneas leen la URL y la llave desde ese archivo
-url: str = os.environ.get("SUPABASE_URL")
-key: str = os.environ.get("SUPABASE_KEY")
-
-# Y finalmente, las usa para crear la conexión
-try:
-    supabase: Client = create_client(url, key)
-    print("✅ Conexión a Supabase exitosa.")
-except Exception as e:
-    print(f"🔥 Error conectando a Supabase: {e}")
-    supabase = None
+# Nada se conecta al importar: el cliente HTTP y el pool de Postgres se crean en el
+# primer uso y se reutilizan en todas las llamadas siguientes.
+PG_POOL_MIN = int(os.getenv("PG_POOL_MIN", "1"))
+PG_POOL_MAX = int(os.getenv("PG_POOL_MAX", "8"))
+# Conexiones inactivas más de estos segundos se validan con SELECT 1 antes de usarse
+PG_HEALTHCHECK_AFTER = float(os.getenv("PG_HEALTHCHECK_AFTER", "30"))
+
+_lock = threading.Lock()
+_client = None
+_client_failed = False
+_pool = None
+_last_used = {}
+
+
+def get_client():
+    """
+    Cliente de Supabase perezoso y compartido. Se crea una sola vez (con su sesión
+    HTTP persistente) y se devuelve el mismo en cada llamada; None si falla.
+    """
+    global _client, _client_failed
+    if _client is not None or _client_failed:
+        return _client
+    with _lock:
+        if _client is None and not _client_failed:
+            from supabase import create_client
+
+            # Estas líneas leen la URL y la llave desde el .env
+            url = os.environ.get("SUPABASE_URL")
+            key = (os.environ.get("SUPABASE_KEY")
+                   or os.environ.get("SUPABASE_SERVICE_ROLE")
+                   or os.environ.get("SUPABASE_ANON_KEY"))
+            try:
+                _client = create_client(url, key)
+                print("✅ Conexión a Supabase exitosa.")
+            except Exception as e:
+                print(f"🔥 Error conectando a Supabase: {e}")
+                _client_failed = True
+    return _client
+
+
+def _dsn_value(value: str) -> str:
+    """Valor de un DSN key=value de libpq entre comillas (escapa \\ y ')."""
+    return "'" + str(value).replace("\\", "\\\\").replace("'", "\\'") + "'"
+
+
+def db_url() -> str:
+    """DSN de Postgres: SUPABASE_DB_URL o, si no existe, las variables DB_* (RuntimeError si faltan)."""
+    url = os.getenv("SUPABASE_DB_URL")
+    if url:
+        return url
+    if os.getenv("DB_HOST"):
+        params = {"dbname": os.getenv("DB_NAME", "postgres"), "user": os.getenv("DB_USER"),
+                  "password": os.getenv("DB_PASSWORD"), "host": os.getenv("DB_HOST"),
+                  "port": os.getenv("DB_PORT", "5432")}
+        return " ".join(f"{k}={_dsn_value(v)}" for k, v in params.items() if v is not None)
+    raise RuntimeError("Falta SUPABASE_DB_URL (o las variables DB_*) en .env")
+
+
+def get_pool():
+    """Pool de conexiones Postgres (thread-safe), creado en el primer uso."""
+    global _pool
+    if _pool is None:
+        with _lock:
+            if _pool is None:
+                from psycopg2.pool import ThreadedConnectionPool
+                _pool = ThreadedConnectionPool(
+                    PG_POOL_MIN, PG_POOL_MAX, db_url(),
+                    keepalives=1, keepalives_idle=30,
+                )
+    return _pool
+
+
+def _healthy(conn) -> bool:
+    if conn.closed:
+        return False
+    if time.monotonic() - _last_used.get(id(conn), 0) < PG_HEALTHCHECK_AFTER:
+        return True
+    try:
+        with conn.cursor() as cur:
+            cur.execute("select 1")
+        conn.rollback()
+        return True
+    except Exception:
+        return False
+
+
+@contextmanager
+def get_conn():
+    """
+    Presta una conexión del pool. Hace commit al salir sin errores y rollback si
+    hay una excepción; las conexiones caídas se descartan y se reemplazan.
+    """
+    pool = get_pool()
+    conn = pool.getconn()
+    while not _healthy(conn):
+        pool.putconn(conn, close=True)
+        _last_used.pop(id(conn), None)
+        conn = pool.getconn()
+    try:
+        yield conn
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        _last_used[id(conn)] = time.monotonic()
+        pool.putconn(conn)
+
+
+@contextmanager
+def get_cursor():
+    """Atajo: cursor sobre una conexión prestada del pool."""
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            yield cur
+
+
+def close_all():
+    """Cierra el pool (p. ej. al final de un script largo)."""
+    global _pool
+    with _lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+            _last_used.clear()
@@ -0,0 +1,259 @@
+# src/utils/warehouse.py
+# Warehouse con versiones: los lectores nunca se bloquean por una escritura.
+#
+#   warehouse.versions/
+#     CURRENT              manifiesto (JSON) con la versión publicada
+#     v000042.duckdb       versiones publicadas: nadie las vuelve a abrir para escribir
+#     staging-<pid>-*.duckdb   copia de trabajo del escritor en curso
+#
+# Un escritor toma el candado de escritura (uno a la vez, también entre procesos),
+# copia la versión vigente a un archivo de staging y trabaja sobre esa copia. Al
+# cerrar la conexión se hace CHECKPOINT, el staging pasa a ser la versión N+1 y el
+# manifiesto se reemplaza de golpe (os.replace): un lector ve la versión anterior o
+# la nueva completa, nunca una a medias. Si el escritor falla (excepción o proceso
+# que termina sin cerrar) no se publica nada.
+#
+# Los lectores abren en read_only la versión del manifiesto; como nadie escribe ese
+# archivo, no compiten con el pipeline por el bloqueo de DuckDB. Las versiones viejas
+# se borran al publicar (se conservan las últimas KEEP_VERSIONS); en Linux/macOS un
+# lector que todavía tenga abierta una versión borrada la sigue leyendo sin problema.
+#
+# Sin manifiesto (warehouse recién clonado) la versión vigente es el warehouse.duckdb
+# original: la primera escritura lo copia como v000001 y desde ahí se usan versiones.
+import os
+import sys
+import json
+import time
+import uuid
+import shutil
+import threading
+from datetime import datetime, timezone
+
+import duckdb
+
+try:
+    import fcntl
+except ImportError:  # Windows: candado por archivo exclusivo
+    fcntl = None
+
+WAREHOUSE_PATH = os.getenv("WAREHOUSE_PATH", "warehouse.duckdb")
+LOCK_TIMEOUT = float(os.getenv("WAREHOUSE_LOCK_TIMEOUT", "600"))
+KEEP_VERSIONS = int(os.getenv("WAREHOUSE_KEEP_VERSIONS", "3"))
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def versions_dir(path: str = WAREHOUSE_PATH) -> str:
+    return os.path.splitext(path)[0] + ".versions"
+
+
+def _manifest_path(path: str) -> str:
+    return os.path.join(versions_dir(path), "CURRENT")
+
+
+def read_current(path: str = WAREHOUSE_PATH):
+    """Manifiesto de la versión publicada, o None si el warehouse aún no tiene versiones."""
+    try:
+        with open(_manifest_path(path)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def current_path(path: str = WAREHOUSE_PATH) -> str:
+    """Archivo de la versión vigente (el warehouse original si aún no hay versiones)."""
+    current = read_current(path)
+    if current is None:
+        return path
+    return os.path.join(versions_dir(path), current["file"])
+
+
+def version_signature(path: str = WAREHOUSE_PATH) -> tuple:
+    """Cambia cada vez que se publica una versión (stat del manifiesto o del original)."""
+    for p in (_manifest_path(path), path):
+        try:
+            st = os.stat(p)
+            return (p, st.st_size, st.st_mtime_ns)
+        except FileNotFoundError:
+            continue
+    return None
+
+
+# --- candado de escritura entre procesos --------------------------------------------
+def _acquire_lock(directory: str, timeout: float):
+    lock_path = os.path.join(directory, ".write.lock")
+    deadline = time.monotonic() + timeout
+    delay = 0.05
+    while True:
+        if fcntl is not None:
+            fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return fd
+            except BlockingIOError:
+                os.close(fd)
+        else:
+            try:
+                return os.open(lock_path, os.O_RDWR | os.O_CREAT | os.O_EXCL, 0o644)
+            except FileExistsError:
+                pass
+        if time.monotonic() >= deadline:
+            raise TimeoutError(f"Otro proceso está escribiendo el warehouse ({lock_path}).")
+        time.sleep(delay)
+        delay = min(delay * 2, 1.0)
+
+
+def _release_lock(directory: str, fd):
+    os.close(fd)
+    if fcntl is None:
+        os.remove(os.path.join(directory, ".write.lock"))
+
+
+# --- sesión de escritura --------------------------------------------------------------
+class _WriterSession:
+    """Staging de un proceso: las conexiones anidadas del mismo proceso lo comparten."""
+
+    def __init__(self, path: str, timeout: float):
+        self.path = path
+        self.directory = versions_dir(path)
+        os.makedirs(self.directory, exist_ok=True)
+        self.lock_fd = _acquire_lock(self.directory, timeout)
+        try:
+            # Con el candado tomado, cualquier otro staging es de un escritor que murió
+            for name in os.listdir(self.directory):
+                if name.startswith("staging-"):
+                    os.remove(os.path.join(self.directory, name))
+            current = read_current(path)
+            self.parent = current["version"] if current else 0
+            base = current_path(path)
+            self.staging = os.path.join(
+                self.directory, f"staging-{os.getpid()}-{uuid.uuid4().hex[:8]}.duckdb")
+            if os.path.exists(base):
+                shutil.copyfile(base, self.staging)
+                if os.path.exists(base + ".wal"):
+                    shutil.copyfile(base + ".wal", self.staging + ".wal")
+            self.con = duckdb.connect(self.staging)
+        except BaseException:
+            _release_lock(self.directory, self.lock_fd)
+            raise
+        self.refs = 0
+        self.aborted = False
+
+    def release(self, publish: bool):
+        self.refs -= 1
+        self.aborted = self.aborted or not publish
+        if self.refs > 0:
+            return None
+        try:
+            if self.aborted:
+                self.con.close()
+                for p in (self.staging, self.staging + ".wal"):
+                    if os.path.exists(p):
+                        os.remove(p)
+                return None
+            self.con.execute("CHECKPOINT")
+            self.con.close()
+            return self._publish()
+        finally:
+            _release_lock(self.directory, self.lock_fd)
+
+    def _publish(self) -> dict:
+        version = self.parent + 1
+        name = f"v{version:06d}.duckdb"
+        os.replace(self.staging, os.path.join(self.directory, name))
+        manifest = {
+            "version": version, "file": name, "parent": self.parent,
+            "published_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "writer": os.path.basename(sys.argv[0]) if sys.argv and sys.argv[0] else None,
+            "size": os.path.getsize(os.path.join(self.directory, name)),
+        }
+        tmp = _manifest_path(self.path) + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(manifest, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, _manifest_path(self.path))
+        gc_versions(self.path)
+        return manifest
+
+
+class WarehouseConnection:
+    """
+    Conexión de escritura sobre el staging (delega todo en la conexión de DuckDB).
+    close() publica la versión; abort() o salir de un `with` con excepción la descarta.
+    """
+
+    def __init__(self, session: _WriterSession, con):
+        self._session = session
+        self._con = con
+        self._closed = False
+
+    def __getattr__(self, name):
+        return getattr(self._con, name)
+
+    def _finish(self, publish: bool):
+        if self._closed:
+            return
+        self._closed = True
+        if self._con is not self._session.con:
+            self._con.close()
+        with _sessions_lock:
+            if self._session.refs == 1:
+                _sessions.pop(self._session.key, None)
+            self._session.release(publish)
+
+    def close(self):
+        self._finish(publish=True)
+
+    def abort(self):
+        self._finish(publish=False)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._finish(publish=exc_type is None)
+        return False
+
+
+def connect_warehouse(path: str = WAREHOUSE_PATH, read_only: bool = False,
+                      timeout: float = None):
+    """
+    read_only: conexión de DuckDB a la versión publicada (nunca espera a un escritor).
+    Escritura: WarehouseConnection sobre una copia de staging; espera hasta `timeout`
+    segundos si otro proceso está escribiendo.
+    """
+    if read_only:
+        return duckdb.connect(current_path(path), read_only=True)
+    key = os.path.abspath(path)
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is None:
+            session = _WriterSession(path, LOCK_TIMEOUT if timeout is None else timeout)
+            session.key = key
+            _sessions[key] = session
+        con = session.con if session.refs == 0 else session.con.cursor()
+        session.refs += 1
+    return WarehouseConnection(session, con)
+
+
+def gc_versions(path: str = WAREHOUSE_PATH, keep: int = KEEP_VERSIONS) -> list:
+    """Borra las versiones publicadas salvo las `keep` más recientes (y la vigente)."""
+    directory = versions_dir(path)
+    if not os.path.isdir(directory):
+        return []
+    current = read_current(path)
+    versions = sorted(n for n in os.listdir(directory)
+                      if n.startswith("v") and n.endswith(".duckdb"))
+    removed = []
+    for name in versions[:-max(keep, 1)]:
+        if current and name == current["file"]:
+            continue
+        try:
+            os.remove(os.path.join(directory, name))
+            removed.append(name)
+        except OSError:
+            # Windows no borra un archivo abierto: queda para la próxima publicación
+            pass
+    return removed
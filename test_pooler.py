@@ -1,34 +1,44 @@
 import os
-import psycopg2
-from dotenv import load_dotenv
 
-load_dotenv()
+from psycopg2.extensions import make_dsn
 
-HOST = os.getenv("SUPA_HOST")
-PORT = os.getenv("SUPA_PORT", "6543")
-DB = os.getenv("SUPA_DB", "postgres")
-PWD = os.getenv("SUPA_PASSWORD")
-PRJ = os.getenv("SUPA_PROJECT")
-
-USER_A = os.getenv("SUPA_USER_A")  # postgres.<ref>
-USER_B = os.getenv("SUPA_USER_B", "postgres")
-
-DSN_A = f"user={USER_A} password='{PWD}' host={HOST} port={PORT} dbname={DB} sslmode=require"
-DSN_B = f"user={USER_B} password='{PWD}' host={HOST} port={PORT} dbname={DB} sslmode=require options='project={PRJ}'"
+from src.utils.supa_client import close_all, get_conn
 
 
 def try_dsn(label, dsn):
     print(f"\n=== Probar {label} ===")
+    # El pool compartido lee SUPABASE_DB_URL: se recrea para cada variante del DSN
+    os.environ["SUPABASE_DB_URL"] = dsn
+    close_all()
     try:
-        with psycopg2.connect(dsn) as conn:
+        with get_conn() as conn:
             with conn.cursor() as cur:
                 cur.execute(
                     "select current_user, current_database(), inet_server_addr(), inet_server_port();")
                 print("✅ OK:", cur.fetchone())
     except Exception as e:
         print("❌", repr(e))
-
-
-try_dsn("A (usuario con .ref)", DSN_A)
-try_dsn("B (usuario simple + options)", DSN_B)
-print("\n✅ Conexión OK")
+    finally:
+        close_all()
+
+
+if __name__ == "__main__":
+    # supa_client ya cargó el .env al importarse
+    HOST = os.getenv("SUPA_HOST")
+    PORT = os.getenv("SUPA_PORT", "6543")
+    DB = os.getenv("SUPA_DB", "postgres")
+    PWD = os.getenv("SUPA_PASSWORD")
+    PRJ = os.getenv("SUPA_PROJECT")
+
+    USER_A = os.getenv("SUPA_USER_A")  # postgres.<ref>
+    USER_B = os.getenv("SUPA_USER_B", "postgres")
+
+    # make_dsn pone entre comillas y escapa cada valor (contraseñas con ' o espacios)
+    DSN_A = make_dsn(user=USER_A, password=PWD, host=HOST, port=PORT, dbname=DB,
+                     sslmode="require")
+    DSN_B = make_dsn(user=USER_B, password=PWD, host=HOST, port=PORT, dbname=DB,
+                     sslmode="require", options=f"project={PRJ}")
+
+    try_dsn("A (usuario con .ref)", DSN_A)
+    try_dsn("B (usuario simple + options)", DSN_B)
+    print("\n✅ Conexión OK")
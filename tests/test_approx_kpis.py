@@ -0,0 +1,72 @@
+# tests/test_approx_kpis.py
+# Modo aproximado: sobre una tabla sintética y muchas semillas, los intervalos de
+# ROAS y CPA cubren el valor exacto más o menos a la tasa nominal.
+import duckdb
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.utils.approx_kpis import approx_marts, distinct_counts
+
+CONFIDENCE = 0.9
+
+
+@pytest.fixture(scope="module")
+def con():
+    rng = np.random.default_rng(7)
+    n = 40_000
+    campaign = rng.choice([1, 2, 3, 4], n, p=[0.4, 0.3, 0.2, 0.1])
+    adset = rng.integers(0, 6, n)
+    # ROAS y tasa de conversión distintos por adset, con ruido fila a fila
+    budget = rng.gamma(2.0, 50.0, n)
+    clicks = rng.poisson(budget / (0.5 + adset * 0.2))
+    conversions = rng.binomial(clicks, 0.02 + 0.01 * adset)
+    revenue = budget * rng.lognormal(np.log(1.0 + 0.3 * adset), 0.8)
+    sim = pd.DataFrame({
+        "run_ts": rng.choice(["r1", "r2", "r3"], n), "campaign_id": campaign,
+        "adset_name": [f"a{a}" for a in adset], "product_id": rng.integers(1, 20, n),
+        "budget": budget, "clicks": clicks.astype(float), "conversions": conversions.astype(float),
+        "revenue": revenue, "margin": revenue * 0.3})
+    con = duckdb.connect()
+    con.execute("CREATE TABLE snapshot_adset_simulation AS SELECT * FROM sim")
+    con.execute("CREATE TABLE snapshot_campaigns AS SELECT range AS campaign_id, "
+                "'C' || range AS campaign_name FROM range(1, 5)")
+    con.execute("CREATE TABLE snapshot_products AS SELECT range AS product_id, "
+                "'P' || range AS product_name FROM range(1, 20)")
+    yield con
+    con.close()
+
+
+def _exact(con):
+    return con.execute("""
+        SELECT campaign_id, sum(revenue) / sum(budget) AS roas,
+               sum(budget) / sum(conversions) AS cpa
+        FROM snapshot_adset_simulation GROUP BY campaign_id ORDER BY campaign_id
+    """).df().set_index("campaign_id")
+
+
+def test_intervals_cover_exact_ratios(con):
+    exact = _exact(con)
+    names = {f"C{i}": i for i in exact.index}
+    covered, total = {"roas": 0, "cpa": 0}, 0
+    for seed in range(50):
+        _, kpi_campaign, _, _ = approx_marts(con, rate=0.05, method="bernoulli",
+                                             confidence=CONFIDENCE, seed=seed)
+        kpi_campaign = kpi_campaign.assign(
+            campaign_id=kpi_campaign["campaign_name"].map(names)).set_index("campaign_id")
+        total += len(kpi_campaign)
+        for ratio in covered:
+            truth = exact.loc[kpi_campaign.index, ratio]
+            covered[ratio] += int(((kpi_campaign[f"{ratio}_lo"] <= truth)
+                                   & (truth <= kpi_campaign[f"{ratio}_hi"])).sum())
+    assert total == 200
+    for ratio, hits in covered.items():
+        # Nominal 90%: con 200 intervalos, ±2.5 desvíos binomiales
+        assert 0.84 <= hits / total <= 0.96, (ratio, hits / total)
+
+
+def test_distinct_counts(con):
+    per_campaign, overall = distinct_counts(con)
+    assert sorted(per_campaign["campaign_id"]) == [1, 2, 3, 4]
+    assert (per_campaign["n_runs"] == 3).all() and (per_campaign["n_adsets"] == 6).all()
+    assert overall == {"n_runs": 3, "n_adsets": 24}
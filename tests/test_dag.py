@@ -0,0 +1,160 @@
+# tests/test_dag.py
+# Orquestador: orden de dependencias, huellas (archivos, dependencias y estado remoto)
+# y un solo escritor del warehouse a la vez. Los pasos son `python -c` que dejan una
+# marca con sus tiempos de inicio y fin.
+import json
+import threading
+import time
+
+import pytest
+
+from src.utils import dag
+
+
+def _step(name, deps=(), sleep=0.0, fail=False, **extra):
+    code = (
+        "import json, os, sys, time\n"
+        "t0 = time.time()\n"
+        f"missing = [d for d in {list(deps)!r} if not os.path.exists('marks/' + d)]\n"
+        "if missing: sys.exit('faltan ' + str(missing))\n"
+        f"time.sleep({sleep})\n"
+        f"if {fail}: sys.exit(1)\n"
+        "os.makedirs('marks', exist_ok=True)\n"
+        f"json.dump([t0, time.time()], open('marks/{name}', 'w'))\n"
+    )
+    return {"cmd": ["-c", code], "deps": list(deps), "outputs": [f"marks/{name}"], **extra}
+
+
+def _marks(name):
+    with open(f"marks/{name}") as f:
+        return json.load(f)
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "data").mkdir()
+    (tmp_path / "data" / "input.csv").write_text("a,b\n1,2\n")
+    return tmp_path
+
+
+def _run(steps, **kwargs):
+    return dag.run_dag(steps, state_path="state.json", **kwargs)
+
+
+def test_dependencies_run_in_order(workdir):
+    steps = {
+        "d": _step("d", deps=["b", "c"]),
+        "b": _step("b", deps=["a"], sleep=0.3),
+        "c": _step("c", deps=["a"], sleep=0.3),
+        "a": _step("a"),
+    }
+    assert dag.topological_order(steps).index("a") == 0
+    status = _run(steps, jobs=4)
+    assert status == {"a": "ok", "b": "ok", "c": "ok", "d": "ok"}
+    # Cada paso arranca cuando sus dependencias ya terminaron
+    assert _marks("b")[0] >= _marks("a")[1] and _marks("c")[0] >= _marks("a")[1]
+    assert _marks("d")[0] >= max(_marks("b")[1], _marks("c")[1])
+
+
+def test_cycle_is_rejected():
+    with pytest.raises(ValueError, match="Ciclo"):
+        dag.topological_order({"a": {"deps": ["b"]}, "b": {"deps": ["a"]}})
+
+
+def test_failed_step_blocks_dependents(workdir):
+    steps = {"a": _step("a", fail=True), "b": _step("b", deps=["a"]), "c": _step("c")}
+    assert _run(steps) == {"a": "failed", "b": "blocked", "c": "ok"}
+
+
+def test_file_fingerprint_invalidation(workdir):
+    steps = {"load": _step("load", inputs=["data/*.csv"]),
+             "report": _step("report", deps=["load"])}
+    assert _run(steps) == {"load": "ok", "report": "ok"}
+    assert _run(steps) == {"load": "skipped", "report": "skipped"}
+
+    # Otro contenido en la entrada: se re-ejecuta el paso y todo lo que depende de él
+    (workdir / "data" / "input.csv").write_text("a,b\n1,3\n")
+    assert _run(steps) == {"load": "ok", "report": "ok"}
+    assert _run(steps) == {"load": "skipped", "report": "skipped"}
+
+    # Una salida que falta también obliga a re-ejecutar
+    (workdir / "marks" / "report").unlink()
+    assert _run(steps) == {"load": "skipped", "report": "ok"}
+    assert _run(steps, force=True) == {"load": "ok", "report": "ok"}
+
+
+def test_remote_watermark_invalidation(workdir, monkeypatch):
+    remote = {"sales": (10, "2025-01-01T00:00:00")}
+    calls = []
+
+    def fake_stats(table, column):
+        calls.append((table, column))
+        return remote[table]
+
+    monkeypatch.setattr(dag, "table_stats", fake_stats)
+    steps = {"extract": _step("extract", remote=["sales"])}
+    assert _run(steps) == {"extract": "ok"}
+    assert _run(steps) == {"extract": "skipped"}
+    assert calls[-1] == ("sales", "created_at")
+
+    # Borrado + inserción: mismo conteo, otra fila más reciente
+    remote["sales"] = (10, "2025-01-02T00:00:00")
+    assert _run(steps) == {"extract": "ok"}
+    assert _run(steps) == {"extract": "skipped"}
+
+
+def test_unknown_remote_state_always_runs(workdir, monkeypatch):
+    def broken(*args):
+        raise RuntimeError("sin red")
+
+    monkeypatch.setattr(dag, "table_stats", broken)
+    monkeypatch.setattr(dag, "count_rows", broken)
+    steps = {"extract": _step("extract", remote=["sales"])}
+    assert _run(steps) == {"extract": "ok"}
+    assert _run(steps) == {"extract": "ok"}
+
+
+def test_max_age_window(workdir, monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(dag.time, "time", lambda: now[0])
+    steps = {"extract": _step("extract", max_age=3600)}
+    assert _run(steps) == {"extract": "ok"}
+    now[0] += 60
+    assert _run(steps) == {"extract": "skipped"}
+    now[0] += 3600
+    assert _run(steps) == {"extract": "ok"}
+
+
+def test_warehouse_writers_never_overlap(workdir):
+    steps = {
+        "w1": _step("w1", sleep=0.4, warehouse="write"),
+        "w2": _step("w2", sleep=0.4, warehouse="write"),
+        "r": _step("r", sleep=0.4, warehouse="read"),
+    }
+    assert set(_run(steps, jobs=3).values()) == {"ok"}
+    (s1, e1), (s2, e2), (sr, er) = _marks("w1"), _marks("w2"), _marks("r")
+    assert e1 <= s2 or e2 <= s1
+    # El lector no espera al escritor: corre a la vez que alguno de los dos
+    assert sr < max(e1, e2) and er > min(s1, s2)
+
+
+def test_warehouse_lock():
+    lock = dag.WarehouseLock()
+    lock.acquire("write")
+    second = threading.Event()
+
+    def writer():
+        lock.acquire("write")
+        second.set()
+        lock.release("write")
+
+    t = threading.Thread(target=writer)
+    t.start()
+    assert not second.wait(0.2)
+    lock.acquire("read")   # los lectores nunca esperan
+    lock.release("read")
+    lock.acquire(None)
+    lock.release("write")
+    assert second.wait(2)
+    t.join(2)
@@ -0,0 +1,30 @@
+# tests/test_extract.py
+# Extracción paginada sin red: conteos y páginas simulados sobre el pool de fetch_tables.
+import time
+
+import pandas as pd
+
+from src.utils import extract
+
+
+def test_failed_page_cancels_pending_pages(monkeypatch):
+    fetched = []
+
+    def fake_page(table, start, end, since=None):
+        fetched.append((table, start))
+        if table == "sales" and start == 0:
+            raise RuntimeError("boom")
+        time.sleep(0.2)  # da tiempo a cancelar antes de que el hilo tome otra página
+        return pd.DataFrame({"id": range(start, end + 1)})
+
+    monkeypatch.setattr(extract, "get_client", lambda: object())
+    monkeypatch.setattr(extract, "count_rows",
+                        lambda t, since=None: {"sales": 50, "products": 10}[t])
+    monkeypatch.setattr(extract, "fetch_page", fake_page)
+
+    result = extract.fetch_tables(["products", "sales"], page_size=10, max_workers=1,
+                                  on_page=lambda table, page_no, df: None)
+
+    assert result == {"products": 10, "sales": None}
+    # La página que falló y a lo sumo la que ya estaba en curso; el resto se cancela
+    assert len([f for f in fetched if f[0] == "sales"]) <= 2
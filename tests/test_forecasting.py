@@ -0,0 +1,115 @@
+# tests/test_forecasting.py
+# El estado incremental de los pronósticos (períodos nuevos con los α / β vigentes)
+# debe coincidir con ajustar toda la historia con esos mismos parámetros.
+import duckdb
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.utils.forecasting import (fit_holt, update_holt, seasonal_errors, demand_matrix,
+                                   forecast_demand, _load_state)
+
+STATE_KEYS = ("level", "trend", "holt_sse", "holt_n")
+
+
+def _series(n=30, T=40, seed=0):
+    rng = np.random.default_rng(seed)
+    t = np.arange(T)
+    return (20 + 0.3 * t + 5 * np.sin(2 * np.pi * t / 7)
+            + rng.normal(0, 2, (n, T))).clip(min=0)
+
+
+def _holt_fixed_params(Y, alpha, beta) -> dict:
+    """Holt de cada serie con sus propios α / β (una pasada por combinación)."""
+    out = {k: np.zeros(len(Y)) for k in STATE_KEYS}
+    for a, b in set(zip(alpha, beta)):
+        rows = (alpha == a) & (beta == b)
+        fit = fit_holt(Y[rows], alphas=[a], betas=[b])
+        for k in STATE_KEYS:
+            out[k][rows] = fit[k]
+    return out
+
+
+@pytest.mark.parametrize("split", [2, 10, 39])
+def test_update_holt_matches_full_pass(split):
+    Y = _series()
+    state = fit_holt(Y[:, :split])
+    updated = update_holt(state, Y[:, split:])
+    expected = _holt_fixed_params(Y, state["alpha"], state["beta"])
+    for k in STATE_KEYS:
+        np.testing.assert_allclose(updated[k], expected[k], rtol=1e-9, err_msg=k)
+
+
+@pytest.mark.parametrize("split", [3, 7, 20])
+def test_seasonal_errors_incremental(split):
+    Y = _series()
+    sse, n, tail = seasonal_errors(Y[:, :split], 7)
+    sse2, n2, tail2 = seasonal_errors(Y[:, split:], 7, tail)
+    full_sse, full_n, full_tail = seasonal_errors(Y, 7)
+    np.testing.assert_allclose(sse + sse2, full_sse, rtol=1e-9)
+    np.testing.assert_array_equal(n + n2, full_n)
+    np.testing.assert_allclose(tail2, full_tail)
+
+
+def _sales(start, weeks, product_ids, seed, first_id=1):
+    rng = np.random.default_rng(seed)
+    days = pd.date_range(start, periods=weeks * 7, freq="D")
+    rows = [(d, p, int(rng.poisson(3 + p % 4))) for d in days for p in product_ids]
+    df = pd.DataFrame(rows, columns=["created_at", "product_id", "qty"])
+    df = df[df["qty"] > 0].reset_index(drop=True)
+    df.insert(0, "sale_id", np.arange(first_id, first_id + len(df)))
+    return df
+
+
+@pytest.fixture
+def con():
+    con = duckdb.connect()
+    con.execute("CREATE TABLE snapshot_products AS "
+                "SELECT range + 1 AS product_id FROM range(12)")
+    sales = _sales("2025-01-06", 20, range(1, 11), seed=1)  # productos 11-12 sin ventas
+    con.execute("CREATE TABLE snapshot_sales AS SELECT * FROM sales")
+    yield con
+    con.close()
+
+
+def test_incremental_state_matches_full_history(con):
+    first = forecast_demand(con, "sales", "week", horizon=4, refit_every=100)
+    assert first["mode"] == "full"
+
+    # Tres semanas más (y un producto del catálogo que empieza a venderse)
+    more = _sales("2025-05-26", 3, range(1, 12), seed=2, first_id=100_000)
+    con.execute("INSERT INTO snapshot_sales SELECT * FROM more")
+    second = forecast_demand(con, "sales", "week", horizon=4, refit_every=100)
+    assert second["mode"] == "incremental" and second["n_new_periods"] == 3
+
+    state = _load_state(con, "sales", "week", 52)
+    product_ids, labels, Y = demand_matrix(con, "sales", "week")
+    np.testing.assert_array_equal(state["product_id"], product_ids)
+    assert state["last_period"] == labels[-1]
+    np.testing.assert_array_equal(state["n_obs"], len(labels))
+
+    expected = _holt_fixed_params(Y, state["alpha"], state["beta"])
+    for k in STATE_KEYS:
+        np.testing.assert_allclose(state[k], expected[k], rtol=1e-9, atol=1e-9, err_msg=k)
+    sse, n, tail = seasonal_errors(Y, 52)
+    np.testing.assert_allclose(state["seasonal_sse"], sse, rtol=1e-9)
+    np.testing.assert_array_equal(state["seasonal_n"], n)
+    np.testing.assert_allclose(state["season_tail"], tail)
+
+    rows = con.execute("SELECT count(*) FROM mart.snap_demand_forecast").fetchone()[0]
+    assert rows == len(product_ids) * 4
+
+
+def test_new_catalog_product_is_fitted_on_its_history(con):
+    forecast_demand(con, "sales", "week", horizon=4, refit_every=100)
+    con.execute("INSERT INTO snapshot_products VALUES (13)")
+    more = _sales("2025-05-26", 2, [13], seed=3, first_id=100_000)
+    con.execute("INSERT INTO snapshot_sales SELECT * FROM more")
+    summary = forecast_demand(con, "sales", "week", horizon=4, refit_every=100)
+    assert summary["mode"] == "incremental" and summary["n_series"] == 13
+
+    state = _load_state(con, "sales", "week", 52)
+    _, labels, Y = demand_matrix(con, "sales", "week", product_ids=[13])
+    fit = fit_holt(Y)
+    assert state["n_obs"][-1] == len(labels)
+    np.testing.assert_allclose(state["level"][-1], fit["level"][0])
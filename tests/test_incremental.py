@@ -0,0 +1,38 @@
+# tests/test_incremental.py
+# Solo las tablas append-only se cargan como delta; el resto se reemplaza completo.
+import duckdb
+import pandas as pd
+import pytest
+
+from src.utils.incremental import apply_snapshot, read_watermarks
+from src.utils.warehouse import connect_warehouse
+
+
+def test_mutable_table_rejects_delta():
+    con = duckdb.connect()
+    products = pd.DataFrame({"product_id": [1, 2], "sale_price": [10.0, 20.0]})
+    apply_snapshot(con, "products", products)
+    with pytest.raises(ValueError, match="append-only"):
+        apply_snapshot(con, "products", products.head(1), mode="incremental")
+    assert con.execute("SELECT count(*) FROM snapshot_products").fetchone()[0] == 2
+
+
+def test_sales_delta_is_upserted():
+    con = duckdb.connect()
+    apply_snapshot(con, "sales", pd.DataFrame({"sale_id": [1, 2], "qty": [1, 1]}),
+                   high_water="2025-01-01")
+    apply_snapshot(con, "sales", pd.DataFrame({"sale_id": [2, 3], "qty": [5, 1]}),
+                   mode="incremental", high_water="2025-01-02")
+    assert con.execute("SELECT sale_id, qty FROM snapshot_sales ORDER BY 1").fetchall() == \
+        [(1, 1), (2, 5), (3, 1)]
+
+
+def test_read_watermarks_ignores_mutable_tables(tmp_path):
+    path = str(tmp_path / "wh.duckdb")
+    con = connect_warehouse(path)
+    apply_snapshot(con, "sales", pd.DataFrame({"sale_id": [1]}), high_water="2025-01-01")
+    # Marca de una versión anterior que también llevaba products por created_at
+    con.execute("INSERT INTO etl_watermarks VALUES "
+                "('products', 'created_at', '2025-01-01', 1, now())")
+    con.close()
+    assert read_watermarks(path) == {"sales": ("created_at", "2025-01-01")}
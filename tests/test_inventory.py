@@ -0,0 +1,110 @@
+# tests/test_inventory.py
+# Proyección de inventario: la simulación vectorizada coincide con un bucle por SKU y
+# las entradas se cargan con el esquema real (sin datos de compra del proveedor).
+import duckdb
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.utils.inventory import load_sku_inputs, project_stock
+from src.utils.schema_registry import SCHEMA_SQL, apply_dtypes, parse_schema
+
+
+def _reference(demand, start, reorder_point, order_qty, lead, horizon):
+    """Misma política (s, Q) para un solo SKU, día a día y sin NumPy."""
+    lead = max(int(lead), 1)
+    stock, arrivals, levels = float(start), {}, []
+    first_stockout = first_order = -1
+    n_orders, lost = 0, 0.0
+    for t in range(horizon):
+        stock += arrivals.pop(t, 0.0)
+        d = float(demand[t])
+        served = min(stock, d)
+        if served < d and first_stockout < 0:
+            first_stockout = t
+        lost += d - served
+        stock -= served
+        position = stock + sum(arrivals.values())
+        if order_qty > 0 and position <= reorder_point:
+            qty = (np.floor((reorder_point - position) / order_qty) + 1) * order_qty
+            arrivals[t + lead] = arrivals.get(t + lead, 0.0) + qty
+            n_orders += 1
+            if first_order < 0:
+                first_order = t
+        levels.append(stock)
+    return levels, first_stockout, first_order, n_orders, lost
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_project_stock_matches_per_sku_loop(seed):
+    rng = np.random.default_rng(seed)
+    n, horizon = 25, 60
+    demand = rng.poisson(rng.uniform(0, 8, (n, 1)), (n, horizon)).astype("float64")
+    demand[0] = 0.0
+    start = rng.uniform(0, 60, n)
+    reorder_point = rng.uniform(0, 40, n)
+    order_qty = rng.choice([0.0, 5.0, 12.0, 30.0], n)
+    lead = rng.integers(0, 15, n)
+
+    levels, stats = project_stock(demand, start, reorder_point, order_qty, lead, horizon)
+    for i in range(n):
+        ref_levels, stockout, order, n_orders, lost = _reference(
+            demand[i], start[i], reorder_point[i], order_qty[i], lead[i], horizon)
+        np.testing.assert_allclose(levels[i], ref_levels, rtol=1e-6, atol=1e-3)
+        assert stats["first_stockout_day"][i] == stockout
+        assert stats["first_order_day"][i] == order
+        assert stats["n_orders"][i] == n_orders
+        assert stats["lost_units"][i] == pytest.approx(lost)
+
+
+def _schema_table(con, name, table, rows):
+    """Crea `name` con las columnas exactas de `table` en 00_schema.sql."""
+    with open(SCHEMA_SQL, encoding="utf-8") as f:
+        columns = [c[0] for c in parse_schema(f.read())[table]]
+    df = apply_dtypes(table, pd.DataFrame(rows, columns=columns))
+    con.register("rows_df", df)
+    con.execute(f"CREATE TABLE {name} AS SELECT * FROM rows_df")
+    con.unregister("rows_df")
+
+
+@pytest.mark.parametrize("suppliers", [None, "snapshot_suppliers"])
+def test_load_sku_inputs_on_repo_schema(suppliers):
+    con = duckdb.connect()
+    now = "2025-01-01T00:00:00+00:00"
+    _schema_table(con, "snapshot_products", "products", [
+        (1, "SKU-1", "Uno", 10, 4, now), (2, "SKU-2", "Dos", 20, 8, now)])
+    _schema_table(con, "snapshot_adset_simulation", "adset_simulation", [
+        ("r1", 1, "a", 1, "SKU-1", 100, 1, 0.1, 10, 10, 2, 20, 5, now),
+        ("r2", 1, "a", 1, "SKU-1", 100, 1, 0.1, 10, 10, 4, 40, 5, now)])
+    if suppliers:
+        # La tabla de proveedores existe pero sin lead time, MOQ ni empaque
+        con.execute("CREATE TABLE snapshot_suppliers (supplier_id BIGINT, name VARCHAR)")
+        con.execute("INSERT INTO snapshot_suppliers VALUES (1, 'Proveedor')")
+
+    inputs = load_sku_inputs(con, default_lead_time=9)
+    assert inputs["product_id"].tolist() == [1, 2]
+    assert inputs["supplier_id"].isna().all()
+    assert inputs["lead_time_days"].tolist() == [9, 9]
+    assert inputs["moq"].tolist() == [1.0, 1.0] and inputs["pack_multiple"].tolist() == [1.0, 1.0]
+    assert inputs["order_cost"].tolist() == [0.0, 0.0]
+    assert inputs["unit_cost"].tolist() == [4.0, 8.0]
+    assert inputs["daily_demand"].tolist() == [3.0, 0.0]
+    assert inputs["demand_std"].tolist() == [1.0, 0.0]
+    con.close()
+
+
+def test_load_sku_inputs_with_supplier_terms():
+    con = duckdb.connect()
+    con.execute("""
+        CREATE TABLE snapshot_products AS
+        SELECT 1::BIGINT AS product_id, 'SKU-1' AS sku, 'Uno' AS product_name,
+               5.0 AS unit_cost, 7::BIGINT AS supplier_id""")
+    con.execute("CREATE TABLE snapshot_adset_simulation (run_ts VARCHAR, product_id BIGINT, "
+                "conversions DOUBLE)")
+    con.execute("""
+        CREATE TABLE snapshot_suppliers AS
+        SELECT 7::BIGINT AS supplier_id, 12 AS lead_time_days, 50 AS moq""")
+    row = load_sku_inputs(con).iloc[0]
+    assert (row["supplier_id"], row["lead_time_days"], row["moq"], row["pack_multiple"]) \
+        == (7, 12, 50.0, 1.0)
+    con.close()
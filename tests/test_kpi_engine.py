@@ -0,0 +1,57 @@
+# tests/test_kpi_engine.py
+# La pasada única en DuckDB (GROUPING SETS) debe dar los mismos marts que el motor
+# de KPIs en pandas sobre las mismas filas.
+import duckdb
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.utils.kpi_engine import (aggregate_fine, compute_kpis, grouping_sets_sql,
+                                  kpis_from_grains)
+
+KEYS = dict(campaign_key="campaign_name", adset_key="adset_name", product_key="product_name")
+
+
+def _rows(n=2_000, seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        "campaign_name": rng.choice(["C1", "C2", "C3"], n),
+        "adset_name": rng.choice(["A1", "A2", "A3", "A4"], n),
+        "product_name": rng.choice([f"P{i}" for i in range(25)], n),
+    })
+    for m in ["budget", "clicks", "impressions", "conversions", "revenue", "margin"]:
+        df[m] = rng.integers(0, 500, n).astype("float64")
+    df.loc[df["campaign_name"] == "C3", "conversions"] = 0  # CPA sin denominador
+    return df
+
+
+def _sql_kpis(df, n_products=10):
+    con = duckdb.connect()
+    grains = con.execute(grouping_sets_sql("df", n_products=n_products, **KEYS)).df()
+    return kpis_from_grains(grains, **KEYS)
+
+
+def _sorted(df, by):
+    return df.sort_values(by).reset_index(drop=True)
+
+
+@pytest.mark.parametrize("n_products", [5, 10, 50])
+def test_grouping_sets_match_pandas_engine(n_products):
+    df = _rows()
+    fine = aggregate_fine(df, list(KEYS.values()))
+    expected = compute_kpis(fine, n_products=n_products, **KEYS)
+    got = _sql_kpis(df, n_products)
+
+    assert got[0] == pytest.approx(expected[0])
+    pd.testing.assert_frame_equal(_sorted(got[1], "campaign_name"),
+                                  _sorted(expected[1], "campaign_name"), check_dtype=False)
+    pd.testing.assert_frame_equal(_sorted(got[2], ["campaign_name", "adset_name"]),
+                                  _sorted(expected[2], ["campaign_name", "adset_name"]),
+                                  check_dtype=False)
+    pd.testing.assert_frame_equal(got[3], expected[3], check_dtype=False)
+
+
+def test_empty_source_gives_zero_globals():
+    kpi_global, kpi_campaign, kpi_adset, top = _sql_kpis(_rows().iloc[0:0])
+    assert all(v == 0 for v in kpi_global.values())
+    assert kpi_campaign.empty and kpi_adset.empty and top.empty
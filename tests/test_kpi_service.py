@@ -0,0 +1,142 @@
+# tests/test_kpi_service.py
+# Servicio de KPIs sobre un warehouse versionado temporal: consultas por endpoint,
+# caché invalidada al publicarse una corrida nueva y cierre de la versión anterior.
+import asyncio
+import json
+
+import duckdb
+import pandas as pd
+import pytest
+
+from src.utils.kpi_service import KpiService, WarehousePool, kpi_query
+from src.utils.marts import SIM_LEVELS, SIM_SOURCE, update_run_aggregates
+from src.utils.warehouse import connect_warehouse, current_path, read_current
+
+
+def _publish_run(path, run_ts, scale):
+    """Agrega una corrida a la simulación y reconstruye los marts (una versión nueva)."""
+    sim = pd.DataFrame({
+        "run_ts": run_ts, "campaign_id": [1, 1, 2], "adset_name": ["a", "b", "c"],
+        "product_id": [10, 11, 10],
+        "budget": [100.0 * scale, 50.0, 25.0], "clicks": [10.0, 5.0, 0.0],
+        "conversions": [4.0, 0.0, 1.0], "revenue": [300.0, 0.0, 40.0 * scale],
+        "margin": [90.0, 0.0, 10.0]})
+    con = connect_warehouse(path)
+    con.execute("CREATE TABLE IF NOT EXISTS snapshot_campaigns AS SELECT * FROM "
+                "(VALUES (1, 'C1'), (2, 'C2')) t(campaign_id, campaign_name)")
+    con.execute("CREATE TABLE IF NOT EXISTS snapshot_products AS SELECT * FROM "
+                "(VALUES (10, 'P10'), (11, 'P11')) t(product_id, product_name)")
+    con.execute("CREATE TABLE IF NOT EXISTS snapshot_adset_simulation AS "
+                "SELECT * FROM sim LIMIT 0")
+    con.execute("INSERT INTO snapshot_adset_simulation SELECT * FROM sim")
+    update_run_aggregates(con, SIM_SOURCE, SIM_LEVELS)
+    con.execute("CREATE TABLE IF NOT EXISTS mart.snap_budget_plan "
+                "(run_ts VARCHAR, ad_id BIGINT, new_budget DOUBLE)")
+    con.execute("INSERT INTO mart.snap_budget_plan VALUES (?, 1, 10.0), (?, 2, 30.0)",
+                [run_ts, run_ts])
+    con.close()
+
+
+@pytest.fixture
+def warehouse(tmp_path):
+    path = str(tmp_path / "wh.duckdb")
+    _publish_run(path, "2025-01-01", 1)
+    _publish_run(path, "2025-01-02", 2)
+    return path
+
+
+def _query(path, endpoint, run_ts="all", limit=None):
+    sql, params = kpi_query(endpoint, run_ts, limit)
+    con = duckdb.connect(current_path(path), read_only=True)
+    try:
+        return con.execute(sql, params).fetch_df()
+    finally:
+        con.close()
+
+
+def test_kpi_query(warehouse):
+    total = _query(warehouse, "global").iloc[0]
+    assert total["total_budget"] == 100 + 50 + 25 + 200 + 50 + 25
+    assert total["roas"] == pytest.approx(total["total_revenue"] / total["total_budget"])
+
+    latest = _query(warehouse, "campaign", "latest")
+    assert latest.set_index("campaign_id")["total_budget"].to_dict() == {1: 250.0, 2: 25.0}
+    first = _query(warehouse, "campaign", "2025-01-01")
+    assert first.set_index("campaign_id")["total_revenue"].to_dict() == {1: 300.0, 2: 40.0}
+    # Orden por defecto: ingreso descendente
+    assert _query(warehouse, "product")["product_id"].tolist() == [10, 11]
+    assert len(_query(warehouse, "adset", limit=2)) == 2
+    assert len(_query(warehouse, "adset", limit=0)) == 0
+
+    plan = _query(warehouse, "budget_plan", "latest")
+    assert plan["run_ts"].unique().tolist() == ["2025-01-02"]
+    assert plan["new_budget"].tolist() == [30.0, 10.0]
+    assert len(_query(warehouse, "budget_plan")) == 4
+
+
+def test_cache_invalidated_by_new_version(warehouse):
+    async def scenario():
+        service = KpiService(warehouse, pool_size=2)
+        try:
+            body, headers = await service.kpis("global")
+            assert headers["X-KPI-Cache"] == "miss"
+            _, headers = await service.kpis("global")
+            assert headers["X-KPI-Cache"] == "hit" and len(service.cache) == 1
+            old_file = current_path(warehouse)
+            assert service.pool.open_versions() == [old_file]
+
+            _publish_run(warehouse, "2025-01-03", 3)
+            new_body, headers = await service.kpis("global")
+            assert headers["X-KPI-Cache"] == "miss"
+            assert headers["X-KPI-Run"] == "2025-01-03"
+            assert headers["X-KPI-Version"] == str(read_current(warehouse)["version"])
+            assert json.loads(new_body)[0]["total_budget"] > json.loads(body)[0]["total_budget"]
+            assert len(service.cache) == 1
+            # La conexión a la versión anterior se cerró con la primera consulta nueva
+            assert service.pool.open_versions() == [current_path(warehouse)] != [old_file]
+        finally:
+            service.pool.close()
+
+    asyncio.run(scenario())
+
+
+def test_pool_retires_old_version_when_idle(warehouse):
+    pool = WarehousePool(warehouse, size=2)
+    old_file = current_path(warehouse)
+    with pool.cursor() as old_cur:
+        _publish_run(warehouse, "2025-01-03", 3)
+        with pool.cursor() as cur:
+            assert cur.execute("SELECT max(run_ts) FROM mart.kpi_run_campaign").fetchone() \
+                == ("2025-01-03",)
+        # La versión anterior sigue abierta mientras una consulta la usa
+        assert set(pool.open_versions()) == {old_file, current_path(warehouse)}
+        assert old_cur.execute("SELECT max(run_ts) FROM mart.kpi_run_campaign").fetchone() \
+            == ("2025-01-02",)
+    assert pool.open_versions() == [current_path(warehouse)]
+    pool.close()
+    assert pool.open_versions() == []
+
+
+def test_negative_limit_is_rejected(warehouse):
+    async def scenario():
+        service = KpiService(warehouse)
+        server = await asyncio.start_server(service.handle, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            replies = []
+            for target in ("/kpi/campaign?limit=-1", "/kpi/campaign?limit=1"):
+                reader, writer = await asyncio.open_connection("127.0.0.1", port)
+                writer.write(f"GET {target} HTTP/1.1\r\nConnection: close\r\n\r\n".encode())
+                await writer.drain()
+                replies.append(await reader.read())
+                writer.close()
+            return replies
+        finally:
+            server.close()
+            await server.wait_closed()
+            service.pool.close()
+
+    rejected, ok = asyncio.run(scenario())
+    assert rejected.startswith(b"HTTP/1.1 400") and b"negativo" in rejected
+    assert ok.startswith(b"HTTP/1.1 200")
+    assert len(json.loads(ok.split(b"\r\n\r\n", 1)[1])) == 1
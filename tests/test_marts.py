@@ -0,0 +1,92 @@
+# tests/test_marts.py
+# Los agregados incrementales por corrida (mart.kpi_run_* / mart.kpi_cum_*) deben
+# quedar iguales a una reconstrucción completa desde la simulación.
+import duckdb
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.utils.marts import SIM_LEVELS, SIM_SOURCE, update_run_aggregates
+
+KEYS = {name: keys + attrs for name, (keys, attrs) in SIM_LEVELS.items()}
+
+
+def _simulation(run_ts, seed, adsets=("A1", "A2"), products=(10, 11, 12)):
+    """Filas de adset_simulation de una corrida (campañas 1-2 × adsets × productos)."""
+    rng = np.random.default_rng(seed)
+    rows = [(run_ts, c, f"{c}-{a}", p) for c in (1, 2) for a in adsets for p in products]
+    df = pd.DataFrame(rows, columns=["run_ts", "campaign_id", "adset_name", "product_id"])
+    for m in ["budget", "clicks", "conversions", "revenue", "margin"]:
+        df[m] = rng.integers(0, 1000, len(df)).astype("float64")
+    return df
+
+
+@pytest.fixture
+def con():
+    con = duckdb.connect()
+    con.execute("CREATE TABLE snapshot_campaigns AS "
+                "SELECT * FROM (VALUES (1, 'Campaña 1'), (2, 'Campaña 2')) t(campaign_id, campaign_name)")
+    con.execute("CREATE TABLE snapshot_products AS "
+                "SELECT * FROM (VALUES (10, 'P10'), (11, 'P11'), (12, 'P12'), (13, 'P13')) "
+                "t(product_id, product_name)")
+    sim = pd.concat([_simulation("2025-01-01", 1), _simulation("2025-01-02", 2)])
+    con.execute("CREATE TABLE snapshot_adset_simulation AS SELECT * FROM sim")
+    yield con
+    con.close()
+
+
+def _load_run(con, df):
+    """Upsert de una corrida en el snapshot (como apply_snapshot en modo incremental)."""
+    con.execute("DELETE FROM snapshot_adset_simulation WHERE run_ts IN (SELECT run_ts FROM df)")
+    con.execute("INSERT INTO snapshot_adset_simulation BY NAME SELECT * FROM df")
+
+
+def _marts(con) -> dict:
+    out = {}
+    for name, keys in KEYS.items():
+        for kind, order in (("run", ["run_ts", *keys]), ("cum", keys)):
+            df = con.execute(f"SELECT * FROM mart.kpi_{kind}_{name}").df()
+            out[f"{kind}_{name}"] = df.sort_values(order).reset_index(drop=True)
+    return out
+
+
+def _assert_matches_rebuild(con):
+    incremental = _marts(con)
+    update_run_aggregates(con, SIM_SOURCE, SIM_LEVELS)
+    rebuilt = _marts(con)
+    for table, df in rebuilt.items():
+        pd.testing.assert_frame_equal(incremental[table], df, check_dtype=False,
+                                      obj=f"mart.kpi_{table}")
+
+
+def test_new_run_matches_rebuild(con):
+    update_run_aggregates(con, SIM_SOURCE, SIM_LEVELS)
+    # Corrida nueva con un adset y un producto que no existían
+    _load_run(con, _simulation("2025-01-03", 3, adsets=("A1", "A3"), products=(11, 13)))
+    update_run_aggregates(con, SIM_SOURCE, SIM_LEVELS, runs={"2025-01-03"})
+    _assert_matches_rebuild(con)
+
+
+def test_reprocessed_run_is_not_counted_twice(con):
+    update_run_aggregates(con, SIM_SOURCE, SIM_LEVELS)
+    # La misma corrida vuelve con otros valores y sin uno de los adsets
+    _load_run(con, _simulation("2025-01-02", 20, adsets=("A1",)))
+    update_run_aggregates(con, SIM_SOURCE, SIM_LEVELS, runs={"2025-01-02"})
+    _assert_matches_rebuild(con)
+
+
+def test_removed_run_matches_rebuild(con):
+    update_run_aggregates(con, SIM_SOURCE, SIM_LEVELS)
+    _load_run(con, _simulation("2025-01-03", 3))
+    update_run_aggregates(con, SIM_SOURCE, SIM_LEVELS, runs={"2025-01-03"})
+    con.execute("DELETE FROM snapshot_adset_simulation WHERE run_ts = '2025-01-01'")
+    update_run_aggregates(con, SIM_SOURCE, SIM_LEVELS, runs={"2025-01-01"})
+    _assert_matches_rebuild(con)
+
+
+def test_runs_one_by_one_match_rebuild(con):
+    con.execute("DELETE FROM snapshot_adset_simulation")
+    for i, run_ts in enumerate(["2025-01-01", "2025-01-02", "2025-01-03"]):
+        _load_run(con, _simulation(run_ts, i, products=(10, 11 + i)))
+        update_run_aggregates(con, SIM_SOURCE, SIM_LEVELS, runs={run_ts})
+    _assert_matches_rebuild(con)
@@ -0,0 +1,64 @@
+# tests/test_perf.py
+# Las etapas solo van al JSONL; load_metrics las pasa al warehouse una vez, en una
+# sola versión, y no publica nada si no falta cargar ninguna.
+import builtins
+
+from src.utils import perf
+from src.utils.warehouse import connect_warehouse, read_current
+
+
+def _record(run_id, script, stage="s", status="ok"):
+    return {"run_id": run_id, "script": script, "stage": stage,
+            "started_at": "2026-01-01T00:00:00.000", "finished_at": "2026-01-01T00:00:01.000",
+            "wall_s": 1.0, "cpu_s": 0.5, "rows_in": 1, "rows_out": 1, "bytes_read": 0,
+            "bytes_written": 0, "peak_rss_mb": 10.0, "peak_tracemalloc_mb": None,
+            "status": status, "error": None, "profile_path": None, "extra": None}
+
+
+def test_stage_appends_to_jsonl(tmp_path, monkeypatch):
+    path = str(tmp_path / "m.jsonl")
+    monkeypatch.setattr(perf._append_jsonl, "__defaults__", (path,))
+    with perf.stage("demo", rows_in=3) as m:
+        m["rows_out"] = 2
+    records = perf.read_jsonl(perf.RUN_ID, path)
+    assert [(r["stage"], r["rows_in"], r["rows_out"]) for r in records] == [("demo", 3, 2)]
+
+
+def test_load_metrics_once_per_script_run(tmp_path):
+    jsonl = str(tmp_path / "m.jsonl")
+    warehouse = str(tmp_path / "wh.duckdb")
+    perf._append_jsonl([_record("r1", "step_a"), _record("r1", "step_a", "t"),
+                        _record("r1", "step_b", status="error"), _record("r2", "step_a")], jsonl)
+
+    assert perf.load_metrics(warehouse, run_id="r1", path=jsonl) == 3
+    assert read_current(warehouse)["version"] == 1
+    # Nada nuevo de r1: no se abre el warehouse para escribir
+    assert perf.load_metrics(warehouse, run_id="r1", path=jsonl) == 0
+    assert read_current(warehouse)["version"] == 1
+    # El resto (r2) en una sola versión más
+    assert perf.load_metrics(warehouse, path=jsonl) == 1
+    assert read_current(warehouse)["version"] == 2
+
+    con = connect_warehouse(warehouse, read_only=True)
+    runs = con.execute("SELECT run_id, n_scripts, n_stages, n_errors, status "
+                       "FROM mart.pipeline_runs ORDER BY run_id").fetchall()
+    con.close()
+    assert runs == [("r1", 2, 3, 1, "error"), ("r2", 1, 1, 0, "ok")]
+
+
+def test_peak_rss_without_proc_or_resource(monkeypatch):
+    real_open, real_import = builtins.open, builtins.__import__
+
+    def no_proc(path, *args, **kwargs):
+        if str(path).startswith("/proc/"):
+            raise OSError("sin /proc")
+        return real_open(path, *args, **kwargs)
+
+    def no_resource(name, *args, **kwargs):
+        if name == "resource":
+            raise ImportError("Windows")
+        return real_import(name, *args, **kwargs)
+
+    monkeypatch.setattr(builtins, "open", no_proc)
+    monkeypatch.setattr(builtins, "__import__", no_resource)
+    assert perf.peak_rss_mb() == 0.0
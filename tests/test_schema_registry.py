@@ -0,0 +1,53 @@
+# tests/test_schema_registry.py
+# Tipos del registro: los ids quedan en int64 y los conteos numeric solo bajan a int32
+# cuando todos los valores son enteros y caben; si no, se conserva float64.
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from src.utils.schema_registry import (apply_dtypes, arrow_schema, check_downcast,
+                                       duckdb_casts, to_pandas)
+
+
+def test_ids_keep_int64():
+    schema = arrow_schema("ad_simulation")
+    assert schema.field("ad_id").type == pa.int64()
+    assert schema.field("campaign_id").type == pa.int64()
+    big = 2**40
+    df = apply_dtypes("ad_simulation", pd.DataFrame({"ad_id": [big, 1]}))
+    assert df["ad_id"].dtype == "int64" and df["ad_id"].tolist() == [big, 1]
+
+
+def test_check_downcast():
+    assert check_downcast([0, 1, 2_000_000_000, np.nan], pa.int32())
+    assert not check_downcast([1.5, 2], pa.int32())
+    assert not check_downcast([2**31], pa.int32())
+    assert not check_downcast([-(2**31) - 1], pa.int32())
+
+
+def test_counts_downcast_only_when_exact():
+    exact = apply_dtypes("adset_simulation", pd.DataFrame({"clicks": ["3", "4"]}))
+    assert exact["clicks"].dtype == "int32" and exact["clicks"].tolist() == [3, 4]
+
+    fractional = apply_dtypes("adset_simulation", pd.DataFrame({"clicks": ["3.5", "4"]}))
+    assert fractional["clicks"].dtype == "float64"
+    assert fractional["clicks"].tolist() == [3.5, 4.0]
+
+    huge = apply_dtypes("adset_simulation", pd.DataFrame({"impresions": [3e9, 1]}))
+    assert huge["impresions"].dtype == "float64" and huge["impresions"].iloc[0] == 3e9
+
+    # Capa cruda: cada página guarda el tipo del registro, sin decidir por su contenido
+    raw = apply_dtypes("adset_simulation", pd.DataFrame({"clicks": [3, 4]}), downcast=False)
+    assert raw["clicks"].dtype == "float64"
+
+
+def test_to_pandas_and_casts():
+    table = pa.table({"clicks": pa.array([1.0, 2.0]), "conversions": pa.array([0.5, 1.0]),
+                      "campaign_id": pa.array([2**40, 2], pa.int64())})
+    df = to_pandas("adset_simulation", table)
+    assert df["clicks"].dtype == "int32"
+    assert df["conversions"].dtype == "float64" and df["conversions"].tolist() == [0.5, 1.0]
+    assert df["campaign_id"].dtype == "int64" and df["campaign_id"].iloc[0] == 2**40
+
+    casts = duckdb_casts("adset_simulation", ["campaign_id", "clicks"])
+    assert 'CAST("campaign_id" AS BIGINT)' in casts and 'CAST("clicks" AS DOUBLE)' in casts
@@ -0,0 +1,91 @@
+# tests/test_segmentation.py
+# La segmentación incremental (solo ventas nuevas y productos que cambiaron) debe
+# dejar mart.snap_product_segments igual que un recálculo completo (--full).
+import duckdb
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.utils.segmentation import segment_products
+
+COLUMNS = ["product_id", "sku", "product_name", "sales_frequency", "sales_volume",
+           "total_revenue", "profit_margin_pct", "segment", "last_sale_id"]
+
+
+def _sales(first_id, n, product_ids, seed):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "sale_id": np.arange(first_id, first_id + n),
+        "product_id": rng.choice(product_ids, n),
+        "qty": rng.integers(1, 20, n),
+        "unit_price": rng.uniform(5, 50, n).round(2),
+    })
+
+
+@pytest.fixture
+def con():
+    con = duckdb.connect()
+    rng = np.random.default_rng(0)
+    products = pd.DataFrame({
+        "product_id": np.arange(1, 21),
+        "sku": [f"SKU-{i}" for i in range(1, 21)],
+        "product_name": [f"Producto {i}" for i in range(1, 21)],
+        "sale_price": rng.uniform(10, 60, 20).round(2),
+    })
+    products["unit_cost"] = (products["sale_price"] * rng.uniform(0.3, 0.9, 20)).round(2)
+    sales = _sales(1, 200, np.arange(1, 16), seed=1)  # productos 16-20 sin ventas
+    con.execute("CREATE TABLE snapshot_products AS SELECT * FROM products")
+    con.execute("CREATE TABLE snapshot_sales AS SELECT * FROM sales")
+    yield con
+    con.close()
+
+
+def _segments(con) -> pd.DataFrame:
+    return (con.execute(f"SELECT {', '.join(COLUMNS)} FROM mart.snap_product_segments")
+               .df().sort_values("product_id").reset_index(drop=True))
+
+
+def _assert_matches_full(con):
+    incremental = _segments(con)
+    segment_products(con, full=True)
+    pd.testing.assert_frame_equal(incremental, _segments(con), check_dtype=False)
+
+
+def test_new_sales_match_full(con):
+    segment_products(con)
+    new = _sales(201, 50, np.arange(1, 19), seed=2)
+    con.execute("INSERT INTO snapshot_sales SELECT * FROM new")
+    summary = segment_products(con)
+    assert summary["n_changed"] == new["product_id"].nunique()
+    _assert_matches_full(con)
+
+
+def test_catalog_changes_match_full(con):
+    segment_products(con)
+    # Otro margen, otro nombre, un producto nuevo y uno que sale del catálogo
+    con.execute("UPDATE snapshot_products SET unit_cost = sale_price * 0.2 WHERE product_id = 3")
+    con.execute("UPDATE snapshot_products SET product_name = 'Renombrado' WHERE product_id = 4")
+    con.execute("INSERT INTO snapshot_products VALUES (21, 'SKU-21', 'Producto 21', 30, 10)")
+    con.execute("DELETE FROM snapshot_products WHERE product_id = 5")
+    new = _sales(201, 30, np.array([3, 21]), seed=3)
+    con.execute("INSERT INTO snapshot_sales SELECT * FROM new")
+    segment_products(con)
+    _assert_matches_full(con)
+
+
+def test_no_changes_keeps_segments(con):
+    segment_products(con)
+    before = _segments(con)
+    summary = segment_products(con)
+    assert summary["mode"] == "incremental"
+    assert summary["n_changed"] == 0 and summary["n_resegmented"] == 0
+    pd.testing.assert_frame_equal(before, _segments(con))
+
+
+def test_incremental_batches_match_full(con):
+    con.execute("DELETE FROM snapshot_sales")
+    for i in range(4):
+        batch = _sales(1 + 100 * i, 100, np.arange(1, 21), seed=10 + i)
+        con.execute("INSERT INTO snapshot_sales SELECT * FROM batch")
+        segment_products(con)
+    _assert_matches_full(con)